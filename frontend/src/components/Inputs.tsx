@@ -84,7 +84,7 @@ export default function Inputs() {
           defaultValue={[60]}
           max={200}
           min={20}
-          step={10}
+          step={1}
           onValueChange={(e: number[]) => setSquareMeters(e[0])}
         />
       </div>
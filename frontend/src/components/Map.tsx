@@ -3,6 +3,21 @@ import { useMap } from '@/services/MapContext';
 import { GoogleMap, LoadScript } from '@react-google-maps/api';
 import { useEffect, useRef, useState } from 'react';
 
+// Price for an apartment of the given size. Older data only has the legacy
+// averagePrice{NN}m2 columns, in steps of 10 m2.
+function getAveragePrice(
+  feature: google.maps.Data.Feature,
+  squareMeters: number,
+): number {
+  const averageSquareMeterPrice = feature.getProperty(
+    'averageSquareMeterPrice',
+  ) as number | undefined;
+  if (averageSquareMeterPrice != null) {
+    return averageSquareMeterPrice * squareMeters;
+  }
+  return feature.getProperty('averagePrice' + squareMeters + 'm2') as number;
+}
+
 export default function MapComponent() {
   const {
     maxPrice,
@@ -24,9 +39,7 @@ export default function MapComponent() {
   const [isMapLoaded, setIsMapLoaded] = useState(false);
 
   function setColor({ feature }: { feature: google.maps.Data.Feature }) {
-    const averagePrice = feature.getProperty(
-      'averagePrice' + squareMeters + 'm2',
-    ) as number;
+    const averagePrice = getAveragePrice(feature, squareMeters);
 
     let nearestLocation = null;
     let filtered = false;
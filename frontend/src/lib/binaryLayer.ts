@@ -0,0 +1,176 @@
+import { Feature, GeoJsonData } from '@/lib/types/GeoJsonData';
+import axios from 'axios';
+
+// Reader for binary layers written by scripts/processing/binary_layer.py.
+// All sections are typed-array views into the fetched buffer, nothing is copied.
+
+const MAGIC = 'PCBL';
+const VERSION = 1;
+const HEADER_LENGTH = 12;
+
+type SectionType = 'uint32' | 'int32' | 'float64';
+
+interface Section {
+  offset: number;
+  type: SectionType;
+  length: number;
+}
+
+interface BinaryLayerMetadata {
+  number_of_features: number;
+  scale: number;
+  geometry_types: string[];
+  numeric_columns: { [key: string]: { is_integer: boolean } };
+  properties: { [key: string]: unknown[] };
+  sections: { [name: string]: Section };
+}
+
+export interface BinaryLayer {
+  metadata: BinaryLayerMetadata;
+  featurePartOffsets: Uint32Array;
+  partRingOffsets: Uint32Array;
+  ringPointOffsets: Uint32Array;
+  coordinates: Int32Array;
+  getColumn: (key: string) => Float64Array;
+}
+
+const getSection = (
+  buffer: ArrayBuffer,
+  dataOffset: number,
+  section: Section,
+) => {
+  const byteOffset = dataOffset + section.offset;
+  switch (section.type) {
+    case 'uint32':
+      return new Uint32Array(buffer, byteOffset, section.length);
+    case 'int32':
+      return new Int32Array(buffer, byteOffset, section.length);
+    case 'float64':
+      return new Float64Array(buffer, byteOffset, section.length);
+  }
+};
+
+export const parseBinaryLayer = (buffer: ArrayBuffer): BinaryLayer => {
+  // Read header and metadata
+  const header = new DataView(buffer, 0, HEADER_LENGTH);
+  const magic = new TextDecoder().decode(new Uint8Array(buffer, 0, 4));
+  if (magic !== MAGIC) {
+    throw new Error('Not a binary layer');
+  }
+  const version = header.getUint32(4, true);
+  if (version !== VERSION) {
+    throw new Error(`Unsupported binary layer version ${version}`);
+  }
+  const metadataLength = header.getUint32(8, true);
+  const metadata: BinaryLayerMetadata = JSON.parse(
+    new TextDecoder().decode(
+      new Uint8Array(buffer, HEADER_LENGTH, metadataLength),
+    ),
+  );
+  const dataOffset = HEADER_LENGTH + metadataLength;
+  const { sections } = metadata;
+
+  return {
+    metadata,
+    featurePartOffsets: getSection(
+      buffer,
+      dataOffset,
+      sections.feature_part_offsets,
+    ) as Uint32Array,
+    partRingOffsets: getSection(
+      buffer,
+      dataOffset,
+      sections.part_ring_offsets,
+    ) as Uint32Array,
+    ringPointOffsets: getSection(
+      buffer,
+      dataOffset,
+      sections.ring_point_offsets,
+    ) as Uint32Array,
+    coordinates: getSection(
+      buffer,
+      dataOffset,
+      sections.coordinates,
+    ) as Int32Array,
+    getColumn: (key: string) =>
+      getSection(
+        buffer,
+        dataOffset,
+        sections[`column:${key}`],
+      ) as Float64Array,
+  };
+};
+
+export const getBinaryLayerFeature = (
+  layer: BinaryLayer,
+  index: number,
+): Feature => {
+  const { metadata, featurePartOffsets, partRingOffsets, ringPointOffsets } =
+    layer;
+
+  // Geometry
+  const polygons: number[][][][] = [];
+  for (
+    let part = featurePartOffsets[index];
+    part < featurePartOffsets[index + 1];
+    part++
+  ) {
+    const polygon: number[][][] = [];
+    for (
+      let ring = partRingOffsets[part];
+      ring < partRingOffsets[part + 1];
+      ring++
+    ) {
+      const points: number[][] = [];
+      for (
+        let point = ringPointOffsets[ring];
+        point < ringPointOffsets[ring + 1];
+        point++
+      ) {
+        points.push([
+          layer.coordinates[2 * point] / metadata.scale,
+          layer.coordinates[2 * point + 1] / metadata.scale,
+        ]);
+      }
+      polygon.push(points);
+    }
+    polygons.push(polygon);
+  }
+  const geometryType = metadata.geometry_types[index];
+
+  // Properties
+  const properties: { [key: string]: unknown } = {};
+  for (const [key, values] of Object.entries(metadata.properties)) {
+    properties[key] = values[index];
+  }
+  for (const key of Object.keys(metadata.numeric_columns)) {
+    const value = layer.getColumn(key)[index];
+    properties[key] = Number.isNaN(value) ? null : value; // Null like the Python reader and the JSON layers
+  }
+
+  return {
+    type: 'Feature',
+    geometry: {
+      type: geometryType,
+      coordinates: (geometryType === 'Polygon'
+        ? polygons[0]
+        : polygons) as unknown as number[][][],
+    },
+    properties: properties as unknown as Feature['properties'],
+  };
+};
+
+export const binaryLayerToGeoJson = (layer: BinaryLayer): GeoJsonData => {
+  const features: Feature[] = [];
+  for (let i = 0; i < layer.metadata.number_of_features; i++) {
+    features.push(getBinaryLayerFeature(layer, i));
+  }
+  return { type: 'FeatureCollection', features };
+};
+
+export const fetchBinaryLayer = async (url: string): Promise<BinaryLayer> => {
+  const { data } = await axios.get<ArrayBuffer>(url, {
+    responseType: 'arraybuffer',
+  });
+  return parseBinaryLayer(data);
+};
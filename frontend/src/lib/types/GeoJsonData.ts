@@ -25,4 +25,6 @@ export interface Properties {
   averageSalesTimeInDays: number;
   numberOfEstatesSoldLastQuarter?: number;
   numberOfEstatesSoldLastMonth?: number;
+  // Legacy schema only, use averageSquareMeterPrice * square meters instead
+  [legacyAveragePrice: `averagePrice${number}m2`]: number | undefined;
 }
@@ -0,0 +1,10 @@
+// manifest.json written by scripts/processing/publish_outputs.py
+export interface Manifest {
+  files: { [name: string]: ManifestEntry };
+}
+
+export interface ManifestEntry {
+  sha256: string;
+  size: number;
+  published_at: string;
+}
@@ -1,8 +1,12 @@
+import { binaryLayerToGeoJson, fetchBinaryLayer } from '@/lib/binaryLayer';
 import { Feature, GeoJsonData } from '@/lib/types/GeoJsonData';
 import { CityCenters } from '@/lib/types/cityCenters';
 import { City } from '@/lib/types/cityCenters';
 import { LocationDirectory, PostalCodeEntry } from '@/lib/types/distanceData';
+import { Manifest } from '@/lib/types/manifest';
+import { getBaseUrl } from '@/services/queryClient';
 import { useQuery } from '@tanstack/react-query';
+import axios from 'axios';
 import {
   Context,
   Dispatch,
@@ -57,6 +61,16 @@ export type MapContextType = {
 
 const MapContext: Context<MapContextType> = createContext({} as MapContextType);
 
+// Load a postcodes layer, binary layers are decoded to GeoJSON
+const fetchPostcodes = async (path: string): Promise<GeoJsonData> => {
+  const url = `${getBaseUrl()}/data/${path}`;
+  if (path.endsWith('.bin')) {
+    return binaryLayerToGeoJson(await fetchBinaryLayer(url));
+  }
+  const { data } = await axios.get<GeoJsonData>(url);
+  return data;
+};
+
 export function MapProvider({ children }: { children: React.ReactNode }) {
   const [equity, setEquity] = useState(0);
   const [income, setIncome] = useState(400000);
@@ -75,8 +89,20 @@ export function MapProvider({ children }: { children: React.ReactNode }) {
   >();
   const [city, setCity] = useState<City>('oslo');
 
+  // Use the binary layer only if it is published, there is no manifest until publish_outputs has run
+  const { data: manifest, isFetched: isManifestFetched } = useQuery<Manifest>({
+    queryKey: ['manifest.json'],
+    retry: false,
+  });
+  const binaryLayerPath = `postcodes_binary/postcodes_${city}.bin`;
+  const postcodesPath = manifest?.files?.[binaryLayerPath]
+    ? binaryLayerPath
+    : `postcodes_finalized/postcodes_${city}.json`;
+
   const { data: geoJsonData } = useQuery<GeoJsonData>({
-    queryKey: [`postcodes_finalized/postcodes_${city}.json`],
+    queryKey: [postcodesPath],
+    queryFn: () => fetchPostcodes(postcodesPath),
+    enabled: isManifestFetched,
   });
 
   const { data: distanceData } = useQuery<LocationDirectory>({
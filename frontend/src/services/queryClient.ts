@@ -1,7 +1,7 @@
 import { QueryClient } from '@tanstack/react-query';
 import axios from 'axios';
 
-const getBaseUrl = () => {
+export const getBaseUrl = () => {
   if (process.env.NODE_ENV === 'development') {
     return 'http://localhost:5173';
   } else {
@@ -0,0 +1,102 @@
+import json
+from api.spatial_index import KDTree, get_centroid
+
+
+# Straight-line nearest destinations per category to request for each mode. Transit times follow straight-line distance
+# least, since a farther store on a direct line can be quicker than a nearer one with a transfer.
+CANDIDATES_PER_MODE = {
+    "walking": 3,
+    "bicycling": 3,
+    "transit": 5,
+    "driving": 3,
+}
+
+
+def get_postcode_centroids(geojson_path: str) -> dict:
+    """Get the centroid of each postcode area.
+
+    Args:
+        geojson_path (str): Path to a GeoJSON file with postcode polygons, like postcodes.json.
+
+    Returns:
+        dict: (latitude, longitude) with postcodes as keys, for the postcodes with a geometry.
+    """
+    with open(geojson_path, "r") as file:
+        postcodes_data = json.load(file)
+    return {feature["properties"]["postnummer"]: get_centroid(feature["geometry"]) for feature in postcodes_data["features"] if feature.get("geometry")}
+
+
+def get_destination_coordinates(gmaps, destinations: list, cache=None) -> dict:
+    """Get the coordinates of destinations, geocoding only the ones that are not cached.
+
+    Args:
+        gmaps (googlemaps.Client): Google Maps API client.
+        destinations (list): List of destinations.
+        cache (ElementCache, optional): Cache of coordinates. Defaults to None.
+
+    Returns:
+        dict: (latitude, longitude) with destinations as keys, destinations that could not be geocoded are left out.
+    """
+    coordinates = cache.get_coordinates(destinations) if cache is not None else {}
+    geocoded_coordinates = {}
+    for destination in destinations:
+        if destination in coordinates:
+            continue
+        results = gmaps.geocode(destination)
+        if not results:
+            print(f"Could not geocode {destination}, it is requested for every origin")
+            continue
+        location = results[0]["geometry"]["location"]
+        geocoded_coordinates[destination] = (location["lat"], location["lng"])
+    if cache is not None and geocoded_coordinates:
+        cache.store_coordinates(geocoded_coordinates)
+    coordinates.update(geocoded_coordinates)
+    return coordinates
+
+
+def get_candidate_cells(origin_coordinates: list, destinations: list, destination_coordinates: dict, destinations_metadata: dict, candidates_per_mode: dict = None) -> dict:
+    """Get the cells to request: for each origin and mode, the k straight-line nearest destinations of every category.
+
+    One KD-tree is built per category, so a category with few destinations is not crowded out by a category with many.
+    Destinations without coordinates, and origins without a centroid, keep every cell. Destinations without a category are
+    left out, since get_results stores nothing for them.
+
+    Args:
+        origin_coordinates (list): (latitude, longitude) of each origin, or None if unknown.
+        destinations (list): List of destinations.
+        destination_coordinates (dict): (latitude, longitude) with destinations as keys.
+        destinations_metadata (dict): Dictionary with destination categories as keys, and destination addresses as values.
+        candidates_per_mode (dict, optional): Number of candidates per category with modes as keys. Defaults to CANDIDATES_PER_MODE.
+
+    Returns:
+        dict: Destination indices with origin indices as keys, with modes as keys, for get_request_plan_for_cells.
+    """
+    if candidates_per_mode is None:
+        candidates_per_mode = CANDIDATES_PER_MODE
+    all_destination_indices = list(range(len(destinations)))
+
+    # Build one tree per category, destinations that cannot be placed are kept for every origin
+    trees = []
+    unplaced_destination_indices = {index for index, destination in enumerate(destinations) if destination not in destination_coordinates}
+    destination_index_per_address = {destination: index for index, destination in enumerate(destinations)}
+    for category_destinations in destinations_metadata.values():
+        category_destination_indices = [destination_index_per_address[destination] for destination in category_destinations if destination in destination_index_per_address and destination in destination_coordinates]
+        if category_destination_indices:
+            trees.append((KDTree([destination_coordinates[destinations[index]] for index in category_destination_indices]), category_destination_indices))
+
+    cells_per_mode = {mode: {} for mode in candidates_per_mode}
+    max_candidates = max(candidates_per_mode.values(), default=0)
+    for origin_index, coordinate in enumerate(origin_coordinates):
+        if coordinate is None:
+            for mode in candidates_per_mode:
+                cells_per_mode[mode][origin_index] = all_destination_indices
+            continue
+
+        # Query once with the largest k, nearest first, and take the first k for each mode
+        nearest_per_category = [[category_destination_indices[index] for index in tree.query(coordinate, max_candidates)[1]] for tree, category_destination_indices in trees]
+        for mode, number_of_candidates in candidates_per_mode.items():
+            destination_indices = set(unplaced_destination_indices)
+            for nearest in nearest_per_category:
+                destination_indices.update(nearest[:number_of_candidates])
+            cells_per_mode[mode][origin_index] = sorted(destination_indices)
+    return cells_per_mode
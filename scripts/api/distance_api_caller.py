@@ -1,4 +1,5 @@
 import os
+import sys
 import json
 import math
 import requests
@@ -7,11 +8,33 @@ from tqdm import tqdm
 from datetime import datetime
 from pprint import pprint
 from dotenv import load_dotenv
+
+# Run from scripts/api, where the ../data and ../../frontend paths below resolve, with the packages in scripts/ importable
+SCRIPTS_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SCRIPTS_DIRECTORY not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIRECTORY)
+
+from api.distance_matrix_planner import MODES, NOT_REQUESTED_ELEMENT, get_distance_matrices
+from api.destination_filter import CANDIDATES_PER_MODE, get_postcode_centroids, get_destination_coordinates, get_candidate_cells
+from api.distance_store import DistanceStore
+from api.quota_limiter import QuotaLimiter
+from api.element_cache import ElementCache
+from api.offline_distance_matrix import get_offline_client
+from api.road_graph import RoadGraph
 load_dotenv()
 
 # Load environment variables
 GOOGLE_MAPS_API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")
 
+# Origins per batch appended to the distance store, a multiple of every tile height the planner uses for up to 25 destinations
+ORIGINS_PER_BATCH = 100
+
+# Max Distance Matrix requests in flight, the modes and tiles of a batch do not depend on each other
+MAX_WORKERS = 8
+
+# Age after which cached distance matrix elements are requested again
+ELEMENT_CACHE_TTL_IN_SECONDS = 30 * 24 * 60 * 60
+
 def get_destinations(is_vinmonopolet=False, is_shopping_mall=False):
     """Get destinations for which distances need to be calculated. Destinations can be Vinmonopolet stores, shopping malls, etc.
 
@@ -80,7 +103,7 @@ def get_google_maps_client():
     Returns:
         googlemaps.Client: Google Maps API client.
     """
-    gmaps = googlemaps.Client(key=GOOGLE_MAPS_API_KEY)
+    gmaps = googlemaps.Client(key=GOOGLE_MAPS_API_KEY, retry_over_query_limit=False)        # OVER_QUERY_LIMIT is retried by the planner, which pauses every worker
     return gmaps
 
 # Get postcodes from GeoJSON
@@ -201,6 +224,20 @@ def add_granularity_to_results(results_walking, results_bicycling, results_trans
                 
     return results_walking, results_bicycling, results_transit, results_driving     # Return updated results, remember that dictionaries are mutable in Python, so they are updated when looping through "results_list"
 
+# Check if a cell was left out in every mode
+def is_not_requested(origin_index, destination_index, *results_list):
+    """Check if a cell was left out on purpose in every mode, like a destination that is far from a postcode in a straight line.
+
+    Args:
+        origin_index (int): Origin index.
+        destination_index (int): Destination index.
+        *results_list (dict): Distance matrix results for each mode.
+
+    Returns:
+        bool: True if the cell has status NOT_REQUESTED in every mode.
+    """
+    return all(results["rows"][origin_index]["elements"][destination_index]["status"] == NOT_REQUESTED_ELEMENT["status"] for results in results_list)
+
 # Get results
 def get_results(results_walking, results_bicycling, results_transit, results_driving, destinations_metadata):
     """Get results from distance matrix results with postcodes as keys, and destinations as subkeys.
@@ -233,6 +270,10 @@ def get_results(results_walking, results_bicycling, results_transit, results_dri
         # Store results in destination dictionary
         for destination_index, destination in enumerate(results_walking["destination_addresses"]):
             
+            # Skip destinations that were left out for this postcode by the straight-line pre-filter
+            if is_not_requested(origin_index, destination_index, results_walking, results_bicycling, results_transit, results_driving):
+                continue
+            
             # Get destination address
             destination_address = destination
             
@@ -280,6 +321,10 @@ def get_results(results_walking, results_bicycling, results_transit, results_dri
         # Store results in origin dictionary
         for origin_index, origin in enumerate(results_walking["origin_addresses"]):
             postcode = origin.split(" ")[0]
+            
+            # Skip postcodes that were left out for this destination by the straight-line pre-filter
+            if is_not_requested(origin_index, destination_index, results_walking, results_bicycling, results_transit, results_driving):
+                continue
                 
             # Store results in destination dictionary
             results_destinations_postcodes[destination][postcode] = {}
@@ -320,123 +365,32 @@ def store_results(results, output_path):
         file.write("\n")
     print(f"Stored results with {len(results.keys())} keys to {output_path}")
 
-# Append distance matrix results - Postcodes to Destinations
-def append_results_postcodes_destinations(results_postcodes_destinations, output_path):
-    """Store distance matrix results in JSON format with postcodes as keys, and destinations as subkeys.
-
-    Args:
-        results_postcodes_destinations (dict): Distance matrix results with postcodes as keys, and destinations as subkeys.
-        output_path (str): Output path for storing results.
-        
-    Returns:
-        None
-    """
-    
-    # Create new file if it does not exist
-    if not os.path.exists(output_path):
-        with open(output_path, "w") as file:
-            file.write("{}")
-            file.write("\n")
-        print(f"Created new file at {output_path}")
-    
-    # Load existing results
-    with open(output_path, "r") as file:
-        existing_results = json.load(file)
-        
-    # Update existing results with new results
-    for postcode_extra in results_postcodes_destinations.keys():
-        postcode = postcode_extra.split(" ")[0]
-        if postcode not in existing_results.keys():
-            existing_results[postcode] = results_postcodes_destinations[postcode]
-        
-        for destination in results_postcodes_destinations[postcode].keys():
-            if destination not in existing_results[postcode].keys():
-                existing_results[postcode][destination] = results_postcodes_destinations[postcode][destination]
-    
-    # Update existing results with new results
-    with open(output_path, "w") as file:
-        file.write(json.dumps(existing_results, indent=4))
-        file.write("\n")
-    # print(f"Stored results with {len(results_postcodes_destinations.keys())} keys to {output_path}")
-    
-# Append distance matrix results - Destinations to Postcodes
-def append_results_destinations_postcodes(results_destinations_postcodes, output_path):
-    """Store distance matrix results in JSON format with destinations as keys, and postcodes as subkeys.
-
-    Args:
-        results_destinations_postcodes (dict): Distance matrix results with destinations as keys, and postcodes as subkeys.
-        output_path (str): Output path for storing results.
-        
-    Returns:
-        None
-    """
-    
-    # Create new file if it does not exist
-    if not os.path.exists(output_path):
-        with open(output_path, "w") as file:
-            file.write("{}")
-            file.write("\n")
-        print(f"Created new file at {output_path}")
-    
-    # Load existing results
-    with open(output_path, "r") as file:
-        existing_results = json.load(file)
-        
-    # Update existing results with new results
-    for destination in results_destinations_postcodes.keys():
-        if destination not in existing_results.keys():
-            existing_results[destination] = results_destinations_postcodes[destination]
-        
-        for postcode_extra in results_destinations_postcodes[destination].keys():
-            postcode = postcode_extra.split(" ")[0]
-            if postcode not in existing_results[destination].keys():
-                existing_results[destination][postcode] = results_destinations_postcodes[destination][postcode]
-    
-    # Update existing results with new results
-    with open(output_path, "w") as file:
-        file.write(json.dumps(existing_results, indent=4))
-        file.write("\n")
-    # print(f"Stored results with {len(results_destinations_postcodes.keys())} keys to {output_path}")
-
 # Get and append results - Perform for each batch
-def get_and_append_results(gmaps, origins, destinations, destinations_metadata, is_overwrite=False):
-    """Update JSON files with distances between postcodes and destinations for one batch.
+def get_and_append_results(gmaps, origins, destinations, destinations_metadata, store, max_workers=1, limiter=None, cache=None, cells_per_mode=None, is_estimate=False):
+    """Get distances between postcodes and destinations for one batch, and append them to the store.
 
     Args:
         gmaps (googlemaps.Client): Google Maps API client.
         origins (list): List of origins.
         destinations (list): List of destinations.
-        is_overwrite (bool, optional): Overwrite existing files. Defaults to False.
+        destinations_metadata (dict): Dictionary with destination categories as keys, and destination addresses as values.
+        store (DistanceStore): Store of distance results.
+        max_workers (int, optional): Max requests in flight. Defaults to 1.
+        limiter (QuotaLimiter, optional): Limiter shared by all batches. Defaults to None.
+        cache (ElementCache, optional): Cache of elements, only missing and stale cells are requested. Defaults to None.
+        cells_per_mode (dict, optional): Cells to request per mode, with origin indices of the batch. Defaults to every cell.
+        is_estimate (bool, optional): Results are a local estimate, to be replaced by results from Google. Defaults to False.
     
     Returns:
         None
     """
     
-    # Get distance matrix results
-    results_walking = get_distance_matrix(
-        gmaps=gmaps,
-        origins=origins,
-        destinations=destinations,
-        mode="walking"
-        )
-    results_bicycling = get_distance_matrix(
-        gmaps=gmaps,
-        origins=origins,
-        destinations=destinations,
-        mode="bicycling"
-        )
-    results_transit = get_distance_matrix(
-        gmaps=gmaps,
-        origins=origins,
-        destinations=destinations,
-        mode="transit"
-        )
-    results_driving = get_distance_matrix(
-        gmaps=gmaps,
-        origins=origins,
-        destinations=destinations,
-        mode="driving"
-        )
+    # Get distance matrix results for all modes, tiled into as few requests as the request limits allow
+    matrices = get_distance_matrices(gmaps, origins, destinations, modes=MODES, max_workers=max_workers, limiter=limiter, cache=cache, cells_per_mode=cells_per_mode)
+    results_walking = matrices["walking"]
+    results_bicycling = matrices["bicycling"]
+    results_transit = matrices["transit"]
+    results_driving = matrices["driving"]
     
     # Manually update destination names
     destinations, destinations_metadata = update_destination_names(destinations, destinations_metadata)
@@ -450,7 +404,7 @@ def get_and_append_results(gmaps, origins, destinations, destinations_metadata,
     )
     
     # Get results
-    results_postcodes_destinations, results_destinations_postcodes = get_results(
+    results_postcodes_destinations, _ = get_results(
         results_walking=results_walking,
         results_bicycling=results_bicycling,
         results_transit=results_transit,
@@ -460,36 +414,32 @@ def get_and_append_results(gmaps, origins, destinations, destinations_metadata,
     
     # pprint(results_postcodes_destinations)
     
-    # Store distance matrix results
-    output_path_postcodes_destinations = os.path.join(os.getcwd(), "../../frontend/public/data/distance_postcodes_destinations.json")
-    output_path_destinations_postcodes = os.path.join(os.getcwd(), "../../frontend/public/data/distance_destinations_postcodes.json")
-    # output_path_postcodes_destinations = os.path.join(os.getcwd(), "../../frontend/public/data/distance_postcodes_destinations_extra_points.json")
-    # output_path_destinations_postcodes = os.path.join(os.getcwd(), "../../frontend/public/data/distance_destinations_postcodes_extra_points.json")
-    
-    if is_overwrite:
-        store_results(results_postcodes_destinations, output_path_postcodes_destinations)
-        store_results(results_destinations_postcodes, output_path_destinations_postcodes)
-    else:
-        append_results_postcodes_destinations(results_postcodes_destinations, output_path_postcodes_destinations)
-        append_results_destinations_postcodes(results_destinations_postcodes, output_path_destinations_postcodes)
+    # Append batch to the store, the results with destinations as keys are built from the same rows when exporting
+    store.append(results_postcodes_destinations, is_estimate=is_estimate)
     
     return None
     
 # Main function
-def update_distances(destinations, destinations_metadata, is_overwrite=False):
+def update_distances(destinations, destinations_metadata, is_overwrite=False, gmaps=None, max_workers=MAX_WORKERS, is_cached=True, candidates_per_mode=CANDIDATES_PER_MODE, is_estimate=False):
     """Update JSON files with distances between postcodes and destinations.
 
     Args:
         destinations (list): List of destinations. (ex. ["{postcode}, Norway", {coordinates}] etc.)
         destinations_metadata (dict): Dictionary with destination categories as keys, and destination addresses as values. The dictionary should look like: {"vinmonopolet": {"{address}, {postcode}, Norway": "{destination_name}", ...}, ...}
-        is_overwrite (bool, optional): Overwrite existing files. Defaults to False.
+        is_overwrite (bool, optional): Overwrite existing results instead of keeping them. Defaults to False.
+        gmaps (googlemaps.Client, optional): Google Maps API client, or a stand-in like StubDistanceMatrixClient. Defaults to a client with GOOGLE_MAPS_API_KEY.
+        max_workers (int, optional): Max requests in flight. Defaults to MAX_WORKERS.
+        is_cached (bool, optional): Request only the elements that are missing or stale in the element cache. Defaults to True.
+        candidates_per_mode (dict, optional): Number of straight-line nearest destinations per category to request for each mode. Defaults to CANDIDATES_PER_MODE, None requests every destination.
+        is_estimate (bool, optional): gmaps is a local estimate like OfflineDistanceMatrixClient, so there is no quota or element cache, and the results are replaced by the next run with Google. Defaults to False.
 
     Returns:
         None
     """
     
     # Initialize Google Maps API client
-    gmaps = get_google_maps_client()
+    if gmaps is None:
+        gmaps = get_google_maps_client()
     
     # Get postcodes from GeoJSON
     geojson_path = os.path.join(os.getcwd(), "../../frontend/public/data/postcodes.json")
@@ -498,14 +448,89 @@ def update_distances(destinations, destinations_metadata, is_overwrite=False):
     # Get origins and destinations
     origins = [f"{postcode}, Norway" for postcode in postcodes]
     
-    # Get and append results to avoid exceeding Google Maps API rate limits             # TODO: Max 100 elements per request, max 25 origins OR 25 destinations per request
-    for i in tqdm(range(0, len(origins))):
-        get_and_append_results(gmaps, origins[i], destinations, destinations_metadata, is_overwrite)
+    # Paths of the store, the element cache and the exported results
+    store_path = os.path.join(os.getcwd(), "../data/distance_results.sqlite")
+    cache_path = os.path.join(os.getcwd(), "../data/cache/distance_elements.sqlite")
+    output_path_postcodes_destinations = os.path.join(os.getcwd(), "../../frontend/public/data/distance_postcodes_destinations.json")
+    output_path_destinations_postcodes = os.path.join(os.getcwd(), "../../frontend/public/data/distance_destinations_postcodes.json")
+    # output_path_postcodes_destinations = os.path.join(os.getcwd(), "../../frontend/public/data/distance_postcodes_destinations_extra_points.json")
+    # output_path_destinations_postcodes = os.path.join(os.getcwd(), "../../frontend/public/data/distance_destinations_postcodes_extra_points.json")
+    
+    # One limiter for the whole run, so every batch shares the quota
+    limiter = QuotaLimiter(max_concurrency=max_workers) if not is_estimate else None
+    cache = ElementCache(cache_path, ttl_in_seconds=ELEMENT_CACHE_TTL_IN_SECONDS) if is_cached and not is_estimate else None
+    
+    # Get the straight-line nearest destinations of each postcode, from postcode centroids and geocoded destinations
+    cells_per_mode = None
+    if candidates_per_mode is not None:
+        postcode_centroids = get_postcode_centroids(geojson_path)
+        destination_coordinates = get_destination_coordinates(gmaps, destinations, cache)
+        cells_per_mode = get_candidate_cells([postcode_centroids.get(postcode) for postcode in postcodes], destinations, destination_coordinates, destinations_metadata, candidates_per_mode)
+    
+    with DistanceStore(store_path) as store:
+        
+        # Start from scratch, or from the results of runs before the store existed
+        if is_overwrite:
+            store.clear()
+        elif len(store) == 0:
+            store.import_results(output_path_postcodes_destinations)
+        
+        # Get and append results in batches of origins, each batch is tiled into requests of max 100 elements and max 25 origins and 25 destinations
+        for batch_start in tqdm(range(0, len(origins), ORIGINS_PER_BATCH)):
+            batch_cells_per_mode = {mode: {origin_index - batch_start: cells[origin_index] for origin_index in range(batch_start, min(batch_start + ORIGINS_PER_BATCH, len(origins)))} for mode, cells in cells_per_mode.items()} if cells_per_mode is not None else None
+            get_and_append_results(gmaps, origins[batch_start:batch_start + ORIGINS_PER_BATCH], destinations, destinations_metadata, store, max_workers, limiter, cache, batch_cells_per_mode, is_estimate)
+        
+        # Estimates of cells that Google was not asked for, like destinations left out by the pre-filter, are not kept next to results from Google
+        if not is_estimate:
+            store.remove_estimates()
+        
+        # Build both result shapes in one pass, and store them once
+        results_postcodes_destinations, results_destinations_postcodes = store.get_results()
+    store_results(results_postcodes_destinations, output_path_postcodes_destinations)
+    store_results(results_destinations_postcodes, output_path_destinations_postcodes)
+    
+    if cache is not None:
+        print(f"Element cache: {cache.statistics['hits']} hits, {cache.statistics['misses']} misses, {cache.statistics['stale']} stale ({cache.get_hit_rate():.0%} hit rate), {limiter.statistics['requests']} requests for {limiter.statistics['elements']} elements")
+        cache.close()
     
     # print(f"Done updating distances between {len(origins)} origins and {len(destinations)} destinations!")
     
     return None
 
+# Estimate distances offline
+def estimate_distances(destinations, destinations_metadata, road_graph_path=None, coordinates=None, candidates_per_mode=None):
+    """Update JSON files with estimated distances between postcodes and destinations, without network access or Google quota.
+
+    Destinations are placed by the coordinates cached by earlier runs with Google, or by the centroid of the postcode in their
+    address. Run update_distances afterwards for the results from Google, which replace the estimates.
+
+    Args:
+        destinations (list): List of destinations.
+        destinations_metadata (dict): Dictionary with destination categories as keys, and destination addresses as values.
+        road_graph_path (str, optional): Path to a GeoJSON road extract for shortest path distances. Defaults to None, for straight lines times a detour factor.
+        coordinates (dict, optional): (latitude, longitude) with destinations as keys. Defaults to the coordinates in the element cache.
+        candidates_per_mode (dict, optional): Number of straight-line nearest destinations per category to estimate for each mode. Defaults to None, every destination.
+
+    Returns:
+        None
+    """
+    
+    # Get coordinates of destinations geocoded by earlier runs
+    if coordinates is None:
+        cache_path = os.path.join(os.getcwd(), "../data/cache/distance_elements.sqlite")
+        with ElementCache(cache_path) as cache:
+            coordinates = cache.get_coordinates(destinations)
+    
+    # Initialize offline client
+    geojson_path = os.path.join(os.getcwd(), "../../frontend/public/data/postcodes.json")
+    road_graph = RoadGraph(road_graph_path) if road_graph_path is not None else None
+    gmaps = get_offline_client(geojson_path, coordinates, road_graph)
+    
+    # Update distances, one batch after another since the estimates do not wait for the network
+    update_distances(destinations, destinations_metadata, gmaps=gmaps, max_workers=1, candidates_per_mode=candidates_per_mode, is_estimate=True)
+    
+    return None
+
 def main():
     
     # Get destinations
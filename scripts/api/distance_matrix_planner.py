@@ -0,0 +1,313 @@
+import math
+import random
+from datetime import datetime
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from googlemaps.exceptions import ApiError
+
+
+# Limits of one Distance Matrix request, see https://developers.google.com/maps/documentation/distance-matrix/usage-and-billing
+MAX_ELEMENTS_PER_REQUEST = 100
+MAX_ORIGINS_PER_REQUEST = 25
+MAX_DESTINATIONS_PER_REQUEST = 25
+
+# Travel modes, in the order used by add_granularity_to_results and get_results
+MODES = ["walking", "bicycling", "transit", "driving"]
+
+# Element of cells that were left out on purpose, like destinations that are far from an origin in a straight line
+NOT_REQUESTED_ELEMENT = {"status": "NOT_REQUESTED"}
+
+
+def get_backoff_delay(attempt: int, base_delay_in_seconds: float = 1, max_delay_in_seconds: float = 30) -> float:
+    """Get a jittered exponential backoff delay after OVER_QUERY_LIMIT, between 0 and base_delay_in_seconds * 2 ** attempt."""
+    return random.uniform(0, min(max_delay_in_seconds, base_delay_in_seconds * 2 ** attempt))
+
+
+class MatrixRequest:
+    """One Distance Matrix request: a tile of origins × destinations for one travel mode, as indices into the full grid."""
+
+    def __init__(self, mode: str, origin_indices: list, destination_indices: list) -> None:
+        self.mode = mode
+        self.origin_indices = origin_indices
+        self.destination_indices = destination_indices
+
+    @property
+    def number_of_elements(self) -> int:
+        return len(self.origin_indices) * len(self.destination_indices)
+
+    def __repr__(self) -> str:
+        return f"MatrixRequest({self.mode}, {len(self.origin_indices)} origins × {len(self.destination_indices)} destinations)"
+
+
+def get_tile_shape(number_of_origins: int, number_of_destinations: int, max_elements: int = MAX_ELEMENTS_PER_REQUEST, max_origins: int = MAX_ORIGINS_PER_REQUEST, max_destinations: int = MAX_DESTINATIONS_PER_REQUEST) -> tuple:
+    """Get the tile shape that covers an origins × destinations grid with the fewest requests within the request limits.
+
+    Args:
+        number_of_origins (int): Number of origins.
+        number_of_destinations (int): Number of destinations.
+        max_elements (int, optional): Max origins × destinations per request. Defaults to MAX_ELEMENTS_PER_REQUEST.
+        max_origins (int, optional): Max origins per request. Defaults to MAX_ORIGINS_PER_REQUEST.
+        max_destinations (int, optional): Max destinations per request. Defaults to MAX_DESTINATIONS_PER_REQUEST.
+
+    Returns:
+        tuple: Origins and destinations per tile.
+    """
+    best_shape, best_number_of_requests = None, None
+    for destinations_per_tile in range(1, min(number_of_destinations, max_destinations, max_elements) + 1):
+        origins_per_tile = min(number_of_origins, max_origins, max_elements // destinations_per_tile)
+        number_of_requests = math.ceil(number_of_origins / origins_per_tile) * math.ceil(number_of_destinations / destinations_per_tile)
+        if best_number_of_requests is None or number_of_requests < best_number_of_requests:
+            best_shape, best_number_of_requests = (origins_per_tile, destinations_per_tile), number_of_requests
+    return best_shape
+
+
+def get_tiles(mode: str, origin_indices: list, destination_indices: list, max_elements: int = MAX_ELEMENTS_PER_REQUEST, max_origins: int = MAX_ORIGINS_PER_REQUEST, max_destinations: int = MAX_DESTINATIONS_PER_REQUEST) -> list:
+    """Tile the grid of the given origins × destinations into as few requests for one mode as the request limits allow.
+
+    Args:
+        mode (str): Travel mode.
+        origin_indices (list): Indices of the origins.
+        destination_indices (list): Indices of the destinations.
+        max_elements (int, optional): Max origins × destinations per request. Defaults to MAX_ELEMENTS_PER_REQUEST.
+        max_origins (int, optional): Max origins per request. Defaults to MAX_ORIGINS_PER_REQUEST.
+        max_destinations (int, optional): Max destinations per request. Defaults to MAX_DESTINATIONS_PER_REQUEST.
+
+    Returns:
+        list: List of MatrixRequest.
+    """
+    if len(origin_indices) == 0 or len(destination_indices) == 0:
+        return []
+    origins_per_tile, destinations_per_tile = get_tile_shape(len(origin_indices), len(destination_indices), max_elements, max_origins, max_destinations)
+    return [
+        MatrixRequest(
+            mode=mode,
+            origin_indices=list(origin_indices[origin_start:origin_start + origins_per_tile]),
+            destination_indices=list(destination_indices[destination_start:destination_start + destinations_per_tile]),
+        )
+        for origin_start in range(0, len(origin_indices), origins_per_tile)
+        for destination_start in range(0, len(destination_indices), destinations_per_tile)
+    ]
+
+
+def get_request_plan(number_of_origins: int, number_of_destinations: int, modes: list = None, max_elements: int = MAX_ELEMENTS_PER_REQUEST, max_origins: int = MAX_ORIGINS_PER_REQUEST, max_destinations: int = MAX_DESTINATIONS_PER_REQUEST) -> list:
+    """Tile the origins × destinations × modes grid into as few Distance Matrix requests as the request limits allow.
+
+    Args:
+        number_of_origins (int): Number of origins.
+        number_of_destinations (int): Number of destinations.
+        modes (list, optional): Travel modes. Defaults to MODES.
+        max_elements (int, optional): Max origins × destinations per request. Defaults to MAX_ELEMENTS_PER_REQUEST.
+        max_origins (int, optional): Max origins per request. Defaults to MAX_ORIGINS_PER_REQUEST.
+        max_destinations (int, optional): Max destinations per request. Defaults to MAX_DESTINATIONS_PER_REQUEST.
+
+    Returns:
+        list: List of MatrixRequest, covering every cell of the grid exactly once per mode.
+    """
+    if modes is None:
+        modes = MODES
+    plan = []
+    for mode in modes:
+        plan += get_tiles(mode, list(range(number_of_origins)), list(range(number_of_destinations)), max_elements, max_origins, max_destinations)
+    return plan
+
+
+def get_request_plan_for_cells(cells_per_mode: dict, max_elements: int = MAX_ELEMENTS_PER_REQUEST, max_origins: int = MAX_ORIGINS_PER_REQUEST, max_destinations: int = MAX_DESTINATIONS_PER_REQUEST) -> list:
+    """Plan requests for only some cells of the grid, like the cells that are missing or stale in the element cache.
+
+    Origins that need the same destinations are grouped and tiled together, so the common cases stay as full as a full grid:
+    a new destination needs one column for every origin, and a new postcode needs one row with every destination.
+
+    Args:
+        cells_per_mode (dict): Destination indices with origin indices as keys, with modes as keys. (ex. {"walking": {0: [3, 4], ...}, ...})
+        max_elements (int, optional): Max origins × destinations per request. Defaults to MAX_ELEMENTS_PER_REQUEST.
+        max_origins (int, optional): Max origins per request. Defaults to MAX_ORIGINS_PER_REQUEST.
+        max_destinations (int, optional): Max destinations per request. Defaults to MAX_DESTINATIONS_PER_REQUEST.
+
+    Returns:
+        list: List of MatrixRequest, covering every given cell exactly once.
+    """
+    plan = []
+    for mode, cells in cells_per_mode.items():
+        origins_per_destinations = {}
+        for origin_index, destination_indices in cells.items():
+            if destination_indices:
+                origins_per_destinations.setdefault(tuple(sorted(destination_indices)), []).append(origin_index)
+        for destination_indices, origin_indices in origins_per_destinations.items():
+            plan += get_tiles(mode, sorted(origin_indices), list(destination_indices), max_elements, max_origins, max_destinations)
+    return plan
+
+
+def fill_not_requested(matrices: dict) -> dict:
+    """Set every cell that was not filled to NOT_REQUESTED_ELEMENT, which add_granularity_to_results skips like ZERO_RESULTS."""
+    for matrix in matrices.values():
+        for row in matrix["rows"]:
+            row["elements"] = [element if element is not None else dict(NOT_REQUESTED_ELEMENT) for element in row["elements"]]
+    return matrices
+
+
+def get_empty_matrix(origins: list, destinations: list) -> dict:
+    """Get a distance matrix in the shape returned by the Google Maps API, with the input addresses and no elements yet."""
+    return {
+        "destination_addresses": list(destinations),
+        "origin_addresses": list(origins),
+        "rows": [{"elements": [None] * len(destinations)} for _ in origins],
+        "status": "OK",
+    }
+
+
+def merge_tile(matrix: dict, request: MatrixRequest, results: dict) -> None:
+    """Put the elements and addresses of one tile response into the full matrix of its mode.
+
+    Args:
+        matrix (dict): Full distance matrix, as returned by get_empty_matrix.
+        request (MatrixRequest): Request of the tile.
+        results (dict): Distance matrix response for the tile.
+
+    Returns:
+        None
+    """
+    for row_index, origin_index in enumerate(request.origin_indices):
+        matrix["origin_addresses"][origin_index] = results["origin_addresses"][row_index]          # Formatted addresses, like "0274 Oslo, Norway", which get_results reads the postcode from
+        elements = results["rows"][row_index]["elements"]
+        for column_index, destination_index in enumerate(request.destination_indices):
+            matrix["rows"][origin_index]["elements"][destination_index] = elements[column_index]
+    for column_index, destination_index in enumerate(request.destination_indices):
+        matrix["destination_addresses"][destination_index] = results["destination_addresses"][column_index]
+    return None
+
+
+def fetch_tile(gmaps, origins: list, destinations: list, request: MatrixRequest, departure_time: datetime, limiter=None, max_retries: int = 5) -> dict:
+    """Request one tile, within the quota of the limiter, and retry with backoff when Google answers OVER_QUERY_LIMIT.
+
+    Args:
+        gmaps (googlemaps.Client): Google Maps API client.
+        origins (list): List of origins.
+        destinations (list): List of destinations.
+        request (MatrixRequest): Request of the tile.
+        departure_time (datetime): Departure time.
+        limiter (QuotaLimiter, optional): Limiter shared by all workers. Defaults to None, for no limits.
+        max_retries (int, optional): Max retries after OVER_QUERY_LIMIT. Defaults to 5.
+
+    Returns:
+        dict: Distance matrix response for the tile.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            with limiter.limit(request.number_of_elements) if limiter is not None else nullcontext():
+                results = gmaps.distance_matrix(
+                    origins=[origins[i] for i in request.origin_indices],
+                    destinations=[destinations[i] for i in request.destination_indices],
+                    mode=request.mode,
+                    units="metric",
+                    departure_time=departure_time
+                    )
+            if limiter is not None:
+                limiter.record_success()
+            return results
+        except ApiError as error:
+            if error.status != "OVER_QUERY_LIMIT" or limiter is None or attempt == max_retries:
+                raise
+            limiter.record_throttled(get_backoff_delay(attempt))         # Pauses every worker, not only this one
+            limiter.record_retry()
+
+
+def run_request_plan(gmaps, origins: list, destinations: list, plan: list, departure_time: datetime = None, max_workers: int = 1, limiter=None, matrices: dict = None) -> dict:
+    """Run the requests of a plan and put the tile responses back together into one full matrix per mode.
+
+    With max_workers above 1, the requests of all modes and tiles are sent from a thread pool, since they do not depend on each other.
+
+    Args:
+        gmaps (googlemaps.Client): Google Maps API client, or any client with the same distance_matrix method.
+        origins (list): List of origins.
+        destinations (list): List of destinations.
+        plan (list): List of MatrixRequest, as returned by get_request_plan.
+        departure_time (datetime, optional): Departure time of every request, so all tiles share one traffic snapshot. Defaults to now.
+        max_workers (int, optional): Max requests in flight. Defaults to 1, for one request after another.
+        limiter (QuotaLimiter, optional): Limiter shared by all workers, and by runs of other batches. Defaults to None.
+        matrices (dict, optional): Matrices to fill, with modes as keys, like matrices with cached elements. Defaults to empty matrices.
+
+    Returns:
+        dict: Distance matrix results with modes as keys, in the shape returned by the Google Maps API for the full grid.
+    """
+    if departure_time is None:
+        departure_time = datetime.now()
+    if matrices is None:
+        matrices = {}
+    for request in plan:
+        if request.mode not in matrices:
+            matrices[request.mode] = get_empty_matrix(origins, destinations)
+
+    # One request after another
+    if max_workers <= 1:
+        for request in plan:
+            merge_tile(matrices[request.mode], request, fetch_tile(gmaps, origins, destinations, request, departure_time, limiter))
+        return matrices
+
+    # Requests from a bounded thread pool, tiles are merged in this thread as they complete
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = {executor.submit(fetch_tile, gmaps, origins, destinations, request, departure_time, limiter): request for request in plan}
+        for future in as_completed(futures):
+            request = futures[future]
+            merge_tile(matrices[request.mode], request, future.result())
+    finally:
+        executor.shutdown(cancel_futures=True)              # Drop queued requests if a tile failed
+    return matrices
+
+
+def get_distance_matrices(gmaps, origins: list, destinations: list, modes: list = None, departure_time: datetime = None, max_workers: int = 1, limiter=None, cache=None, cells_per_mode: dict = None) -> dict:
+    """Get full distance matrices for every mode with as few requests as possible.
+
+    With a cache, only the cells that are missing or stale in the cache are requested, and the new elements are stored in it.
+    With cells_per_mode, only those cells are filled, and every other cell gets the element NOT_REQUESTED_ELEMENT.
+
+    Args:
+        gmaps (googlemaps.Client): Google Maps API client.
+        origins (list): List of origins.
+        destinations (list): List of destinations.
+        modes (list, optional): Travel modes. Defaults to MODES.
+        departure_time (datetime, optional): Departure time. Defaults to now.
+        max_workers (int, optional): Max requests in flight. Defaults to 1.
+        limiter (QuotaLimiter, optional): Limiter shared by all workers. Defaults to None.
+        cache (ElementCache, optional): Cache of elements. Defaults to None.
+        cells_per_mode (dict, optional): Destination indices with origin indices as keys, with modes as keys, like the candidates from get_candidate_cells. Defaults to every cell.
+
+    Returns:
+        dict: Distance matrix results with modes as keys.
+    """
+    if modes is None:
+        modes = MODES
+    if departure_time is None:
+        departure_time = datetime.now()
+    if cache is None and cells_per_mode is None:
+        plan = get_request_plan(len(origins), len(destinations), modes)
+        return run_request_plan(gmaps, origins, destinations, plan, departure_time, max_workers, limiter)
+    if cache is None:
+        matrices = {mode: get_empty_matrix(origins, destinations) for mode in modes}
+        run_request_plan(gmaps, origins, destinations, get_request_plan_for_cells({mode: cells_per_mode.get(mode, {}) for mode in modes}), departure_time, max_workers, limiter, matrices)
+        return fill_not_requested(matrices)
+
+    # Fill matrices with cached elements and addresses, and plan requests for the rest
+    formatted_addresses = cache.get_formatted_addresses(origins + destinations)
+    matrices = {}
+    missing_cells_per_mode = {}
+    for mode in modes:
+        matrices[mode] = get_empty_matrix([formatted_addresses.get(origin, origin) for origin in origins], [formatted_addresses.get(destination, destination) for destination in destinations])
+        wanted_cells = cells_per_mode.get(mode, {}) if cells_per_mode is not None else {origin_index: range(len(destinations)) for origin_index in range(len(origins))}
+        cached_elements = cache.get_elements(origins, destinations, mode, departure_time, wanted_cells if cells_per_mode is not None else None)
+        for (origin_index, destination_index), element in cached_elements.items():
+            matrices[mode]["rows"][origin_index]["elements"][destination_index] = element
+        missing_cells_per_mode[mode] = {origin_index: [destination_index for destination_index in destination_indices if (origin_index, destination_index) not in cached_elements] for origin_index, destination_indices in wanted_cells.items()}
+    plan = get_request_plan_for_cells(missing_cells_per_mode)
+    run_request_plan(gmaps, origins, destinations, plan, departure_time, max_workers, limiter, matrices)
+
+    # Store requested elements and the formatted addresses of their origins and destinations
+    requested_formatted_addresses = {}
+    for mode in modes:
+        requests = [request for request in plan if request.mode == mode]
+        cache.store_elements([(origins[origin_index], destinations[destination_index], matrices[mode]["rows"][origin_index]["elements"][destination_index]) for request in requests for origin_index in request.origin_indices for destination_index in request.destination_indices], mode, departure_time)
+        for request in requests:
+            requested_formatted_addresses.update({origins[origin_index]: matrices[mode]["origin_addresses"][origin_index] for origin_index in request.origin_indices})
+            requested_formatted_addresses.update({destinations[destination_index]: matrices[mode]["destination_addresses"][destination_index] for destination_index in request.destination_indices})
+    cache.store_formatted_addresses(requested_formatted_addresses)
+    return fill_not_requested(matrices) if cells_per_mode is not None else matrices
@@ -0,0 +1,367 @@
+import os
+import re
+import sys
+import json
+import math
+import random
+import hashlib
+import threading
+from collections import deque
+from time import sleep, monotonic, perf_counter
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import googlemaps
+from googlemaps.exceptions import ApiError
+
+# Run from scripts/ with python -m api.distance_matrix_stub, or from scripts/api like the distance API caller
+SCRIPTS_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SCRIPTS_DIRECTORY not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIRECTORY)
+
+from api.distance_matrix_planner import MAX_ELEMENTS_PER_REQUEST, MAX_ORIGINS_PER_REQUEST, MAX_DESTINATIONS_PER_REQUEST, MODES, get_request_plan, run_request_plan, get_distance_matrices
+from api.destination_filter import get_destination_coordinates, get_candidate_cells
+from api.quota_limiter import QuotaLimiter
+from api.element_cache import normalize_address
+from api.spatial_index import get_haversine_distance
+
+
+# Any key that passes the format check of googlemaps.Client
+STUB_API_KEY = "AIzaStubKeyForTheLocalDistanceMatrixServer"
+
+# Average speeds of the stub in meters per second
+STUB_SPEEDS = {
+    "walking": 1.4,
+    "bicycling": 4.5,
+    "transit": 7.0,
+    "driving": 11.0,
+}
+
+
+class StubDistanceMatrixClient:
+    """Local stand-in for googlemaps.Client.distance_matrix and geocode, with deterministic results and the same request limits as Google.
+
+    Addresses get stub coordinates around Oslo, and elements follow the straight-line distance between them with a detour.
+
+    Every (origin, destination, mode) cell gets the same element however the request is tiled, so results from different
+    request plans can be compared cell by cell.
+
+    Usage:
+        gmaps = StubDistanceMatrixClient()
+        results = gmaps.distance_matrix(origins=["0274, Norway"], destinations=["7030, Norway"], mode="driving")
+        print(gmaps.number_of_requests, gmaps.number_of_elements)
+    """
+
+    def __init__(self, zero_results_rate: float = 0.02, max_elements: int = MAX_ELEMENTS_PER_REQUEST, max_origins: int = MAX_ORIGINS_PER_REQUEST, max_destinations: int = MAX_DESTINATIONS_PER_REQUEST) -> None:
+        self.zero_results_rate = zero_results_rate
+        self.max_elements = max_elements
+        self.max_origins = max_origins
+        self.max_destinations = max_destinations
+        self.number_of_requests = 0
+        self.number_of_elements = 0
+        self.number_of_geocodes = 0
+        self.lock = threading.Lock()
+
+    def get_formatted_address(self, address: str) -> str:
+        """Format an address like Google, so "0274, Norway" is returned as "0274 Oslo, Norway"."""
+        return re.sub(r"^(\d{4}), ", r"\1 Oslo, ", address)
+
+    def get_element(self, origin: str, destination: str, mode: str) -> dict:
+        seed = int.from_bytes(hashlib.sha256(f"{origin}|{destination}".encode()).digest()[:8], "big")
+        if (seed % 10000) / 10000 < self.zero_results_rate:
+            return {"status": "ZERO_RESULTS"}
+        meters = round(get_haversine_distance(*self.get_coordinates(origin), *self.get_coordinates(destination)) * (1.2 + (seed // 10000 % 300) / 1000)) + 100         # Straight line with a detour of 20-50 %
+        seconds = math.ceil(meters / STUB_SPEEDS[mode])
+        return {
+            "distance": {"text": f"{meters / 1000:.1f} km", "value": meters},
+            "duration": {"text": f"{seconds // 60} mins", "value": seconds},
+            "status": "OK",
+        }
+
+    def get_coordinates(self, address: str) -> tuple:
+        """Get stub coordinates for an address, spread over Oslo and deterministic like the elements."""
+        seed = int.from_bytes(hashlib.sha256(normalize_address(address).encode()).digest()[:8], "big")
+        return 59.85 + (seed % 1000) / 1000 * 0.15, 10.6 + (seed // 1000 % 1000) / 1000 * 0.35
+
+    def geocode(self, address: str, **kwargs) -> list:
+        with self.lock:
+            self.number_of_geocodes += 1
+        latitude, longitude = self.get_coordinates(address)
+        return [{"formatted_address": self.get_formatted_address(address), "geometry": {"location": {"lat": latitude, "lng": longitude}}}]
+
+    def distance_matrix(self, origins, destinations, mode="driving", units=None, departure_time=None, **kwargs) -> dict:
+        origins = [origins] if isinstance(origins, str) else list(origins)
+        destinations = [destinations] if isinstance(destinations, str) else list(destinations)
+        if mode not in STUB_SPEEDS:
+            raise ValueError("Invalid travel mode.")
+        if len(origins) > self.max_origins or len(destinations) > self.max_destinations:
+            raise ApiError("MAX_DIMENSIONS_EXCEEDED")
+        if len(origins) * len(destinations) > self.max_elements:
+            raise ApiError("MAX_ELEMENTS_EXCEEDED")
+        with self.lock:
+            self.number_of_requests += 1
+            self.number_of_elements += len(origins) * len(destinations)
+        return {
+            "destination_addresses": [self.get_formatted_address(destination) for destination in destinations],
+            "origin_addresses": [self.get_formatted_address(origin) for origin in origins],
+            "rows": [{"elements": [self.get_element(origin, destination, mode) for destination in destinations]} for origin in origins],
+            "status": "OK",
+        }
+
+
+class StubDistanceMatrixRequestHandler(BaseHTTPRequestHandler):
+    """Serves /maps/api/distancematrix/json and /maps/api/geocode/json like Google, with results from StubDistanceMatrixClient."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        stub = self.server.stub
+        url = urlparse(self.path)
+        parameters = parse_qs(url.query)
+        if url.path == "/maps/api/geocode/json":
+            stub.wait()
+            self.send_json(200, {"results": stub.client.geocode(parameters.get("address", [""])[0]), "status": "OK"})
+            return None
+        if url.path != "/maps/api/distancematrix/json":
+            self.send_json(404, {"status": "NOT_FOUND"})
+            return None
+        origins = parameters.get("origins", [""])[0].split("|")
+        destinations = parameters.get("destinations", [""])[0].split("|")
+        mode = parameters.get("mode", ["driving"])[0]
+        stub.wait()
+        self.send_json(200, stub.get_body(origins, destinations, mode))
+        return None
+
+    def send_json(self, status_code: int, data: dict) -> None:
+        body = json.dumps(data).encode()
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        return None
+
+    def log_message(self, format: str, *args) -> None:
+        return None
+
+
+class StubDistanceMatrixServer:
+    """Local stand-in for the Distance Matrix endpoint, for googlemaps.Client(key=STUB_API_KEY, base_url=server.base_url).
+
+    Each response is delayed by latency ± jitter, and requests above max_elements_per_second within the last second
+    get OVER_QUERY_LIMIT, like the element quota of the real endpoint.
+
+    Usage:
+        with StubDistanceMatrixServer(latency_in_seconds=0.2) as server:
+            gmaps = googlemaps.Client(key=STUB_API_KEY, base_url=server.base_url, retry_over_query_limit=False)
+            update_distances(destinations, destinations_metadata, gmaps=gmaps)
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_in_seconds: float = 0.2, jitter_in_seconds: float = 0.05, max_elements_per_second: int = None, seed: int = None) -> None:
+        self.latency_in_seconds = latency_in_seconds
+        self.jitter_in_seconds = jitter_in_seconds
+        self.max_elements_per_second = max_elements_per_second
+        self.client = StubDistanceMatrixClient()
+        self.random = random.Random(seed)
+        self.recent_elements = deque()             # (time, number of elements) of the requests in the last second
+        self.lock = threading.Lock()
+        self.thread = None
+
+        self.server = ThreadingHTTPServer((host, port), StubDistanceMatrixRequestHandler)
+        self.server.daemon_threads = True
+        self.server.stub = self
+        self.base_url = f"http://{host}:{self.server.server_address[1]}"
+
+        # Statistics
+        self.statistics = {
+            "requests": 0,
+            "elements": 0,
+            "over_query_limit": 0,
+            "max_in_flight": 0,
+        }
+        self.in_flight = 0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+    def start(self) -> None:
+        """Serve in a background thread."""
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return None
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        if self.thread is not None:
+            self.thread.join()
+        return None
+
+    def wait(self) -> None:
+        """Wait for the configured latency with jitter, counting the requests in flight meanwhile."""
+        with self.lock:
+            delay = self.latency_in_seconds + self.random.uniform(-self.jitter_in_seconds, self.jitter_in_seconds)
+            self.in_flight += 1
+            self.statistics["max_in_flight"] = max(self.statistics["max_in_flight"], self.in_flight)
+        if delay > 0:
+            sleep(delay)
+        with self.lock:
+            self.in_flight -= 1
+        return None
+
+    def get_body(self, origins: list, destinations: list, mode: str) -> dict:
+        """Get the response body for a request, or an error status like the real endpoint."""
+        number_of_elements = len(origins) * len(destinations)
+        with self.lock:
+            self.statistics["requests"] += 1
+            if self.max_elements_per_second is not None:
+                now = monotonic()
+                while self.recent_elements and self.recent_elements[0][0] <= now - 1:
+                    self.recent_elements.popleft()
+                if sum(elements for _, elements in self.recent_elements) + number_of_elements > self.max_elements_per_second:
+                    self.statistics["over_query_limit"] += 1
+                    return {"status": "OVER_QUERY_LIMIT", "error_message": "You have exceeded your rate-limit for this API."}
+                self.recent_elements.append((now, number_of_elements))
+            try:
+                body = self.client.distance_matrix(origins=origins, destinations=destinations, mode=mode)
+            except (ApiError, ValueError) as error:
+                return {"status": getattr(error, "status", "INVALID_REQUEST"), "error_message": str(error)}
+            self.statistics["elements"] += number_of_elements
+        return body
+
+
+def check_planner(number_of_origins: int = 500, number_of_destinations: int = 10, modes: list = None) -> dict:
+    """Compare the request plan with one request per origin and mode, on the stub client.
+
+    Args:
+        number_of_origins (int, optional): Number of origins. Defaults to 500.
+        number_of_destinations (int, optional): Number of destinations. Defaults to 10.
+        modes (list, optional): Travel modes. Defaults to MODES.
+
+    Returns:
+        dict: Requests per origin and with the plan, and the number of cells that differ between the two.
+    """
+    if modes is None:
+        modes = MODES
+    origins = [f"{i:04d}, Norway" for i in range(number_of_origins)]
+    destinations = [f"Stub gate {i}, 0{150 + i} Oslo, Norway" for i in range(number_of_destinations)]
+
+    # One request per origin and mode, like get_and_append_results for origins[i]
+    per_origin_client = StubDistanceMatrixClient()
+    per_origin_rows = {mode: [per_origin_client.distance_matrix(origins=origin, destinations=destinations, mode=mode)["rows"][0] for origin in origins] for mode in modes}
+
+    # Planned requests
+    planned_client = StubDistanceMatrixClient()
+    matrices = run_request_plan(planned_client, origins, destinations, get_request_plan(number_of_origins, number_of_destinations, modes))
+
+    mismatches = sum(
+        per_origin_rows[mode][origin_index]["elements"][destination_index] != matrices[mode]["rows"][origin_index]["elements"][destination_index]
+        for mode in modes for origin_index in range(number_of_origins) for destination_index in range(number_of_destinations)
+    )
+    return {
+        "cells": number_of_origins * number_of_destinations * len(modes),
+        "per_origin_requests": per_origin_client.number_of_requests,
+        "planned_requests": planned_client.number_of_requests,
+        "mismatches": mismatches,
+    }
+
+
+def check_concurrency(number_of_origins: int = 100, number_of_destinations: int = 10, max_workers: int = 8, latency_in_seconds: float = 0.2, max_elements_per_second: int = None) -> dict:
+    """Time one batch with one request after another and from a thread pool, against the local stand-in server.
+
+    Args:
+        number_of_origins (int, optional): Number of origins in the batch. Defaults to 100.
+        number_of_destinations (int, optional): Number of destinations. Defaults to 10.
+        max_workers (int, optional): Max requests in flight in the concurrent run. Defaults to 8.
+        latency_in_seconds (float, optional): Latency of the server. Defaults to 0.2.
+        max_elements_per_second (int, optional): Element quota of the server. Defaults to None, for no quota.
+
+    Returns:
+        dict: Seconds of both runs, the number of cells that differ between them, and the statistics of the server and the limiter.
+    """
+    origins = [f"{i:04d}, Norway" for i in range(number_of_origins)]
+    destinations = [f"Stub gate {i}, 0{150 + i} Oslo, Norway" for i in range(number_of_destinations)]
+    plan = get_request_plan(number_of_origins, number_of_destinations)
+    with StubDistanceMatrixServer(latency_in_seconds=latency_in_seconds, max_elements_per_second=max_elements_per_second, seed=0) as server:
+        gmaps = googlemaps.Client(key=STUB_API_KEY, base_url=server.base_url, retry_over_query_limit=False, queries_per_second=1000)
+        seconds = {}
+        matrices = {}
+        limiter = None
+        for workers in [1, max_workers]:
+            limiter = QuotaLimiter(max_concurrency=workers, elements_per_second=max_elements_per_second or 1000000)
+            start = perf_counter()
+            matrices[workers] = run_request_plan(gmaps, origins, destinations, plan, max_workers=workers, limiter=limiter)
+            seconds[workers] = perf_counter() - start
+    mismatches = sum(
+        matrices[1][mode]["rows"][origin_index]["elements"] != matrices[max_workers][mode]["rows"][origin_index]["elements"]
+        for mode in MODES for origin_index in range(number_of_origins)
+    )
+    return {
+        "requests": len(plan),
+        "sequential_seconds": seconds[1],
+        "concurrent_seconds": seconds[max_workers],
+        "mismatched_rows": mismatches,
+        "server_statistics": server.statistics,
+        "limiter_statistics": limiter.statistics,
+    }
+
+
+def check_prefilter(number_of_origins: int = 300, number_of_destinations: int = 60) -> dict:
+    """Compare the nearest destination per category by walking time, with every cell requested and with the straight-line pre-filter.
+
+    Args:
+        number_of_origins (int, optional): Number of origins. Defaults to 300.
+        number_of_destinations (int, optional): Number of destinations, every second is in category a, and every third in category b. Defaults to 60.
+
+    Returns:
+        dict: Elements requested for every cell and with the pre-filter, and the number of origins and categories with a different nearest destination.
+    """
+    origins = [f"{i:04d}, Norway" for i in range(number_of_origins)]
+    destinations = [f"Stub gate {i}, 0{150 + i} Oslo, Norway" for i in range(number_of_destinations)]
+    destinations_metadata = {
+        "a": {destination: f"A {i}" for i, destination in enumerate(destinations) if i % 2 == 0},
+        "b": {destination: f"B {i}" for i, destination in enumerate(destinations) if i % 3 == 0},
+    }
+
+    full_client = StubDistanceMatrixClient()
+    full_matrices = get_distance_matrices(full_client, origins, destinations)
+
+    # Origins are placed where the stub puts them, like postcode centroids
+    filtered_client = StubDistanceMatrixClient()
+    origin_coordinates = [filtered_client.get_coordinates(origin) for origin in origins]
+    destination_coordinates = get_destination_coordinates(filtered_client, destinations)
+    cells_per_mode = get_candidate_cells(origin_coordinates, destinations, destination_coordinates, destinations_metadata)
+    filtered_matrices = get_distance_matrices(filtered_client, origins, destinations, cells_per_mode=cells_per_mode)
+
+    def get_nearest(matrices, origin_index, category_destinations):
+        elements = matrices["walking"]["rows"][origin_index]["elements"]
+        walking_seconds = [(elements[index]["duration"]["value"], index) for index, destination in enumerate(destinations) if destination in category_destinations and elements[index]["status"] == "OK"]
+        return min(walking_seconds, default=None)
+
+    mismatches = sum(
+        get_nearest(full_matrices, origin_index, category_destinations) != get_nearest(filtered_matrices, origin_index, category_destinations)
+        for origin_index in range(number_of_origins) for category_destinations in destinations_metadata.values()
+    )
+    return {
+        "full_elements": full_client.number_of_elements,
+        "filtered_elements": filtered_client.number_of_elements,
+        "mismatches": mismatches,
+    }
+
+
+def main():
+    for number_of_destinations in [5, 10, 25]:
+        report = check_planner(number_of_destinations=number_of_destinations)
+        print(f"{report['cells']} cells with {number_of_destinations} destinations: {report['per_origin_requests']} requests per origin, {report['planned_requests']} planned requests ({report['per_origin_requests'] / report['planned_requests']:.1f}x fewer), {report['mismatches']} mismatches")
+    report = check_prefilter()
+    print(f"Pre-filter: {report['full_elements']} elements for every cell, {report['filtered_elements']} elements for the straight-line nearest ({report['full_elements'] / report['filtered_elements']:.1f}x fewer), {report['mismatches']} different nearest destinations by walking")
+    report = check_concurrency()
+    print(f"Batch of {report['requests']} requests against the local server: {report['sequential_seconds']:.2f} s one after another, {report['concurrent_seconds']:.2f} s from a thread pool ({report['sequential_seconds'] / report['concurrent_seconds']:.1f}x faster), {report['mismatched_rows']} mismatched rows")
+
+
+if __name__ == "__main__":
+    main()
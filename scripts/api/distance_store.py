@@ -0,0 +1,109 @@
+import os
+import json
+import sqlite3
+
+
+class DistanceStore:
+    """Append-only store of distance results, one row per postcode and destination, indexed by both.
+
+    Each batch from get_results is written once in one transaction, instead of reloading and rewriting the result JSON files
+    for every batch. Both result shapes are built in a single pass over the store with get_results, and written once at the end.
+    Rows for other postcodes and destinations are kept, like the JSON append functions did, unless the store is cleared first.
+    A row that is appended again is replaced in place when its value changed, so cells refreshed from Google after the element
+    cache expired reach the exported files. Rows from a local estimate, like OfflineDistanceMatrixClient, never replace results
+    from Google, and are always replaced by them.
+
+    Usage:
+        store = DistanceStore("../data/distance_results.sqlite")
+        store.append(results_postcodes_destinations)
+        results_postcodes_destinations, results_destinations_postcodes = store.get_results()
+    """
+
+    def __init__(self, store_path: str) -> None:
+        self.store_path = store_path
+        os.makedirs(os.path.dirname(store_path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(store_path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                postcode TEXT NOT NULL,
+                destination TEXT NOT NULL,
+                value TEXT NOT NULL,
+                is_estimate INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (postcode, destination)
+            )
+        """)
+        if "is_estimate" not in [column[1] for column in self.connection.execute("PRAGMA table_info(results)")]:          # Stores from before estimates
+            self.connection.execute("ALTER TABLE results ADD COLUMN is_estimate INTEGER NOT NULL DEFAULT 0")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS results_destination ON results (destination)")
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.connection.close()
+        return None
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def append(self, results_postcodes_destinations: dict, is_estimate: bool = False) -> int:
+        """Append the results of one batch.
+
+        Args:
+            results_postcodes_destinations (dict): Distance matrix results with postcodes as keys, and destinations as subkeys, as returned by get_results.
+            is_estimate (bool, optional): Results are a local estimate, to be replaced by results from Google. Defaults to False.
+
+        Returns:
+            int: Number of new or replaced rows, rows that are already stored with the same value are skipped.
+        """
+        rows = [
+            (postcode.split(" ")[0], destination, json.dumps(value, separators=(",", ":")), int(is_estimate))
+            for postcode, destinations in results_postcodes_destinations.items()
+            for destination, value in destinations.items()
+        ]
+        with self.connection:
+            number_of_rows = self.connection.total_changes
+            self.connection.executemany("""
+                INSERT INTO results (postcode, destination, value, is_estimate) VALUES (?, ?, ?, ?)
+                ON CONFLICT (postcode, destination) DO UPDATE SET value = excluded.value, is_estimate = excluded.is_estimate
+                WHERE (results.is_estimate = 1 AND excluded.is_estimate = 0)
+                    OR (results.value != excluded.value AND results.is_estimate >= excluded.is_estimate)
+            """, rows)
+            return self.connection.total_changes - number_of_rows
+
+    def clear(self) -> None:
+        """Remove all stored results."""
+        with self.connection:
+            self.connection.execute("DELETE FROM results")
+        return None
+
+    def remove_estimates(self) -> int:
+        """Remove the estimated rows that were not replaced by results from Google, and return how many were removed."""
+        with self.connection:
+            return self.connection.execute("DELETE FROM results WHERE is_estimate = 1").rowcount
+
+    def import_results(self, postcodes_destinations_path: str) -> int:
+        """Append the results of an existing distance_postcodes_destinations.json, to keep results from runs before the store."""
+        if not os.path.exists(postcodes_destinations_path):
+            return 0
+        with open(postcodes_destinations_path, "r") as file:
+            return self.append(json.load(file))
+
+    def get_results(self) -> tuple:
+        """Get both result shapes in a single pass over the store, in the order the rows were appended.
+
+        Returns:
+            tuple: Results with postcodes as keys, and destinations as subkeys, and results with destinations as keys, and postcodes as subkeys.
+        """
+        results_postcodes_destinations = {}
+        results_destinations_postcodes = {}
+        for postcode, destination, value in self.connection.execute("SELECT postcode, destination, value FROM results ORDER BY rowid"):
+            value = json.loads(value)
+            results_postcodes_destinations.setdefault(postcode, {})[destination] = value
+            results_destinations_postcodes.setdefault(destination, {})[postcode] = value
+        return results_postcodes_destinations, results_destinations_postcodes
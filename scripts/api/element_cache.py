@@ -0,0 +1,216 @@
+import os
+import re
+import json
+import sqlite3
+import unicodedata
+from time import time
+from datetime import datetime
+
+
+# Modes whose travel time depends on the departure time
+TIME_DEPENDENT_MODES = {"transit", "driving"}
+
+# Departure hours per time bucket, (first hour, last hour + 1, name), on weekdays and weekends
+TIME_BUCKETS = [
+    (0, 6, "night"),
+    (6, 9, "morning_peak"),
+    (9, 15, "day"),
+    (15, 18, "afternoon_peak"),
+    (18, 24, "evening"),
+]
+
+
+def normalize_address(address: str) -> str:
+    """Normalize an address for cache keys, so "0274,  Norway" and "0274, norway" share an entry."""
+    address = unicodedata.normalize("NFC", address).strip().lower()
+    address = re.sub(r"\s*,\s*", ", ", address)
+    return re.sub(r"\s+", " ", address)
+
+
+def get_time_bucket(mode: str, departure_time: datetime) -> str:
+    """Get the departure time bucket of a cache key, like "weekday_morning_peak", or "any" for modes that do not depend on time.
+
+    Args:
+        mode (str): Travel mode.
+        departure_time (datetime): Departure time.
+
+    Returns:
+        str: Time bucket.
+    """
+    if mode not in TIME_DEPENDENT_MODES:
+        return "any"
+    day = "weekend" if departure_time.weekday() >= 5 else "weekday"
+    for first_hour, last_hour, name in TIME_BUCKETS:
+        if first_hour <= departure_time.hour < last_hour:
+            return f"{day}_{name}"
+
+
+class ElementCache:
+    """Persistent cache of Distance Matrix elements, keyed by normalized origin, destination, mode and departure time bucket.
+
+    Elements older than ttl_in_seconds are stale, and are requested again by the planner together with the missing ones.
+    The formatted addresses Google returns are cached too, since get_results reads the postcode from them, and so are geocoded
+    coordinates of destinations, which never expire.
+
+    Usage:
+        cache = ElementCache("../data/cache/distance_elements.sqlite", ttl_in_seconds=30 * 24 * 60 * 60)
+        matrices = get_distance_matrices(gmaps, origins, destinations, cache=cache)
+        print(cache.statistics)
+    """
+
+    def __init__(self, cache_path: str = "data/cache/distance_elements.sqlite", ttl_in_seconds: float = 30 * 24 * 60 * 60) -> None:
+        self.cache_path = cache_path
+        self.ttl_in_seconds = ttl_in_seconds
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(cache_path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS elements (
+                origin TEXT NOT NULL,
+                destination TEXT NOT NULL,
+                mode TEXT NOT NULL,
+                time_bucket TEXT NOT NULL,
+                element TEXT NOT NULL,
+                stored_at REAL NOT NULL,
+                PRIMARY KEY (origin, destination, mode, time_bucket)
+            )
+        """)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS addresses (
+                address TEXT PRIMARY KEY,
+                formatted_address TEXT NOT NULL
+            )
+        """)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS coordinates (
+                address TEXT PRIMARY KEY,
+                latitude REAL NOT NULL,
+                longitude REAL NOT NULL
+            )
+        """)
+        self.connection.commit()
+
+        # Statistics
+        self.statistics = {
+            "hits": 0,
+            "misses": 0,
+            "stale": 0,
+            "stored": 0,
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.connection.close()
+        return None
+
+    def get_elements(self, origins: list, destinations: list, mode: str, departure_time: datetime, cells: dict = None) -> dict:
+        """Get the fresh cached elements of an origins × destinations grid for one mode.
+
+        Only the wanted cells are looked up and counted in the statistics, so the hit rate is of the cells that are needed.
+
+        Args:
+            origins (list): List of origins.
+            destinations (list): List of destinations.
+            mode (str): Travel mode.
+            departure_time (datetime): Departure time.
+            cells (dict, optional): Wanted destination indices with origin indices as keys. Defaults to every cell.
+
+        Returns:
+            dict: Elements with (origin index, destination index) as keys, for the cells that are cached and fresh.
+        """
+        time_bucket = get_time_bucket(mode, departure_time)
+        wanted_cells = {origin_index: set(destination_indices) for origin_index, destination_indices in cells.items()} if cells is not None else None
+        number_of_wanted_cells = sum(len(destination_indices) for destination_indices in wanted_cells.values()) if cells is not None else len(origins) * len(destinations)
+        origin_indices = {}
+        for origin_index, origin in enumerate(origins):
+            if wanted_cells is None or wanted_cells.get(origin_index):
+                origin_indices.setdefault(normalize_address(origin), []).append(origin_index)
+        destination_indices = {}
+        for destination_index, destination in enumerate(destinations):
+            destination_indices.setdefault(normalize_address(destination), []).append(destination_index)
+
+        # Look up by origin, the primary key index covers (origin, destination, mode, time_bucket)
+        elements = {}
+        number_of_stale = 0
+        expired_before = time() - self.ttl_in_seconds
+        for origin, indices in origin_indices.items():
+            rows = self.connection.execute(
+                "SELECT destination, element, stored_at FROM elements WHERE origin = ? AND mode = ? AND time_bucket = ?",
+                (origin, mode, time_bucket),
+            )
+            for destination, element, stored_at in rows:
+                if destination not in destination_indices:
+                    continue
+                is_stale = stored_at < expired_before
+                element = json.loads(element) if not is_stale else None
+                for origin_index in indices:
+                    for destination_index in destination_indices[destination]:
+                        if wanted_cells is not None and destination_index not in wanted_cells[origin_index]:
+                            continue
+                        if is_stale:
+                            number_of_stale += 1
+                        else:
+                            elements[(origin_index, destination_index)] = element
+
+        self.statistics["hits"] += len(elements)
+        self.statistics["stale"] += number_of_stale
+        self.statistics["misses"] += number_of_wanted_cells - len(elements) - number_of_stale
+        return elements
+
+    def store_elements(self, cells: list, mode: str, departure_time: datetime) -> None:
+        """Store requested elements for one mode.
+
+        Args:
+            cells (list): List of (origin, destination, element).
+            mode (str): Travel mode.
+            departure_time (datetime): Departure time of the request.
+
+        Returns:
+            None
+        """
+        time_bucket = get_time_bucket(mode, departure_time)
+        stored_at = time()
+        rows = [(normalize_address(origin), normalize_address(destination), mode, time_bucket, json.dumps(element, separators=(",", ":")), stored_at) for origin, destination, element in cells]
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO elements (origin, destination, mode, time_bucket, element, stored_at) VALUES (?, ?, ?, ?, ?, ?)", rows)
+        self.statistics["stored"] += len(rows)
+        return None
+
+    def get_formatted_addresses(self, addresses: list) -> dict:
+        """Get the cached formatted addresses, with the addresses that have one as keys."""
+        formatted_addresses = {}
+        for address in addresses:
+            row = self.connection.execute("SELECT formatted_address FROM addresses WHERE address = ?", (normalize_address(address),)).fetchone()
+            if row is not None:
+                formatted_addresses[address] = row[0]
+        return formatted_addresses
+
+    def store_formatted_addresses(self, formatted_addresses: dict) -> None:
+        """Store formatted addresses, with the requested addresses as keys."""
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO addresses (address, formatted_address) VALUES (?, ?)", [(normalize_address(address), formatted_address) for address, formatted_address in formatted_addresses.items()])
+        return None
+
+    def get_coordinates(self, addresses: list) -> dict:
+        """Get the cached coordinates as (latitude, longitude), with the addresses that have them as keys."""
+        coordinates = {}
+        for address in addresses:
+            row = self.connection.execute("SELECT latitude, longitude FROM coordinates WHERE address = ?", (normalize_address(address),)).fetchone()
+            if row is not None:
+                coordinates[address] = row
+        return coordinates
+
+    def store_coordinates(self, coordinates: dict) -> None:
+        """Store coordinates as (latitude, longitude), with addresses as keys."""
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO coordinates (address, latitude, longitude) VALUES (?, ?, ?)", [(normalize_address(address), latitude, longitude) for address, (latitude, longitude) in coordinates.items()])
+        return None
+
+    def get_hit_rate(self) -> float:
+        number_of_lookups = self.statistics["hits"] + self.statistics["misses"] + self.statistics["stale"]
+        return self.statistics["hits"] / number_of_lookups if number_of_lookups > 0 else 0.0
@@ -0,0 +1,179 @@
+import re
+import json
+import math
+from api.element_cache import normalize_address
+from api.spatial_index import get_haversine_distance, get_centroid
+
+
+# Average speed per mode in meters per second, close to what Google reports within Norwegian cities
+OFFLINE_SPEEDS = {
+    "walking": 1.4,
+    "bicycling": 4.5,
+    "transit": 7.0,
+    "driving": 11.0,
+}
+
+# Road distance per straight-line distance, used when there is no road graph
+DETOUR_FACTORS = {
+    "walking": 1.3,
+    "bicycling": 1.3,
+    "transit": 1.4,
+    "driving": 1.4,
+}
+
+# Fixed time per trip in seconds, like waiting for transit or parking
+FIXED_SECONDS = {
+    "walking": 0,
+    "bicycling": 60,
+    "transit": 300,
+    "driving": 120,
+}
+
+# Postcode in an address, like "0171" in "Waldemar Thranes gate 25, 0171 Oslo, Norway"
+POSTCODE_PATTERN = re.compile(r"(?<!\d)(\d{4})(?!\d)")
+
+
+def get_distance_text(meters: int) -> str:
+    """Format a distance like Google, like "850 m" or "1.2 km"."""
+    if meters < 1000:
+        return f"{meters} m"
+    if meters < 100000:
+        return f"{meters / 1000:.1f} km"
+    return f"{round(meters / 1000)} km"
+
+
+def get_duration_text(seconds: int) -> str:
+    """Format a duration like Google, like "1 min", "12 mins" or "1 hour 5 mins"."""
+    minutes = max(1, round(seconds / 60))
+    hours, minutes = divmod(minutes, 60)
+    minutes_text = f"{minutes} min" + ("s" if minutes != 1 else "")
+    if hours == 0:
+        return minutes_text
+    hours_text = f"{hours} hour" + ("s" if hours != 1 else "")
+    return f"{hours_text} {minutes_text}" if minutes > 0 else hours_text
+
+
+class OfflineDistanceMatrixClient:
+    """Local stand-in for googlemaps.Client that estimates travel times, for previews and fallbacks without network access.
+
+    Distances are straight lines times a detour factor per mode, or shortest paths on a road graph when one is given, and
+    times are distances over an average speed per mode plus a fixed time per trip. Transit is never slower than walking,
+    like Google returns walking directions when they are faster. Addresses are placed by known coordinates, or by the
+    centroid of the postcode in the address, and addresses that cannot be placed get status NOT_FOUND like Google.
+    The responses have the shape of Google's, so add_granularity_to_results and get_results work on them unchanged.
+
+    Usage:
+        gmaps = get_offline_client("../../frontend/public/data/postcodes.json")
+        update_distances(destinations, destinations_metadata, gmaps=gmaps, is_estimate=True)
+    """
+
+    def __init__(self, postcode_centroids: dict, coordinates: dict = None, postcode_places: dict = None, road_graph=None, speeds: dict = None, detour_factors: dict = None) -> None:
+        """Initialize the client.
+
+        Args:
+            postcode_centroids (dict): (latitude, longitude) with postcodes as keys.
+            coordinates (dict, optional): (latitude, longitude) with addresses as keys, like geocoded destinations. Defaults to None.
+            postcode_places (dict, optional): Place names with postcodes as keys, for formatted addresses like "0274 Oslo, Norway". Defaults to None.
+            road_graph (RoadGraph, optional): Road graph for distances. Defaults to None, for straight lines times DETOUR_FACTORS.
+            speeds (dict, optional): Meters per second per mode. Defaults to OFFLINE_SPEEDS.
+            detour_factors (dict, optional): Road distance per straight-line distance per mode. Defaults to DETOUR_FACTORS.
+        """
+        self.postcode_centroids = postcode_centroids
+        self.coordinates = {normalize_address(address): tuple(coordinate) for address, coordinate in (coordinates or {}).items()}
+        self.postcode_places = postcode_places or {}
+        self.road_graph = road_graph if road_graph is not None and len(road_graph) > 0 else None
+        self.speeds = speeds if speeds is not None else OFFLINE_SPEEDS
+        self.detour_factors = detour_factors if detour_factors is not None else DETOUR_FACTORS
+
+        # Statistics
+        self.number_of_requests = 0
+        self.number_of_elements = 0
+
+    def get_coordinates(self, address: str) -> tuple:
+        """Get the coordinates of an address, or of the postcode in it, or None if it cannot be placed."""
+        coordinate = self.coordinates.get(normalize_address(address))
+        if coordinate is not None:
+            return coordinate
+        for postcode in reversed(POSTCODE_PATTERN.findall(address)):             # The postcode comes after the street and house number
+            if postcode in self.postcode_centroids:
+                return self.postcode_centroids[postcode]
+        return None
+
+    def get_formatted_address(self, address: str) -> str:
+        """Format a postcode origin like Google, so "0274, Norway" is returned as "0274 Oslo, Norway", other addresses are kept."""
+        match = re.match(r"^(\d{4}), ", address)
+        if match is None or match.group(1) not in self.postcode_places:
+            return address
+        return f"{match.group(1)} {self.postcode_places[match.group(1)]}, {address[match.end():]}"
+
+    def geocode(self, address: str, **kwargs) -> list:
+        coordinate = self.get_coordinates(address)
+        if coordinate is None:
+            return []
+        return [{"formatted_address": self.get_formatted_address(address), "geometry": {"location": {"lat": coordinate[0], "lng": coordinate[1]}}}]
+
+    def get_road_meters(self, origin: tuple, destination: tuple, mode: str) -> float:
+        """Get the estimated road distance in meters, on the road graph if it connects the two points."""
+        straight_line_meters = get_haversine_distance(*origin, *destination)
+        if self.road_graph is not None:
+            meters = self.road_graph.get_distance(origin, destination)
+            if math.isfinite(meters):
+                return max(meters, straight_line_meters)
+        return straight_line_meters * self.detour_factors[mode]
+
+    def get_element(self, origin: tuple, destination: tuple, mode: str) -> dict:
+        """Get an estimated element between two coordinates, in the shape of a Distance Matrix element."""
+        if origin is None or destination is None:
+            return {"status": "NOT_FOUND"}
+        meters = round(self.get_road_meters(origin, destination, mode))
+        seconds = math.ceil(meters / self.speeds[mode]) + FIXED_SECONDS[mode]
+        if mode == "transit":
+            walking_meters = round(self.get_road_meters(origin, destination, "walking"))
+            walking_seconds = math.ceil(walking_meters / self.speeds["walking"]) + FIXED_SECONDS["walking"]
+            if walking_seconds <= seconds:
+                meters, seconds = walking_meters, walking_seconds
+        return {
+            "distance": {"text": get_distance_text(meters), "value": meters},
+            "duration": {"text": get_duration_text(seconds), "value": seconds},
+            "status": "OK",
+        }
+
+    def distance_matrix(self, origins, destinations, mode="driving", units=None, departure_time=None, **kwargs) -> dict:
+        origins = [origins] if isinstance(origins, str) else list(origins)
+        destinations = [destinations] if isinstance(destinations, str) else list(destinations)
+        if mode not in self.speeds:
+            raise ValueError("Invalid travel mode.")
+        self.number_of_requests += 1
+        self.number_of_elements += len(origins) * len(destinations)
+        origin_coordinates = [self.get_coordinates(origin) for origin in origins]
+        destination_coordinates = [self.get_coordinates(destination) for destination in destinations]
+        return {
+            "destination_addresses": [self.get_formatted_address(destination) for destination in destinations],
+            "origin_addresses": [self.get_formatted_address(origin) for origin in origins],
+            "rows": [{"elements": [self.get_element(origin, destination, mode) for destination in destination_coordinates]} for origin in origin_coordinates],
+            "status": "OK",
+        }
+
+
+def get_offline_client(geojson_path: str, coordinates: dict = None, road_graph=None) -> OfflineDistanceMatrixClient:
+    """Get an offline client with the postcode centroids and place names of a postcodes GeoJSON file.
+
+    Args:
+        geojson_path (str): Path to a GeoJSON file with postcode polygons, like postcodes.json.
+        coordinates (dict, optional): (latitude, longitude) with addresses as keys, like geocoded destinations. Defaults to None.
+        road_graph (RoadGraph, optional): Road graph for distances. Defaults to None.
+
+    Returns:
+        OfflineDistanceMatrixClient: Offline client.
+    """
+    with open(geojson_path, "r") as file:
+        postcodes_data = json.load(file)
+    postcode_centroids = {}
+    postcode_places = {}
+    for feature in postcodes_data["features"]:
+        postcode = feature["properties"]["postnummer"]
+        if feature.get("geometry"):
+            postcode_centroids[postcode] = get_centroid(feature["geometry"])
+        if feature["properties"].get("poststed"):
+            postcode_places[postcode] = feature["properties"]["poststed"].title()
+    return OfflineDistanceMatrixClient(postcode_centroids, coordinates, postcode_places, road_graph)
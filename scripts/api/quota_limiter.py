@@ -0,0 +1,140 @@
+import threading
+from time import monotonic, sleep
+
+
+# Default quotas of the Distance Matrix API
+QUERIES_PER_SECOND = 50
+ELEMENTS_PER_SECOND = 1000
+
+
+class QuotaExceededError(Exception):
+    """Raised when a request would use more elements than the element budget of the run."""
+
+
+class QuotaLimiter:
+    """Thread-safe limiter for Distance Matrix requests, shared by every worker of a run.
+
+    Bounds the number of requests in flight, and spaces requests so both the query rate and the element rate stay within quota,
+    since a request of 100 elements uses as much quota as 100 requests of one element. When Google answers OVER_QUERY_LIMIT,
+    all workers pause and the element rate is halved, and it grows back by a step per successful request up to elements_per_second.
+    An optional element budget stops the run before it costs more than planned.
+
+    Usage:
+        limiter = QuotaLimiter(max_concurrency=8)
+        with limiter.limit(number_of_elements=100):
+            results = gmaps.distance_matrix(...)
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        queries_per_second: float = QUERIES_PER_SECOND,
+        elements_per_second: float = ELEMENTS_PER_SECOND,
+        element_budget: int = None,
+        min_elements_per_second: float = 10,
+        elements_per_second_increase: float = 0.05,
+        quota_window_in_seconds: float = 1.0,
+    ) -> None:
+        self.max_concurrency = max_concurrency
+        self.queries_per_second = queries_per_second
+        self.elements_per_second = elements_per_second
+        self.max_elements_per_second = elements_per_second
+        self.min_elements_per_second = min_elements_per_second
+        self.elements_per_second_increase = elements_per_second_increase
+        self.quota_window_in_seconds = quota_window_in_seconds
+        self.element_budget = element_budget
+
+        # State
+        self.in_flight = 0
+        self.next_query_at = 0.0
+        self.next_elements_at = 0.0
+        self.paused_until = 0.0
+        self.decreased_at = float("-inf")
+        self.condition = threading.Condition()
+
+        # Statistics
+        self.statistics = {
+            "requests": 0,
+            "elements": 0,              # Elements sent, retried requests included
+            "throttled": 0,
+            "retries": 0,
+        }
+
+    def acquire(self, number_of_elements: int) -> None:
+        """Wait for a free slot and for the next request time allowed by the query and element rates.
+
+        Args:
+            number_of_elements (int): Elements of the request.
+
+        Raises:
+            QuotaExceededError: If the request would exceed the element budget.
+
+        Returns:
+            None
+        """
+        with self.condition:
+            if self.element_budget is not None and self.statistics["elements"] + number_of_elements > self.element_budget:
+                raise QuotaExceededError(f"Request of {number_of_elements} elements would exceed the budget of {self.element_budget} elements ({self.statistics['elements']} used)")
+            self.condition.wait_for(lambda: self.in_flight < self.max_concurrency)
+            self.in_flight += 1
+            self.statistics["requests"] += 1
+            self.statistics["elements"] += number_of_elements
+
+            # Reserve the next request time for both rates, so waiting requests are spaced by the slower of the two
+            now = monotonic()
+            request_at = max(now, self.next_query_at, self.next_elements_at, self.paused_until)
+            self.next_query_at = request_at + 1 / self.queries_per_second
+            self.next_elements_at = request_at + number_of_elements / self.elements_per_second
+        delay = request_at - monotonic()
+        if delay > 0:
+            sleep(delay)
+        return None
+
+    def release(self) -> None:
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+        return None
+
+    def limit(self, number_of_elements: int):
+        """Context manager that acquires before and releases after one request."""
+        return QuotaSlot(self, number_of_elements)
+
+    def record_success(self) -> None:
+        """Increase the element rate by elements_per_second_increase of its maximum."""
+        with self.condition:
+            self.elements_per_second = min(self.max_elements_per_second, self.elements_per_second + self.max_elements_per_second * self.elements_per_second_increase)
+        return None
+
+    def record_throttled(self, pause_in_seconds: float) -> None:
+        """Halve the element rate, and pause all workers for pause_in_seconds.
+
+        The rate is halved at most once per quota window, since requests that were already sent at the old rate are throttled too.
+        """
+        with self.condition:
+            self.statistics["throttled"] += 1
+            if monotonic() - self.decreased_at >= self.quota_window_in_seconds:
+                self.elements_per_second = max(self.min_elements_per_second, self.elements_per_second / 2)
+                self.decreased_at = monotonic()
+            self.paused_until = max(self.paused_until, monotonic() + pause_in_seconds)
+        return None
+
+    def record_retry(self) -> None:
+        with self.condition:
+            self.statistics["retries"] += 1
+        return None
+
+
+class QuotaSlot:
+
+    def __init__(self, limiter: QuotaLimiter, number_of_elements: int) -> None:
+        self.limiter = limiter
+        self.number_of_elements = number_of_elements
+
+    def __enter__(self):
+        self.limiter.acquire(self.number_of_elements)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.limiter.release()
+        return False
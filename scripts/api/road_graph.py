@@ -0,0 +1,111 @@
+import heapq
+import numpy as np
+from processing.geojson_stream import iter_geojson_features
+from api.spatial_index import KDTree, get_haversine_distance
+
+
+# Decimals of longitude and latitude that make two line vertices the same node, about 1 cm
+NODE_DECIMALS = 7
+
+
+class RoadGraph:
+    """Undirected road graph from a local GeoJSON extract of LineStrings, for shortest path distances in meters.
+
+    Every line vertex is a node, and vertices shared by lines join them, like the ways of an OpenStreetMap export
+    (ogr2ogr -f GeoJSON roads.json extract.osm.pbf lines). One-way streets and turn restrictions are ignored.
+    Shortest paths are computed from the destinations, since there are far fewer destinations than postcodes, and every
+    search is kept, so each origin is a lookup in an array.
+
+    Usage:
+        graph = RoadGraph("../data/roads/oslo.json")
+        meters = graph.get_distance((59.91, 10.75), (59.93, 10.71))
+    """
+
+    def __init__(self, geojson_path: str, excluded_highways: set = None) -> None:
+        """Load the graph.
+
+        Args:
+            geojson_path (str): Path to a GeoJSON file with LineString or MultiLineString features.
+            excluded_highways (set, optional): Values of the "highway" property to leave out, like {"motorway"} for walking. Defaults to None.
+        """
+        node_indices = {}
+        coordinates = []
+        edges = {}
+        for feature in iter_geojson_features(geojson_path):
+            geometry = feature.get("geometry")
+            if not geometry or geometry["type"] not in ("LineString", "MultiLineString"):
+                continue
+            if excluded_highways and (feature.get("properties") or {}).get("highway") in excluded_highways:
+                continue
+            lines = [geometry["coordinates"]] if geometry["type"] == "LineString" else geometry["coordinates"]
+            for line in lines:
+                previous = None
+                for longitude, latitude, *_ in line:
+                    key = (round(latitude, NODE_DECIMALS), round(longitude, NODE_DECIMALS))
+                    node = node_indices.get(key)
+                    if node is None:
+                        node = node_indices[key] = len(coordinates)
+                        coordinates.append(key)
+                    if previous is not None and previous != node:
+                        edge = (min(previous, node), max(previous, node))
+                        if edge not in edges:
+                            edges[edge] = get_haversine_distance(*coordinates[previous], *coordinates[node])
+                    previous = node
+
+        # Adjacency in compressed sparse rows, neighbours of node i are neighbours[offsets[i]:offsets[i + 1]]
+        self.coordinates = coordinates
+        sources = np.array([edge[0] for edge in edges] + [edge[1] for edge in edges], dtype=np.int64)
+        targets = np.array([edge[1] for edge in edges] + [edge[0] for edge in edges], dtype=np.int64)
+        lengths = np.array(list(edges.values()) * 2, dtype=float)
+        order = np.argsort(sources, kind="stable")
+        self.neighbours = targets[order].tolist()
+        self.lengths = lengths[order].tolist()
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(sources, minlength=len(coordinates)))]).tolist()
+        self.tree = KDTree(coordinates)
+        self.nearest_nodes = {}             # Nearest node and straight-line meters to it per coordinate
+        self.distances_from = {}            # Shortest path distances from a node to every node
+
+    def __len__(self) -> int:
+        return len(self.coordinates)
+
+    def get_nearest_node(self, coordinate: tuple) -> tuple:
+        """Get the node nearest to a coordinate, and the straight-line distance to it in meters."""
+        coordinate = tuple(coordinate)
+        if coordinate not in self.nearest_nodes:
+            distances, indices = self.tree.query(coordinate, k=1)
+            self.nearest_nodes[coordinate] = (indices[0], distances[0])
+        return self.nearest_nodes[coordinate]
+
+    def get_distances_from(self, source: int) -> np.ndarray:
+        """Get shortest path distances in meters from a node to every node, inf for nodes that cannot be reached."""
+        if source in self.distances_from:
+            return self.distances_from[source]
+        distances = [float("inf")] * len(self.coordinates)
+        distances[source] = 0.0
+        heap = [(0.0, source)]
+        while heap:
+            distance, node = heapq.heappop(heap)
+            if distance > distances[node]:
+                continue
+            for index in range(self.offsets[node], self.offsets[node + 1]):
+                neighbour = self.neighbours[index]
+                neighbour_distance = distance + self.lengths[index]
+                if neighbour_distance < distances[neighbour]:
+                    distances[neighbour] = neighbour_distance
+                    heapq.heappush(heap, (neighbour_distance, neighbour))
+        self.distances_from[source] = np.array(distances, dtype=np.float32)           # Kept for every destination, float32 halves the memory of large extracts
+        return self.distances_from[source]
+
+    def get_distance(self, origin: tuple, destination: tuple) -> float:
+        """Get the road distance in meters between two coordinates, with the straight lines to and from the nearest nodes.
+
+        Args:
+            origin (tuple): (latitude, longitude) of the origin.
+            destination (tuple): (latitude, longitude) of the destination.
+
+        Returns:
+            float: Distance in meters, inf if the nearest nodes are not connected.
+        """
+        origin_node, origin_meters = self.get_nearest_node(origin)
+        destination_node, destination_meters = self.get_nearest_node(destination)
+        return origin_meters + float(self.get_distances_from(destination_node)[origin_node]) + destination_meters
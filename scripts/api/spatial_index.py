@@ -0,0 +1,128 @@
+import heapq
+import math
+import numpy as np
+
+
+# Mean radius of the Earth in meters
+EARTH_RADIUS_IN_METERS = 6371008.8
+
+# Max points in a leaf of the KD-tree, leaves are searched by brute force
+LEAF_SIZE = 16
+
+
+def get_haversine_distance(latitude_1: float, longitude_1: float, latitude_2: float, longitude_2: float) -> float:
+    """Get the great-circle distance in meters between two points."""
+    phi_1, phi_2 = math.radians(latitude_1), math.radians(latitude_2)
+    delta_phi = phi_2 - phi_1
+    delta_lambda = math.radians(longitude_2 - longitude_1)
+    a = math.sin(delta_phi / 2) ** 2 + math.cos(phi_1) * math.cos(phi_2) * math.sin(delta_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_IN_METERS * math.asin(math.sqrt(a))
+
+
+def get_unit_vectors(coordinates) -> np.ndarray:
+    """Get points on the unit sphere for (latitude, longitude) pairs, where straight-line distance orders points like great-circle distance."""
+    coordinates = np.radians(np.asarray(coordinates, dtype=float).reshape(-1, 2))
+    latitudes, longitudes = coordinates[:, 0], coordinates[:, 1]
+    return np.column_stack([np.cos(latitudes) * np.cos(longitudes), np.cos(latitudes) * np.sin(longitudes), np.sin(latitudes)])
+
+
+def get_chord_to_meters(chord_length: float) -> float:
+    return 2 * EARTH_RADIUS_IN_METERS * math.asin(min(1.0, chord_length / 2))
+
+
+def get_centroid(geometry: dict) -> tuple:
+    """Get the area-weighted centroid of a GeoJSON Polygon or MultiPolygon as (latitude, longitude).
+
+    Holes are ignored, since postcode areas are small enough for planar formulas and only the nearest destinations are looked up.
+    """
+    polygons = [geometry["coordinates"]] if geometry["type"] == "Polygon" else geometry["coordinates"]
+    total_area, x_sum, y_sum = 0.0, 0.0, 0.0
+    for polygon in polygons:
+        ring = np.asarray(polygon[0], dtype=float)
+        x, y = ring[:, 0], ring[:, 1]
+        x_next, y_next = np.roll(x, -1), np.roll(y, -1)
+        cross = x * y_next - x_next * y
+        area = cross.sum() / 2
+        if area == 0:
+            continue
+        total_area += area
+        x_sum += ((x + x_next) * cross).sum() / 6
+        y_sum += ((y + y_next) * cross).sum() / 6
+    if total_area == 0:             # Degenerate rings, fall back to the mean of the vertices
+        vertices = np.asarray([vertex for polygon in polygons for vertex in polygon[0]], dtype=float)
+        return float(vertices[:, 1].mean()), float(vertices[:, 0].mean())
+    return float(y_sum / total_area), float(x_sum / total_area)
+
+
+class KDTree:
+    """KD-tree over (latitude, longitude) points, for k nearest neighbour queries by great-circle distance.
+
+    Points are stored as unit vectors, split on the axis with the largest spread, so the tree works across the whole country
+    without projecting coordinates.
+
+    Usage:
+        tree = KDTree([(59.91, 10.75), (60.39, 5.32)])
+        distances_in_meters, indices = tree.query((59.93, 10.71), k=1)
+    """
+
+    def __init__(self, coordinates, leaf_size: int = LEAF_SIZE) -> None:
+        self.points = get_unit_vectors(coordinates)
+        self.leaf_size = leaf_size
+        self.nodes = []             # (axis, split value, left node, right node) for branches, (None, indices) for leaves
+        self.root = self.build(np.arange(len(self.points))) if len(self.points) > 0 else None
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def build(self, indices: np.ndarray) -> int:
+        if len(indices) <= self.leaf_size:
+            self.nodes.append((None, indices))
+            return len(self.nodes) - 1
+        points = self.points[indices]
+        axis = int(np.argmax(points.max(axis=0) - points.min(axis=0)))
+        order = np.argsort(points[:, axis], kind="stable")
+        middle = len(indices) // 2
+        split = float(points[order[middle], axis])
+        node_index = len(self.nodes)
+        self.nodes.append(None)
+        left = self.build(indices[order[:middle]])
+        right = self.build(indices[order[middle:]])
+        self.nodes[node_index] = (axis, split, left, right)
+        return node_index
+
+    def query(self, coordinate: tuple, k: int = 1) -> tuple:
+        """Get the k nearest points to a coordinate.
+
+        Args:
+            coordinate (tuple): (latitude, longitude).
+            k (int, optional): Number of neighbours. Defaults to 1.
+
+        Returns:
+            tuple: Great-circle distances in meters and indices of the neighbours, nearest first.
+        """
+        if self.root is None or k <= 0:
+            return [], []
+        point = get_unit_vectors([coordinate])[0]
+        k = min(k, len(self.points))
+        heap = []               # Max-heap of (-squared distance, index) of the k nearest so far
+        stack = [(self.root, 0.0)]
+        while stack:
+            node_index, bound = stack.pop()
+            if len(heap) == k and bound > -heap[0][0]:
+                continue
+            node = self.nodes[node_index]
+            if node[0] is None:
+                squared_distances = ((self.points[node[1]] - point) ** 2).sum(axis=1)
+                for squared_distance, index in zip(squared_distances.tolist(), node[1].tolist()):
+                    if len(heap) < k:
+                        heapq.heappush(heap, (-squared_distance, -index))
+                    elif (squared_distance, index) < (-heap[0][0], -heap[0][1]):            # Ties go to the lower index
+                        heapq.heapreplace(heap, (-squared_distance, -index))
+                continue
+            axis, split, left, right = node
+            difference = point[axis] - split
+            near, far = (left, right) if difference < 0 else (right, left)
+            stack.append((far, max(bound, difference ** 2)))          # Searched last, and skipped if the splitting plane is farther than the k-th neighbour
+            stack.append((near, bound))
+        neighbours = sorted((-negative_squared_distance, -negative_index) for negative_squared_distance, negative_index in heap)
+        return [get_chord_to_meters(math.sqrt(squared_distance)) for squared_distance, _ in neighbours], [index for _, index in neighbours]
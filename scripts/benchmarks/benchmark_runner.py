@@ -0,0 +1,127 @@
+import gc
+import io
+import json
+import os
+import tracemalloc
+from contextlib import redirect_stdout
+from time import perf_counter
+
+
+# Stored results to compare against, written by the "baseline" command
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+class Benchmark:
+    """One benchmark case: setup builds fresh arguments for every run, so only run is measured.
+
+    Usage:
+        benchmark = Benchmark("get_results[synthetic:500]", setup=lambda: (results,), run=get_results)
+        result = benchmark.measure(repeat=3)
+    """
+
+    def __init__(self, name: str, setup, run, size: int = None) -> None:
+        self.name = name
+        self.setup = setup
+        self.run = run
+        self.size = size
+
+    def run_once(self, arguments: tuple) -> None:
+        with redirect_stdout(io.StringIO()):             # Pipeline functions print progress, which would be measured too
+            self.run(*arguments)
+        return None
+
+    def measure(self, repeat: int = 3) -> dict:
+        """Measure the fastest run time with perf_counter, and the peak memory of one run with tracemalloc.
+
+        Args:
+            repeat (int, optional): Number of timed runs. Defaults to 3.
+
+        Returns:
+            dict: Seconds, peak memory in bytes and size of the input.
+        """
+
+        # Time runs without tracemalloc, which slows allocations down
+        times = []
+        for _ in range(repeat):
+            arguments = self.setup()
+            gc.collect()
+            start = perf_counter()
+            self.run_once(arguments)
+            times.append(perf_counter() - start)
+            del arguments
+
+        # Measure peak memory of a separate run
+        arguments = self.setup()
+        gc.collect()
+        tracemalloc.start()
+        try:
+            self.run_once(arguments)
+            _, peak_memory_in_bytes = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return {
+            "seconds": min(times),
+            "peak_memory_in_bytes": peak_memory_in_bytes,
+            "size": self.size,
+        }
+
+
+def run_benchmarks(benchmarks: list, repeat: int = 3, name_filter: str = None) -> dict:
+    """Run benchmarks and print one line per benchmark.
+
+    Args:
+        benchmarks (list): List of Benchmark.
+        repeat (int, optional): Number of timed runs per benchmark. Defaults to 3.
+        name_filter (str, optional): Only run benchmarks with this text in their name. Defaults to None.
+
+    Returns:
+        dict: Results with benchmark names as keys.
+    """
+    results = {}
+    for benchmark in benchmarks:
+        if name_filter is not None and name_filter not in benchmark.name:
+            continue
+        results[benchmark.name] = benchmark.measure(repeat)
+        print(f"{benchmark.name:<60} {results[benchmark.name]['seconds'] * 1000:>10.2f} ms {results[benchmark.name]['peak_memory_in_bytes'] / 1024 / 1024:>10.2f} MiB")
+    return results
+
+
+def save_results(results: dict, path: str = BASELINE_PATH) -> None:
+    with open(path, "w") as file:
+        json.dump(results, file, indent=2, sort_keys=True)
+        file.write("\n")
+    print(f"Saved {len(results)} benchmark results to {path}")
+    return None
+
+
+def load_results(path: str = BASELINE_PATH) -> dict:
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No baseline at {path}, create one with the \"baseline\" command first")
+    with open(path, "r") as file:
+        return json.load(file)
+
+
+def compare_results(baseline: dict, results: dict, threshold: float = 0.2) -> list:
+    """Compare results with a baseline and print the change of each benchmark.
+
+    Args:
+        baseline (dict): Baseline results with benchmark names as keys.
+        results (dict): Current results with benchmark names as keys.
+        threshold (float, optional): Relative increase in time or peak memory that counts as a regression. Defaults to 0.2 (20 %).
+
+    Returns:
+        list: Names of benchmarks that regressed.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            print(f"{name:<60} (new, no baseline)")
+            continue
+        time_ratio = result["seconds"] / max(baseline[name]["seconds"], 1e-9)
+        memory_ratio = result["peak_memory_in_bytes"] / max(baseline[name]["peak_memory_in_bytes"], 1)
+        is_regression = time_ratio > 1 + threshold or memory_ratio > 1 + threshold
+        if is_regression:
+            regressions.append(name)
+        print(f"{name:<60} time {time_ratio - 1:>+8.1%} memory {memory_ratio - 1:>+8.1%}{'  REGRESSION' if is_regression else ''}")
+    return regressions
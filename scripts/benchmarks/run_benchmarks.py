@@ -0,0 +1,175 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+# Run from scripts/, like prepare_postcodes.py
+SCRIPTS_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCRIPTS_DIRECTORY)
+
+from benchmarks.benchmark_runner import Benchmark, run_benchmarks, save_results, load_results, compare_results, BASELINE_PATH
+from benchmarks.synthetic_data import get_synthetic_features, get_synthetic_page, get_synthetic_market_data, get_synthetic_destinations, get_synthetic_distance_matrix
+from processing.clean_geojson import clean_geojson
+from processing.geojson_stream import FeatureCollectionWriter
+from processing.distance_data_preparation import get_nearest_location_for_postcode, get_nearest_locations_for_postcodes
+from scraper.market_data_scraper import parse_market_data, add_market_data_to_dicts
+from scraper.market_data_extractor import get_block_texts_from_soup, get_market_data_from_texts
+from api.distance_api_caller import add_granularity_to_results, get_results, store_results
+
+
+# Real data
+DATA_DIRECTORY = os.path.join(SCRIPTS_DIRECTORY, "data")
+CORPUS_DIRECTORY = os.path.join(DATA_DIRECTORY, "fixtures/market_data_pages")
+REAL_CITY = "oslo"
+
+
+## Stages ##
+async def add_market_data_for_all_features(postcodes_data: dict, results: list) -> None:
+    postcodes_market_data = {}
+    for i in range(len(postcodes_data["features"])):
+        await add_market_data_to_dicts(i, postcodes_data, postcodes_market_data, results)
+    return None
+
+
+def get_distance_matrices(origins: list, destinations: list) -> tuple:
+    """Get synthetic matrices for walking, bicycling, transit and driving."""
+    return tuple(get_synthetic_distance_matrix(origins, destinations, seed=seed) for seed in range(4))
+
+
+def get_nearest_locations(postcodes: list, distance_postcodes_destinations: dict) -> None:
+    for postcode in postcodes:
+        get_nearest_location_for_postcode(postcode, distance_postcodes_destinations)
+    return None
+
+
+def write_feature_collection(features: list, output_path: str) -> None:
+    with FeatureCollectionWriter(output_path) as writer:
+        for feature in features:
+            writer.write(feature)
+    return None
+
+
+def dump_feature_collection(features: list, output_path: str) -> None:
+    with open(output_path, "w") as file:
+        json.dump({"type": "FeatureCollection", "features": features}, file, indent=2)
+    return None
+
+
+## Benchmarks ##
+def get_distance_benchmarks(dataset: str, origins: list, destinations: list, destinations_metadata: dict, workspace: str) -> list:
+    """Get benchmarks for the distance stages, from granularity to nearest locations and the JSON writer."""
+
+    def get_granular_matrices() -> tuple:
+        return add_granularity_to_results(*get_distance_matrices(origins, destinations))
+
+    results_postcodes_destinations, _ = get_results(*get_granular_matrices(), destinations_metadata)
+    postcodes = list(results_postcodes_destinations.keys())
+    size = len(origins) * len(destinations)
+    return [
+        Benchmark(f"add_granularity_to_results[{dataset}]", lambda: get_distance_matrices(origins, destinations), add_granularity_to_results, size),
+        Benchmark(f"get_results[{dataset}]", lambda: get_granular_matrices() + (destinations_metadata,), get_results, size),
+        Benchmark(f"get_nearest_location_for_postcode[{dataset}]", lambda: (postcodes, results_postcodes_destinations), get_nearest_locations, size),
+        Benchmark(f"get_nearest_locations_for_postcodes[{dataset}]", lambda: (postcodes, results_postcodes_destinations), get_nearest_locations_for_postcodes, size),
+        Benchmark(f"store_results[{dataset}]", lambda: (results_postcodes_destinations, os.path.join(workspace, "distance_results.json")), store_results, size),
+    ]
+
+
+def get_benchmarks(workspace: str, scale: int = 1) -> list:
+    """Get benchmarks for every pipeline stage, on the real data in scripts/data and on synthetic data of a size set by scale.
+
+    Stages that write files run inside workspace, so the real data is never overwritten.
+
+    Args:
+        workspace (str): Working directory for the benchmarks.
+        scale (int, optional): Multiplier for the size of the synthetic data. Defaults to 1.
+
+    Returns:
+        list: List of Benchmark.
+    """
+    benchmarks = []
+    os.makedirs(os.path.join(workspace, "data/geojson"), exist_ok=True)
+    os.makedirs(os.path.join(workspace, "data/postcodes_cleaned"), exist_ok=True)
+
+    # clean_geojson
+    real_geojson_path = os.path.join(DATA_DIRECTORY, f"geojson/postcodes_{REAL_CITY}.geojson")
+    if os.path.exists(real_geojson_path):
+        os.symlink(real_geojson_path, os.path.join(workspace, f"data/geojson/postcodes_{REAL_CITY}.geojson"))
+        benchmarks.append(Benchmark(f"clean_geojson[real:{REAL_CITY}]", lambda: (REAL_CITY, REAL_CITY.upper()), clean_geojson))
+    number_of_features = 2000 * scale
+    with open(os.path.join(workspace, "data/geojson/postcodes_synthetic.geojson"), "w") as file:
+        json.dump({"type": "FeatureCollection", "features": get_synthetic_features(number_of_features)}, file)
+    benchmarks.append(Benchmark(f"clean_geojson[synthetic:{number_of_features}]", lambda: ("synthetic", "OSLO"), clean_geojson, number_of_features))
+
+    # HTML parsing, with the fast path and with the full BeautifulSoup tree for reference
+    pages_per_dataset = {}
+    if os.path.isdir(CORPUS_DIRECTORY):
+        page_names = sorted(file_name for file_name in os.listdir(CORPUS_DIRECTORY) if file_name.endswith(".html"))[:200 * scale]
+        pages = []
+        for page_name in page_names:
+            with open(os.path.join(CORPUS_DIRECTORY, page_name), "r", encoding="utf-8") as file:
+                pages.append((file.read(), page_name.removesuffix(".html")))
+        if pages:
+            pages_per_dataset[f"real:{len(pages)}"] = pages
+    number_of_pages = 50 * scale
+    pages_per_dataset[f"synthetic:{number_of_pages}"] = [(get_synthetic_page(f"{i:04d}", i), f"{i:04d}") for i in range(number_of_pages)]
+    for dataset, pages in pages_per_dataset.items():
+        benchmarks.append(Benchmark(f"parse_market_data[{dataset}]", lambda pages=pages: (pages,), lambda pages: [parse_market_data(html, post_code) for html, post_code in pages], len(pages)))
+        soup_pages = pages[:10 * scale]             # The full tree is slow, a few pages are enough for reference
+        benchmarks.append(Benchmark(f"parse_market_data_soup[{dataset.split(':')[0]}:{len(soup_pages)}]", lambda soup_pages=soup_pages: (soup_pages,), lambda pages: [get_market_data_from_texts(get_block_texts_from_soup(html)) for html, _ in pages], len(soup_pages)))
+
+    # add_market_data_to_dicts and the feature collection writers
+    with open(os.path.join(DATA_DIRECTORY, f"postcodes_finalized/postcodes_{REAL_CITY}.json"), "r") as file:
+        real_postcodes_string = file.read()
+    synthetic_postcodes_string = json.dumps({"type": "FeatureCollection", "features": get_synthetic_features(number_of_features)})
+    for dataset, postcodes_string in [(f"real:{REAL_CITY}", real_postcodes_string), (f"synthetic:{number_of_features}", synthetic_postcodes_string)]:
+        features = json.loads(postcodes_string)["features"]
+        market_data = get_synthetic_market_data(len(features))
+        output_path = os.path.join(workspace, "postcodes.json")
+        benchmarks.append(Benchmark(f"add_market_data_to_dicts[{dataset}]", lambda postcodes_string=postcodes_string, market_data=market_data: (json.loads(postcodes_string), market_data), lambda postcodes_data, results: asyncio.run(add_market_data_for_all_features(postcodes_data, results)), len(features)))
+        benchmarks.append(Benchmark(f"write_feature_collection[{dataset}]", lambda features=features: (features, output_path), write_feature_collection, len(features)))
+        benchmarks.append(Benchmark(f"json_dump_feature_collection[{dataset}]", lambda features=features: (features, output_path), dump_feature_collection, len(features)))
+
+    # Distance stages, with real post codes and with synthetic post codes, against synthetic destinations
+    destinations, destinations_metadata = get_synthetic_destinations(25)
+    real_origins = [f"{feature['properties']['postnummer']} {REAL_CITY.capitalize()}, Norway" for feature in json.loads(real_postcodes_string)["features"]]
+    benchmarks += get_distance_benchmarks(f"real:{REAL_CITY}", real_origins, destinations, destinations_metadata, workspace)
+    number_of_origins = 500 * scale
+    synthetic_origins = [f"{i:04d} Oslo, Norway" for i in range(number_of_origins)]
+    benchmarks += get_distance_benchmarks(f"synthetic:{number_of_origins}", synthetic_origins, destinations, destinations_metadata, workspace)
+
+    return benchmarks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on real and synthetic data.")
+    parser.add_argument("command", choices=["run", "baseline", "compare"], help="run: print results, baseline: save results as baseline, compare: compare results with baseline")
+    parser.add_argument("--scale", type=int, default=1, help="Multiplier for the size of the synthetic data")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timed runs per benchmark")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative increase counted as a regression by compare")
+    parser.add_argument("--filter", default=None, help="Only run benchmarks with this text in their name")
+    parser.add_argument("--baseline-path", default=BASELINE_PATH, help="Path of the baseline results")
+    arguments = parser.parse_args()
+
+    # Run in a temporary workspace, since stages write to paths relative to the working directory
+    working_directory = os.getcwd()
+    with tempfile.TemporaryDirectory() as workspace:
+        os.chdir(workspace)
+        try:
+            results = run_benchmarks(get_benchmarks(workspace, arguments.scale), arguments.repeat, arguments.filter)
+        finally:
+            os.chdir(working_directory)
+
+    if arguments.command == "baseline":
+        save_results(results, arguments.baseline_path)
+    elif arguments.command == "compare":
+        regressions = compare_results(load_results(arguments.baseline_path), results, arguments.threshold)
+        if regressions:
+            print(f"{len(regressions)} regressions above {arguments.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        print(f"No regressions above {arguments.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import random
+
+
+# Cities used for synthetic "poststed" values
+SYNTHETIC_CITIES = ["OSLO", "BERGEN", "STAVANGER", "BODØ"]
+
+
+def get_synthetic_features(number_of_features: int, vertices_per_ring: int = 200, seed: int = 0) -> list:
+    """Get raw postcode features like Kartverket's export, with one polygon ring of vertices_per_ring points each.
+
+    Args:
+        number_of_features (int): Number of features.
+        vertices_per_ring (int, optional): Number of vertices per ring. Defaults to 200.
+        seed (int, optional): Random seed. Defaults to 0.
+
+    Returns:
+        list: List of GeoJSON features.
+    """
+    generator = random.Random(seed)
+    features = []
+    for i in range(number_of_features):
+        x, y = 10.0 + (i % 100) * 0.01, 59.0 + (i // 100) * 0.01
+        ring = [[round(x + generator.random() * 0.01, 6), round(y + generator.random() * 0.01, 6)] for _ in range(vertices_per_ring - 1)]
+        ring.append(ring[0])
+        features.append({
+            "type": "Feature",
+            "geometry": {"type": "Polygon", "coordinates": [ring]},
+            "properties": {
+                "objtype": "Postnummerområde",
+                "postnummer": f"{i:04d}",
+                "poststed": SYNTHETIC_CITIES[i % len(SYNTHETIC_CITIES)],
+                "kommune": "Synthetic",
+                "oppdateringsdato": "2024-01-01T00:00:00",
+            },
+        })
+    return features
+
+
+def get_synthetic_page(post_code: str, i: int = 0, filler_blocks: int = 3000) -> str:
+    """Get a post code statistics page with the same blocks as the real site, padded with filler markup to a realistic size."""
+    quarter_or_month = "Endring siste kvartal+0,9%" if i % 2 == 0 else "Endring siste måned-1,2%"
+    estates_sold = "Solgte boliger siste  kvartal1 212\xa0boliger" if i % 2 == 0 else "Solgte boliger siste  måned12\xa0boliger"
+    blocks = [
+        f"Endring siste år+5,{i % 10}% siste 12 måneder",
+        f"Kvadratmeterpris{90000 + i:,}".replace(",", " ") + " kr",
+        quarter_or_month,
+        f"Salgstid{20 + i % 30}\xa0dager",
+        estates_sold,
+    ]
+    filler = "".join(f'<div class="css-filler{j % 7}"><a href="/bolig/{j}">Bolig {j} &amp; tomt</a><p>Beskrivelse {post_code} {j}</p></div>' for j in range(filler_blocks))
+    statistics = "".join(f'<div class="css-j9s53t"><p class="label">{block}</p></div>' for block in blocks)
+    return f"<!DOCTYPE html><html><head><title>Prisstatistikk {post_code}</title><script>window.__STATE__ = {{}};</script></head><body>{filler}{statistics}</body></html>"
+
+
+def get_synthetic_market_data(number_of_post_codes: int, seed: int = 0) -> list:
+    """Get market data tuples as returned by extract_market_data."""
+    generator = random.Random(seed)
+    results = []
+    for i in range(number_of_post_codes):
+        is_quarter = i % 2 == 0
+        results.append((
+            round(generator.uniform(-10, 10), 1),
+            generator.randint(30000, 150000),
+            round(generator.uniform(-5, 5), 1) if is_quarter else None,
+            None if is_quarter else round(generator.uniform(-5, 5), 1),
+            generator.randint(7, 120),
+            generator.randint(1, 2000) if is_quarter else None,
+            None if is_quarter else generator.randint(1, 500),
+        ))
+    return results
+
+
+def get_synthetic_destinations(number_of_destinations: int) -> tuple:
+    """Get destinations and destinations metadata like get_destinations in the distance API caller."""
+    destinations = [f"Synthetic gate {i}, 0{150 + i} Oslo, Norway" for i in range(number_of_destinations)]
+    destinations_metadata = {
+        "vinmonopolet": {destination: f"Vinmonopolet {i}" for i, destination in enumerate(destinations) if i % 2 == 0},
+        "shopping_mall": {destination: f"Senter {i}" for i, destination in enumerate(destinations) if i % 3 == 0},
+    }
+    return destinations, destinations_metadata
+
+
+def get_synthetic_distance_matrix(origins: list, destinations: list, seed: int = 0, zero_results_rate: float = 0.02) -> dict:
+    """Get a distance matrix response in the shape returned by the Google Maps Distance Matrix API.
+
+    Args:
+        origins (list): Origin addresses, like "0274 Oslo, Norway".
+        destinations (list): Destination addresses.
+        seed (int, optional): Random seed. Defaults to 0.
+        zero_results_rate (float, optional): Share of elements with status ZERO_RESULTS. Defaults to 0.02.
+
+    Returns:
+        dict: Distance matrix results.
+    """
+    generator = random.Random(seed)
+    rows = []
+    for _ in origins:
+        elements = []
+        for _ in destinations:
+            if generator.random() < zero_results_rate:
+                elements.append({"status": "ZERO_RESULTS"})
+                continue
+            meters = generator.randint(200, 40000)
+            seconds = generator.randint(60, 20000)
+            elements.append({
+                "distance": {"text": f"{meters / 1000:.1f} km", "value": meters},
+                "duration": {"text": f"{seconds // 60} mins", "value": seconds},
+                "status": "OK",
+            })
+        rows.append({"elements": elements})
+    return {
+        "destination_addresses": list(destinations),
+        "origin_addresses": list(origins),
+        "rows": rows,
+        "status": "OK",
+    }
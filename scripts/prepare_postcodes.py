@@ -1,12 +1,85 @@
 import json
 import os
 import asyncio
+from concurrent.futures import ProcessPoolExecutor
 from pprint import pprint
-from processing.clean_geojson import clean_geojson
-from scraper.market_data_scraper import get_market_data_from_post_codes_from_geojson, print_estimated_time_of_retrieval
+from processing.clean_geojson import clean_geojson, partition_geojson
+from processing.simplify_geometry import simplify_geojson
+from processing.topojson_export import export_topojson
+from processing.binary_layer import export_binary_layer
+from processing.publish_outputs import publish_outputs
+from scraper.market_data_scraper import get_market_data_for_cities, print_estimated_time_of_retrieval
+from scraper.http_cache import HTTPCache
 
 
-async def prepare_postcodes():
+def export_city(city: str) -> dict:
+    """Simplify geometries and export topology and binary layer for one city.
+
+    Args:
+        city (str): City.
+
+    Returns:
+        dict: Report from the geometry simplification.
+    """
+    simplification_report = simplify_geojson(city)
+    export_topojson(city)
+    export_binary_layer(city)
+    return simplification_report
+
+
+def run_per_city(function, arguments_per_city: dict, max_workers: int = 1) -> dict:
+    """Run a function for each city, in a process pool if max_workers > 1.
+
+    A failing city does not stop the others, its error is stored in the report instead.
+
+    Args:
+        function (callable): Function to run for each city. Must be defined at module level to be used in a process pool.
+        arguments_per_city (dict): Dictionary with cities as keys, and tuples of arguments to the function as values.
+        max_workers (int, optional): Maximum number of worker processes. Defaults to 1, which runs in the current process.
+
+    Returns:
+        dict: Reports with cities as keys, in the same order as arguments_per_city. Each report has "status" ("succeeded" or "failed") and "result" or "error".
+    """
+    reports = {}
+    
+    # Run in the current process
+    if max_workers <= 1:
+        for city, arguments in arguments_per_city.items():
+            try:
+                reports[city] = {"status": "succeeded", "result": function(*arguments)}
+            except Exception as error:
+                reports[city] = {"status": "failed", "error": repr(error)}
+        return reports
+    
+    # Run in process pool, and collect reports in city order so the merge is deterministic
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {city: executor.submit(function, *arguments) for city, arguments in arguments_per_city.items()}
+        for city, future in futures.items():
+            try:
+                reports[city] = {"status": "succeeded", "result": future.result()}
+            except Exception as error:
+                reports[city] = {"status": "failed", "error": repr(error)}
+    return reports
+
+
+def print_reports(reports: dict) -> None:
+    """Print failed cities from reports."""
+    for city, report in reports.items():
+        if report["status"] == "failed":
+            print(f"- Failed for city {city}: {report['error']}")
+
+
+async def prepare_postcodes(national_geojson_path: str = None, max_workers: int = 1, is_resume: bool = False):
+    """Clean geojson files and get market data for all cities.
+
+    Args:
+        national_geojson_path (str, optional): Path to one geojson source with all cities. If given, all cities are cleaned in a single pass over it. Defaults to None, which cleans each city from its own geojson file.
+        max_workers (int, optional): Maximum number of worker processes for cleaning and geometry work. Defaults to 1.
+        is_resume (bool, optional): Resume scraping from the journals of an earlier run. Defaults to False.
+
+    Returns:
+        None
+    """
     
     # Poststeder
     poststed_cities_dict = {
@@ -24,8 +97,12 @@ async def prepare_postcodes():
     cities = list(poststed_cities_dict.keys())
     
     # Clean geojson files
-    for poststed, city in poststed_cities_dict.items():
-        clean_geojson(poststed, city)
+    if national_geojson_path is not None:
+        partition_geojson(national_geojson_path, poststed_cities_dict)
+    else:
+        reports = run_per_city(clean_geojson, {poststed: (poststed, city) for poststed, city in poststed_cities_dict.items()}, max_workers)
+        print_reports(reports)
+        cities = [city for city in cities if reports[city]["status"] == "succeeded"]        # Skip cities that failed
     
     print("All geojson files cleaned!\n")
     
@@ -34,12 +111,20 @@ async def prepare_postcodes():
     print_estimated_time_of_retrieval(cities, max_requests_per_second=5)
     
     # Get market data from postcodes
-    for city in cities:
-        print(f"Started getting market data for: {city}")
-        await get_market_data_from_post_codes_from_geojson(city)
-        print(f"Finished getting market data for: {city}\n\n")
+    cache = HTTPCache()
+    reports = await get_market_data_for_cities(cities, cache=cache, is_resume=is_resume)
+    cities_with_market_data = [city for city in cities if reports[city]["status"] == "succeeded"]
+    print(f"Cache statistics: {cache.statistics}")
+    print("All market data retrieved!\n")
+    
+    # Simplify geometries into levels of detail, and export topologies and binary layers
+    reports = run_per_city(export_city, {city: (city,) for city in cities_with_market_data}, max_workers)
+    print_reports(reports)
+    
+    print("All geometries simplified and exported!")
     
-    print("All market data retrieved!")
+    # Publish changed outputs to the frontend
+    publish_outputs()
     print("All postcodes prepared!")
     
 
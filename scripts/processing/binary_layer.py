@@ -0,0 +1,303 @@
+import json
+import os
+import sys
+import math
+import mmap
+import struct
+from array import array
+
+
+# File layout:
+#   magic (4 bytes) | version (uint32) | metadata length (uint32) | metadata (UTF-8 JSON, padded)
+#   followed by sections aligned to 8 bytes, described by metadata["sections"] as {name: {"offset", "type", "length"}}.
+# All numbers are little-endian. Coordinates are fixed-point int32 values (coordinate * scale), stored as interleaved x, y.
+MAGIC = b"PCBL"
+VERSION = 1
+HEADER_FORMAT = "<4sII"
+ALIGNMENT = 8
+
+# Fixed-point scale for coordinates, source coordinates have six decimals
+DEFAULT_SCALE = 1000000
+
+# Section types as typecodes of array.array / memoryview.cast
+SECTION_TYPES = {
+    "uint32": "I",
+    "int32": "i",
+    "float64": "d",
+}
+
+
+def get_padding(length: int) -> int:
+    """Get the number of bytes needed to pad a length to ALIGNMENT."""
+    return (ALIGNMENT - length % ALIGNMENT) % ALIGNMENT
+
+
+def to_little_endian(values: array) -> array:
+    """Get values in little-endian byte order, swapped on big-endian machines."""
+    if sys.byteorder == "little":
+        return values
+    values = array(values.typecode, values)
+    values.byteswap()
+    return values
+
+
+def is_numeric_column(features: list, key: str) -> bool:
+    """Check if a property only has numeric (or null) values across all features."""
+    for feature in features:
+        value = feature["properties"].get(key)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+            return False
+    return True
+
+
+def write_binary_layer(features: list, output_path: str, scale: int = DEFAULT_SCALE) -> None:
+    """Write features to a compact binary layer with fixed-point coordinates and columnar numeric properties.
+
+    Geometries are stored as one flat coordinate buffer with offsets per feature (into parts), per part (into rings) and per ring (into points).
+    Numeric properties are stored as float64 columns with NaN for null. Other properties are stored in the metadata.
+
+    Args:
+        features (list): List of GeoJSON features with Polygon or MultiPolygon geometries.
+        output_path (str): Output path for binary layer.
+        scale (int, optional): Fixed-point scale for coordinates. Defaults to DEFAULT_SCALE.
+
+    Returns:
+        None
+    """
+    # Flatten geometries
+    feature_part_offsets = array("I", [0])
+    part_ring_offsets = array("I", [0])
+    ring_point_offsets = array("I", [0])
+    coordinates = array("i")
+    geometry_types = []
+    for feature in features:
+        geometry = feature["geometry"]
+        polygons = [geometry["coordinates"]] if geometry["type"] == "Polygon" else geometry["coordinates"]
+        for polygon in polygons:
+            for ring in polygon:
+                for x, y in ring:
+                    coordinates.append(round(x * scale))
+                    coordinates.append(round(y * scale))
+                ring_point_offsets.append(len(coordinates) // 2)
+            part_ring_offsets.append(len(ring_point_offsets) - 1)
+        feature_part_offsets.append(len(part_ring_offsets) - 1)
+        geometry_types.append(geometry["type"])
+
+    # Split properties into numeric columns and other properties
+    keys = []
+    for feature in features:
+        for key in feature["properties"].keys():
+            if key not in keys:
+                keys.append(key)
+    numeric_columns = {}
+    other_properties = {}
+    for key in keys:
+        if is_numeric_column(features, key):
+            values = [feature["properties"].get(key) for feature in features]
+            numeric_columns[key] = {
+                "values": array("d", [math.nan if value is None else value for value in values]),
+                "is_integer": all(value is None or isinstance(value, int) for value in values),
+            }
+        else:
+            other_properties[key] = [feature["properties"].get(key) for feature in features]
+
+    # Get sections in file order
+    sections = [
+        ("feature_part_offsets", "uint32", feature_part_offsets),
+        ("part_ring_offsets", "uint32", part_ring_offsets),
+        ("ring_point_offsets", "uint32", ring_point_offsets),
+        ("coordinates", "int32", coordinates),
+    ]
+    for key, column in numeric_columns.items():
+        sections.append((f"column:{key}", "float64", column["values"]))
+
+    # Get metadata, section offsets are relative to the start of the data after the metadata
+    metadata = {
+        "number_of_features": len(features),
+        "scale": scale,
+        "geometry_types": geometry_types,
+        "numeric_columns": {key: {"is_integer": column["is_integer"]} for key, column in numeric_columns.items()},
+        "properties": other_properties,
+        "sections": {},
+    }
+    offset = 0
+    for name, section_type, values in sections:
+        metadata["sections"][name] = {"offset": offset, "type": section_type, "length": len(values)}
+        offset += len(values) * values.itemsize
+        offset += get_padding(offset)
+
+    # Write header, metadata and sections
+    metadata_bytes = json.dumps(metadata, separators=(",", ":")).encode()
+    header_length = struct.calcsize(HEADER_FORMAT)
+    metadata_bytes += b" " * get_padding(header_length + len(metadata_bytes))
+    with open(output_path, "wb") as file:
+        file.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION, len(metadata_bytes)))
+        file.write(metadata_bytes)
+        for name, section_type, values in sections:
+            data = to_little_endian(values).tobytes()
+            file.write(data)
+            file.write(b"\0" * get_padding(len(data)))
+
+    return None
+
+
+class BinaryLayer:
+    """Memory-mapped reader for binary layers written by write_binary_layer.
+
+    Sections are exposed as memoryviews into the mapped file, so no data is copied until it is read. On big-endian machines
+    sections are copied and swapped to native byte order instead.
+
+    Usage:
+        with BinaryLayer(path) as layer:
+            prices = layer.get_column("averageSquareMeterPrice")
+            feature = layer.get_feature(0)
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.file = open(path, "rb")
+        self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.buffer)
+
+        # Read header and metadata
+        magic, version, metadata_length = struct.unpack_from(HEADER_FORMAT, self.buffer, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Not a binary layer: {path}")
+        if version != VERSION:
+            raise ValueError(f"Unsupported binary layer version {version} in {path}")
+        header_length = struct.calcsize(HEADER_FORMAT)
+        self.metadata = json.loads(bytes(self.view[header_length:header_length + metadata_length]))
+        self.data_offset = header_length + metadata_length
+
+        # Map sections
+        self.feature_part_offsets = self.get_section("feature_part_offsets")
+        self.part_ring_offsets = self.get_section("part_ring_offsets")
+        self.ring_point_offsets = self.get_section("ring_point_offsets")
+        self.coordinates = self.get_section("coordinates")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def __len__(self) -> int:
+        return self.metadata["number_of_features"]
+
+    def close(self) -> None:
+
+        # Release views before closing the map
+        self.feature_part_offsets.release()
+        self.part_ring_offsets.release()
+        self.ring_point_offsets.release()
+        self.coordinates.release()
+        self.view.release()
+        self.buffer.close()
+        self.file.close()
+        return None
+
+    def get_section(self, name: str) -> memoryview:
+        section = self.metadata["sections"][name]
+        start = self.data_offset + section["offset"]
+        typecode = SECTION_TYPES[section["type"]]
+        end = start + section["length"] * struct.calcsize(typecode)
+        if sys.byteorder != "little":
+            values = array(typecode)
+            values.frombytes(self.view[start:end])
+            values.byteswap()
+            return memoryview(values)
+        return self.view[start:end].cast(typecode)
+
+    def get_column(self, key: str) -> memoryview:
+        """Get a numeric property column as float64 values, with NaN for null. Release the view before closing the layer."""
+        return self.get_section(f"column:{key}")
+
+    def get_geometry(self, i: int) -> dict:
+        """Get the geometry of a feature as a GeoJSON geometry."""
+        scale = self.metadata["scale"]
+        polygons = []
+        for part in range(self.feature_part_offsets[i], self.feature_part_offsets[i + 1]):
+            polygon = []
+            for ring in range(self.part_ring_offsets[part], self.part_ring_offsets[part + 1]):
+                start, end = self.ring_point_offsets[ring], self.ring_point_offsets[ring + 1]
+                polygon.append([[self.coordinates[2 * j] / scale, self.coordinates[2 * j + 1] / scale] for j in range(start, end)])
+            polygons.append(polygon)
+
+        geometry_type = self.metadata["geometry_types"][i]
+        return {
+            "type": geometry_type,
+            "coordinates": polygons[0] if geometry_type == "Polygon" else polygons,
+        }
+
+    def get_properties(self, i: int) -> dict:
+        """Get the properties of a feature."""
+        properties = {key: values[i] for key, values in self.metadata["properties"].items()}
+        for key, column in self.metadata["numeric_columns"].items():
+            value = self.get_column(key)[i]
+            if math.isnan(value):
+                properties[key] = None
+            elif column["is_integer"]:
+                properties[key] = int(value)
+            else:
+                properties[key] = value
+        return properties
+
+    def get_feature(self, i: int) -> dict:
+        """Get a feature as a GeoJSON feature."""
+        return {
+            "type": "Feature",
+            "geometry": self.get_geometry(i),
+            "properties": self.get_properties(i),
+        }
+
+    def get_features(self) -> list:
+        """Get all features as GeoJSON features."""
+        return [self.get_feature(i) for i in range(len(self))]
+
+
+def export_binary_layer(city: str) -> None:
+    """Export a finalized postcodes layer as a binary layer.
+
+    Args:
+        city (str): City.
+
+    Returns:
+        None
+    """
+
+    # Get postcodes data
+    # postcodes_finalized_path = os.path.join(os.getcwd(), f"../data/postcodes_finalized/postcodes_{city}.json")
+    postcodes_finalized_path = os.path.join(os.getcwd(), f"data/postcodes_finalized/postcodes_{city}.json")      # Use when running script from prepare_postcodes.py
+    with open(postcodes_finalized_path, "r") as file:
+        postcodes_data = json.load(file)
+
+    # Save binary layer
+    # postcodes_binary_path = os.path.join(os.getcwd(), f"../data/postcodes_binary/postcodes_{city}.bin")
+    postcodes_binary_path = os.path.join(os.getcwd(), f"data/postcodes_binary/postcodes_{city}.bin")      # Use when running script from prepare_postcodes.py
+    os.makedirs(os.path.dirname(postcodes_binary_path), exist_ok=True)
+    write_binary_layer(postcodes_data["features"], postcodes_binary_path)
+
+    print(f"Exported {len(postcodes_data['features'])} post codes for city {city} ({os.path.getsize(postcodes_finalized_path)} -> {os.path.getsize(postcodes_binary_path)} bytes) to {postcodes_binary_path}")
+    return None
+
+
+def main():
+
+    cities = [
+        "oslo",
+        "drammen",
+        "kristiansand",
+        "stavanger",
+        "bergen",
+        "trondelag",
+        "bodo",
+        "tromso",
+    ]
+
+    for city in cities:
+        export_binary_layer(city)
+
+
+if __name__ == "__main__":
+    main()
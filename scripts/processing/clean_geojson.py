@@ -1,10 +1,39 @@
 import json
 import os
 import pandas as pd
+from contextlib import ExitStack
 from pprint import pprint
+from processing.geojson_stream import iter_geojson_features, FeatureCollectionWriter
 
 
-def clean_geojson(poststed: str, city: str) -> None:
+def get_cleaned_feature(feature: dict) -> dict:
+    """Get feature with only necessary data from a raw postcode feature.
+
+    Args:
+        feature (dict): Postcode feature from geojson.
+
+    Returns:
+        dict: Cleaned feature.
+    """
+    
+    # Clean "poststed" names that are parsed incorrectly
+    poststed = feature["properties"]["poststed"]
+    if poststed == "KRISTIANSAND S": poststed = "KRISTIANSAND"
+    if poststed == "BODÃ˜": poststed = "BODØ"
+    if poststed == "TROMSÃ˜": poststed = "TROMSØ"
+    
+    return {
+        "type": feature["type"],
+        "geometry": feature["geometry"],
+        "properties": {
+            "objtype": feature["properties"]["objtype"],
+            "postnummer": feature["properties"]["postnummer"],
+            "poststed": poststed, 
+        }
+    }
+
+
+def clean_geojson(poststed: str, city: str) -> int:
     
     # Paths
     # geojson_path = f"../data/geojson/postcodes_{poststed}.geojson"
@@ -12,41 +41,58 @@ def clean_geojson(poststed: str, city: str) -> None:
     geojson_path = f"data/geojson/postcodes_{poststed}.geojson"                         # Use when running script from prepare_postcodes.py
     geojson_cleaned_path = f"data/postcodes_cleaned/postcodes_{poststed}.json"          # Use when running script from prepare_postcodes.py
 
-    # Load geojson
-    with open(geojson_path, "r") as f:
-        geojson_data = json.load(f)
+    # Stream features from geojson and save only necessary data
+    with FeatureCollectionWriter(geojson_cleaned_path) as writer:
+        for feature in iter_geojson_features(geojson_path):
+            if feature["properties"]["poststed"] == city:       # Filter only features with "poststed" = city
+                writer.write(get_cleaned_feature(feature))
+        
+    print(f"Geojson with {writer.number_of_features} cleaned for {city} and saved to {geojson_cleaned_path}!")
+    return writer.number_of_features
+
+def partition_geojson(geojson_path: str, poststed_cities_dict: dict) -> dict:
+    """Clean geojson for all cities in a single pass over one (national) geojson source.
+
+    Each feature is routed to every city output with a matching "poststed", and all outputs are written in the same pass.
+
+    Args:
+        geojson_path (str): Path to geojson source containing all cities.
+        poststed_cities_dict (dict): Dictionary with poststed (output name) as keys, and city ("poststed" in geojson) as values.
+
+    Returns:
+        dict: Number of cleaned features for each poststed.
+    """
     
-    # Get only necessary data
-    geojson_cleaned_data = {}
-    geojson_cleaned_data["type"] = geojson_data["postnummeromrader.postnummeromrade"]["type"]
-    geojson_cleaned_data["features"] = []
-    for i, feature in enumerate(geojson_data["postnummeromrader.postnummeromrade"]["features"]):
-        if feature["properties"]["poststed"] == city:       # Filter only features with "poststed" = city
-            
-            # Clean "poststed" names that are parsed incorrectly
-            poststed = feature["properties"]["poststed"]
-            if poststed == "KRISTIANSAND S": poststed = "KRISTIANSAND"
-            if poststed == "BODÃ˜": poststed = "BODØ"
-            if poststed == "TROMSÃ˜": poststed = "TROMSØ"
-            
-            # Append cleaned data
-            geojson_cleaned_data["features"].append({
-                "type": feature["type"],
-                "geometry": feature["geometry"],
-                "properties": {
-                    "objtype": feature["properties"]["objtype"],
-                    "postnummer": feature["properties"]["postnummer"],
-                    "poststed": poststed, 
-                }
-            })
+    # Get output names for each city, several outputs may share the same city
+    poststeder_per_city = {}
+    for poststed, city in poststed_cities_dict.items():
+        poststeder_per_city.setdefault(city, []).append(poststed)
     
-    # Save cleaned geojson
-    with open(geojson_cleaned_path, "w") as f:
-        json.dump(geojson_cleaned_data, f, indent=2)
+    with ExitStack() as stack:
+        
+        # Open one writer per output
+        writers = {}
+        for poststed in poststed_cities_dict.keys():
+            # geojson_cleaned_path = f"../data/postcodes_cleaned/postcodes_{poststed}.json"
+            geojson_cleaned_path = f"data/postcodes_cleaned/postcodes_{poststed}.json"          # Use when running script from prepare_postcodes.py
+            writers[poststed] = stack.enter_context(FeatureCollectionWriter(geojson_cleaned_path))
         
-    print(f"Geojson with {len(geojson_cleaned_data['features'])} cleaned for {city} and saved to {geojson_cleaned_path}!")
+        # Route each feature to every matching output
+        for feature in iter_geojson_features(geojson_path):
+            poststeder = poststeder_per_city.get(feature["properties"]["poststed"])
+            if poststeder is None:
+                continue
+            cleaned_feature = get_cleaned_feature(feature)
+            for poststed in poststeder:
+                writers[poststed].write(cleaned_feature)
+    
+    number_of_features = {poststed: writer.number_of_features for poststed, writer in writers.items()}
+    for poststed, city in poststed_cities_dict.items():
+        print(f"Geojson with {number_of_features[poststed]} cleaned for {city} and saved to {writers[poststed].output_path}!")
+    
+    return number_of_features
 
-def main():
+def main(national_geojson_path: str = None):
     
     # Poststeder
     poststed_cities_dict = {
@@ -60,9 +106,12 @@ def main():
         "tromso": "TROMSÃ˜",                # Special character when parsing "poststed" from geojson
     }
     
-    # Clean geojson files
-    for poststed, city in poststed_cities_dict.items():
-        clean_geojson(poststed, city)
+    # Clean geojson files, in a single pass if all cities are in one source
+    if national_geojson_path is not None:
+        partition_geojson(national_geojson_path, poststed_cities_dict)
+    else:
+        for poststed, city in poststed_cities_dict.items():
+            clean_geojson(poststed, city)
     
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,12 +1,23 @@
 import os
+import sys
 import json
-import math
-from tqdm import tqdm
+import numpy as np
 from datetime import datetime
 from pprint import pprint
 from dotenv import load_dotenv
+
+# Run from scripts/processing, where the ../../frontend paths below resolve, with the packages in scripts/ importable
+SCRIPTS_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SCRIPTS_DIRECTORY not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIRECTORY)
+
+from processing.publish_outputs import write_json_if_changed
 load_dotenv()
 
+# Travel modes and destination categories of distance_data.json, in the order of the array axes
+TRAVEL_TYPES = ["walking", "bicycling", "transit", "driving"]
+CATEGORIES = ["vinmonopolet", "shopping_mall"]
+
 def get_postcodes_from_geojson() -> dict:
     """Get  postcodes from GeoJSON file.
 
@@ -36,59 +47,134 @@ def get_distance_postcodes_destinations() -> dict:
         distance_postcodes_destinations = json.load(f)
     return distance_postcodes_destinations
 
-def get_nearest_location_for_postcode(postcode: str, distance_postcodes_destinations: dict) -> dict:
-    """Get the nearest location for each category for a given postcode.
+class DistanceArrays:
+    """Distance data of postcodes and destinations as dense arrays, for nearest and top-k lookups without walking the nested dictionaries.
+
+    values has shape (postcode, destination, mode, 2) with seconds and meters. is_available masks the cells with status "OK",
+    so ZERO_RESULTS, cells left out by the straight-line pre-filter and missing destinations are never picked, and
+    is_in_category has shape (category, postcode, destination). order is the position of each destination among the kept
+    destinations of its postcode, so ties are broken like the loop over the dictionary did, by the first destination. Empty
+    destinations without a category are not counted, which keeps order below the number of destinations.
+
+    Usage:
+        arrays = DistanceArrays(postcodes, distance_postcodes_destinations, modes=["walking"])
+        destination_indices = arrays.get_nearest_indices(mode="walking", k=3)
+    """
+
+    def __init__(self, postcodes: list, distance_postcodes_destinations: dict, modes: list = None) -> None:
+        """Load the distance data into arrays.
+
+        Args:
+            postcodes (list): List of postcodes, the first axis.
+            distance_postcodes_destinations (dict): Distance data for postcodes and destinations.
+            modes (list, optional): Travel modes to load, the other modes are left unavailable. Defaults to TRAVEL_TYPES.
+        """
+        self.postcodes = postcodes
+        self.destinations = []
+        self.distance_postcodes_destinations = distance_postcodes_destinations
+        modes = TRAVEL_TYPES if modes is None else modes
+
+        # Collect cells in one pass over the dictionaries, with one flat list per axis
+        destination_indices = {}
+        postcode_column, destination_column, order_column = [], [], []
+        category_columns = {category: [] for category in CATEGORIES}           # Cell indices per category
+        seconds_columns = {mode: [] for mode in modes}
+        meters_columns = {mode: [] for mode in modes}
+        nan = float("nan")
+        for postcode_index, postcode in enumerate(postcodes):
+            order = 0
+            for destination_address, destination in distance_postcodes_destinations.get(postcode, {}).items():
+                travel_data = None
+                for category, category_data in destination.items():
+                    if category in category_columns:
+                        category_columns[category].append(len(postcode_column))
+                        travel_data = category_data["travel_data"]             # Same elements for every category of a destination
+                if travel_data is None:
+                    continue
+                destination_index = destination_indices.get(destination_address)
+                if destination_index is None:
+                    destination_index = destination_indices[destination_address] = len(self.destinations)
+                    self.destinations.append(destination_address)
+                postcode_column.append(postcode_index)
+                destination_column.append(destination_index)
+                order_column.append(order)
+                order += 1
+                for mode in modes:
+                    element = travel_data[mode]
+                    if element["status"] == "OK":
+                        seconds_columns[mode].append(element["duration"]["seconds"])
+                        meters_columns[mode].append(element["distance"]["meters"])
+                    else:
+                        seconds_columns[mode].append(nan)
+                        meters_columns[mode].append(nan)
+
+        # Scatter cells into dense arrays
+        shape = (len(postcodes), len(self.destinations))
+        postcode_column = np.array(postcode_column, dtype=np.int64)
+        destination_column = np.array(destination_column, dtype=np.int64)
+        self.values = np.full(shape + (len(TRAVEL_TYPES), 2), np.nan, dtype=np.float32)
+        for mode in modes:
+            self.values[postcode_column, destination_column, TRAVEL_TYPES.index(mode)] = np.column_stack([np.array(seconds_columns[mode], dtype=np.float32), np.array(meters_columns[mode], dtype=np.float32)]).reshape(-1, 2)
+        self.is_available = ~np.isnan(self.values[:, :, :, 0])
+        self.is_in_category = np.zeros((len(CATEGORIES),) + shape, dtype=bool)
+        for category_index, category in enumerate(CATEGORIES):
+            cell_indices = np.array(category_columns[category], dtype=np.int64)
+            self.is_in_category[category_index, postcode_column[cell_indices], destination_column[cell_indices]] = True
+        self.order = np.zeros(shape, dtype=np.int64)
+        self.order[postcode_column, destination_column] = order_column
+
+    def get_nearest_indices(self, mode: str = "walking", k: int = 1, value: str = "seconds") -> np.ndarray:
+        """Get the k nearest destinations per category and postcode for a travel mode.
+
+        Args:
+            mode (str, optional): Travel mode. Defaults to "walking".
+            k (int, optional): Number of destinations. Defaults to 1.
+            value (str, optional): "seconds" or "meters". Defaults to "seconds".
+
+        Returns:
+            np.ndarray: Destination indices with shape (category, postcode, k), nearest first, -1 where a category has fewer than k available destinations.
+        """
+        mode_index = TRAVEL_TYPES.index(mode)
+        values = self.values[:, :, mode_index, 0 if value == "seconds" else 1]
+
+        # Key of value and order in one float, order is below the number of destinations and integers up to 2 ** 53 are exact,
+        # so ties go to the first destination
+        keys = values.astype(np.float64) * max(1, len(self.destinations)) + self.order
+        keys = np.where(self.is_available[None, :, :, mode_index] & self.is_in_category, keys[None], np.inf)
+        nearest_indices = np.full(keys.shape[:2] + (k,), -1, dtype=np.int64)
+        number_of_candidates = min(k, keys.shape[2])
+        if number_of_candidates == 0:
+            return nearest_indices
+        if number_of_candidates == 1:
+            indices = np.argmin(keys, axis=2)[:, :, None]
+        else:
+            indices = np.argpartition(keys, number_of_candidates - 1, axis=2)[:, :, :number_of_candidates]
+            indices = np.take_along_axis(indices, np.argsort(np.take_along_axis(keys, indices, axis=2), axis=2, kind="stable"), axis=2)
+        nearest_indices[:, :, :number_of_candidates] = np.where(np.isfinite(np.take_along_axis(keys, indices, axis=2)), indices, -1)
+        return nearest_indices
+
+    def get_destination(self, postcode_index: int, destination_index: int, category: str) -> dict:
+        """Get the destination data of a cell, as stored in the dictionaries."""
+        return self.distance_postcodes_destinations[self.postcodes[postcode_index]][self.destinations[destination_index]][category]
+
+
+def get_nearest_location(nearest_location_per_category: dict) -> dict:
+    """Format the nearest destination of each category for distance_data.json.
 
     Args:
-        postcode (str): Postcode.
-        distance_postcodes_destinations (dict): Distance data for postcodes and destinations.
+        nearest_location_per_category (dict): Destination data with categories as keys.
 
     Returns:
         dict: Nearest location dictionary with nearest location for each category.
     """
-    nearest_location = {}
-    nearest_location_per_category = {}
-    travel_types = ["walking", "bicycling", "transit", "driving"]
-    categories = ["vinmonopolet", "shopping_mall"]
-    
-    # Find the nearest location for each category for the given postcode
-    for category in categories:
-        
-        # Initialize the category in the nearest location dictionary
-        nearest_location[category] = {}
-        
-        # Initialize the minimum duration in seconds
-        min_duration_seconds = math.inf
-    
-        # Find the nearest location for each category and store the data in a new format
-        for destination_address in distance_postcodes_destinations[postcode].keys():
-            
-            # Check if destination is not available (empty)
-            if distance_postcodes_destinations[postcode][destination_address].__len__() == 0:
-                continue
-            
-            # Check if category is not available (no data on category)
-            if category not in list(distance_postcodes_destinations[postcode][destination_address].keys()):
-                continue
-            
-            # Check if destination is not available (no available travel routes)
-            if distance_postcodes_destinations[postcode][destination_address][category]["travel_data"]["walking"]["status"] == "ZERO_RESULTS":
-                continue
-            
-            # Add variable to make code more readable
-            destination = distance_postcodes_destinations[postcode][destination_address][category]
-            
-            # Find the nearest location in terms of walking duration in seconds
-            if destination["travel_data"]["walking"]["duration"]["seconds"] < min_duration_seconds:
-                nearest_location_per_category[category] = destination
-                min_duration_seconds = destination["travel_data"]["walking"]["duration"]["seconds"]
+    nearest_location = {category: {} for category in CATEGORIES}
     
     # Find the nearest location for each category
     for category in nearest_location_per_category.keys():
     
         # Define foromat of the "travel_data" key in the nearest_location dictionary
         travel_data = {}
-        for travel_type in travel_types:
+        for travel_type in TRAVEL_TYPES:
             try:
                 travel_data[travel_type] = {
                     "distance": {
@@ -127,6 +213,40 @@ def get_nearest_location_for_postcode(postcode: str, distance_postcodes_destinat
         nearest_location[category]["travel_data"] = travel_data
                  
     return nearest_location
+
+def get_nearest_locations_for_postcodes(postcodes: list, distance_postcodes_destinations: dict) -> dict:
+    """Get the nearest location by walking time for each category, for all postcodes at once.
+
+    Args:
+        postcodes (list): List of postcodes.
+        distance_postcodes_destinations (dict): Distance data for postcodes and destinations.
+
+    Returns:
+        dict: Nearest location dictionary with postcodes as keys.
+    """
+    arrays = DistanceArrays(postcodes, distance_postcodes_destinations, modes=["walking"])
+    nearest_indices = arrays.get_nearest_indices(mode="walking", k=1)[:, :, 0]
+    nearest_locations = {}
+    for postcode_index, postcode in enumerate(postcodes):
+        nearest_location_per_category = {}
+        for category_index, category in enumerate(CATEGORIES):
+            destination_index = nearest_indices[category_index, postcode_index]
+            if destination_index >= 0:
+                nearest_location_per_category[category] = arrays.get_destination(postcode_index, destination_index, category)
+        nearest_locations[postcode] = get_nearest_location(nearest_location_per_category)
+    return nearest_locations
+
+def get_nearest_location_for_postcode(postcode: str, distance_postcodes_destinations: dict) -> dict:
+    """Get the nearest location for each category for a given postcode.
+
+    Args:
+        postcode (str): Postcode.
+        distance_postcodes_destinations (dict): Distance data for postcodes and destinations.
+
+    Returns:
+        dict: Nearest location dictionary with nearest location for each category.
+    """
+    return get_nearest_locations_for_postcodes([postcode], distance_postcodes_destinations)[postcode]
     
 def store_distance_data(distance_data: dict) -> None:
     """Store distance data in a JSON file.
@@ -138,8 +258,7 @@ def store_distance_data(distance_data: dict) -> None:
         None
     """
     output_path = os.path.join(os.getcwd(), "../../frontend/public/data/distance_data.json")
-    with open(output_path, "w") as f:
-        json.dump(distance_data, f, indent=2)
+    write_json_if_changed(output_path, distance_data)          # Skip unchanged data, so browser caches stay valid
     
     
 def format_and_store_data():
@@ -160,10 +279,10 @@ def format_and_store_data():
     print("Data retrieved successfully.\n")
     
     print("Formatting data...")
-    for postcode in tqdm(postcodes):
-        nearest_location = get_nearest_location_for_postcode(postcode, distance_postcodes_destinations)
+    nearest_locations = get_nearest_locations_for_postcodes(postcodes, distance_postcodes_destinations)
+    for postcode in postcodes:
         distance_data[postcode] = {
-            "nearest_location": nearest_location
+            "nearest_location": nearest_locations[postcode]
         }
     print("Data formatted successfully.\n")
     
@@ -177,4 +296,5 @@ def main():
     format_and_store_data()
     print("Script executed successfully.")
     
-main()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import json
+import os
+import re
+
+
+# Read size used when pulling more of the source file into the buffer
+CHUNK_SIZE = 64 * 1024
+
+# Matches the start of the "features" array in a FeatureCollection
+FEATURES_ARRAY_PATTERN = re.compile(r'"features"\s*:\s*\[')
+
+
+def iter_geojson_features(geojson_path: str, chunk_size: int = CHUNK_SIZE):
+    """Iterate over the features of a GeoJSON FeatureCollection one feature at a time.
+
+    Only the feature currently being decoded is kept in memory, so peak memory does not grow with the size of the source file.
+    Works for plain FeatureCollections and for wrapped exports like Kartverket's {"postnummeromrader.postnummeromrade": {...}}.
+
+    Args:
+        geojson_path (str): Path to GeoJSON file.
+        chunk_size (int, optional): Number of characters read from the file at a time. Defaults to CHUNK_SIZE.
+
+    Yields:
+        dict: One GeoJSON feature.
+    """
+
+    decoder = json.JSONDecoder()
+
+    with open(geojson_path, "r") as file:
+
+        # Read until the start of the "features" array is found
+        buffer = ""
+        while True:
+            match = FEATURES_ARRAY_PATTERN.search(buffer)
+            if match is not None:
+                break
+            chunk = file.read(chunk_size)
+            if not chunk:
+                raise ValueError(f"No \"features\" array found in {geojson_path}")
+            buffer += chunk
+        buffer = buffer[match.end():]
+        position = 0
+        is_end_of_file = False
+
+        # Decode one feature at a time
+        while True:
+
+            # Skip whitespace and separators between features
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+
+            # Refill buffer if all read data is consumed
+            if position >= len(buffer):
+                if is_end_of_file:
+                    raise ValueError(f"Unexpected end of file in \"features\" array of {geojson_path}")
+                buffer = file.read(chunk_size)
+                position = 0
+                is_end_of_file = not buffer
+                continue
+
+            # Check for end of "features" array
+            if buffer[position] == "]":
+                return
+
+            # Decode feature, reading more data if the feature is incomplete
+            try:
+                feature, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if is_end_of_file:
+                    raise
+                chunk = file.read(max(chunk_size, len(buffer) - position))         # Grow reads for large features to keep decoding linear
+                buffer = buffer[position:] + chunk
+                position = 0
+                is_end_of_file = not chunk
+                continue
+
+            yield feature
+
+            # Drop decoded data from buffer
+            buffer = buffer[end:]
+            position = 0
+
+
+class FeatureCollectionWriter:
+    """Write a GeoJSON FeatureCollection to file one feature at a time.
+
+    The output is identical to json.dump({"type": ..., "features": [...]}, file, indent=indent), without holding all features in memory.
+    Features are written to a temporary file that replaces the output on close, so a failed run keeps the previous output.
+
+    Usage:
+        with FeatureCollectionWriter(output_path) as writer:
+            for feature in features:
+                writer.write(feature)
+    """
+
+    def __init__(self, output_path: str, collection_type: str = "FeatureCollection", indent: int = 2) -> None:
+        self.output_path = output_path
+        self.collection_type = collection_type
+        self.indent = indent
+        self.temporary_path = output_path + ".tmp"
+        self.number_of_features = 0
+        self.file = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.discard()
+        else:
+            self.close()
+        return False
+
+    def open(self) -> None:
+        self.file = open(self.temporary_path, "w")
+        self.number_of_features = 0
+        indentation = " " * self.indent
+        self.file.write("{\n")
+        self.file.write(f"{indentation}\"type\": {json.dumps(self.collection_type)},\n")
+        self.file.write(f"{indentation}\"features\": [")
+        return None
+
+    def write(self, feature: dict) -> None:
+
+        # Indent feature to its position inside the "features" array
+        feature_indentation = " " * (self.indent * 2)
+        feature_string = json.dumps(feature, indent=self.indent).replace("\n", "\n" + feature_indentation)
+
+        # Separate features with commas
+        separator = ",\n" if self.number_of_features > 0 else "\n"
+        self.file.write(separator + feature_indentation + feature_string)
+        self.number_of_features += 1
+        return None
+
+    def close(self) -> None:
+        if self.file is None:
+            return None
+
+        # Close "features" array and collection
+        if self.number_of_features > 0:
+            self.file.write("\n" + " " * self.indent + "]\n}")
+        else:
+            self.file.write("]\n}")
+        self.file.close()
+        self.file = None
+        os.replace(self.temporary_path, self.output_path)             # Replace atomically, so readers never see a partial file
+        return None
+
+    def discard(self) -> None:
+        """Remove the partial output of a failed run, and keep the previous output."""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if os.path.exists(self.temporary_path):
+            os.remove(self.temporary_path)
+        return None
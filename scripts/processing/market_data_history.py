@@ -0,0 +1,203 @@
+import os
+import json
+from datetime import date
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+
+# Snapshots are stored as {HISTORY_DIRECTORY}/city={city}/run_date={YYYY-MM-DD}/snapshot.parquet
+# HISTORY_DIRECTORY = "../data/market_data_history"
+HISTORY_DIRECTORY = "data/market_data_history"          # Use when running script from prepare_postcodes.py
+
+# Columns of a snapshot, in the order of the market data in postcodes_market_data
+SNAPSHOT_SCHEMA = pa.schema([
+    ("postnummer", pa.string()),
+    ("averageSquareMeterPrice", pa.float64()),
+    ("pricePercentageChangeLastYear", pa.float64()),
+    ("pricePercentageChangeLastQuarter", pa.float64()),
+    ("pricePercentageChangeLastMonth", pa.float64()),
+    ("averageSalesTimeInDays", pa.float64()),
+    ("numberOfEstatesSoldLastQuarter", pa.float64()),
+    ("numberOfEstatesSoldLastMonth", pa.float64()),
+])
+PARTITIONING = ds.partitioning(pa.schema([("city", pa.string()), ("run_date", pa.string())]), flavor="hive")
+
+
+def get_snapshot_path(city: str, run_date: str, history_directory: str = HISTORY_DIRECTORY) -> str:
+    return os.path.join(history_directory, f"city={city}", f"run_date={run_date}", "snapshot.parquet")
+
+
+def append_snapshot(city: str, postcodes_market_data: dict, run_date: str = None, history_directory: str = HISTORY_DIRECTORY) -> str:
+    """Append the market data of a run as a dated snapshot for a city.
+
+    Earlier snapshots are never changed. A rerun on the same date replaces the snapshot of that date atomically.
+
+    Args:
+        city (str): City.
+        postcodes_market_data (dict): Market data with postcodes as keys, as written to postcodes_market_data_{city}.json.
+        run_date (str, optional): Date of the run as YYYY-MM-DD. Defaults to today.
+        history_directory (str, optional): Directory of the store. Defaults to HISTORY_DIRECTORY.
+
+    Returns:
+        str: Path of the snapshot.
+    """
+    if run_date is None:
+        run_date = date.today().isoformat()
+
+    # Get columns, with NaN for missing values
+    columns = {"postnummer": list(postcodes_market_data.keys())}
+    for field in SNAPSHOT_SCHEMA.names[1:]:
+        columns[field] = [postcodes_market_data[postcode].get(field) for postcode in columns["postnummer"]]
+    table = pa.Table.from_pydict(columns, schema=SNAPSHOT_SCHEMA)
+
+    # Write snapshot, replacing atomically so readers never see a partial file
+    snapshot_path = get_snapshot_path(city, run_date, history_directory)
+    os.makedirs(os.path.dirname(snapshot_path), exist_ok=True)
+    temporary_path = os.path.join(os.path.dirname(snapshot_path), ".snapshot.parquet.tmp")         # Hidden, so loaders skip it
+    pq.write_table(table, temporary_path, compression="zstd")
+    os.replace(temporary_path, snapshot_path)
+    return snapshot_path
+
+
+def get_run_dates(city: str, history_directory: str = HISTORY_DIRECTORY) -> list:
+    """Get the run dates with a snapshot for a city, oldest first, from the directory names only."""
+    city_directory = os.path.join(history_directory, f"city={city}")
+    if not os.path.isdir(city_directory):
+        return []
+    return sorted(name.split("=", 1)[1] for name in os.listdir(city_directory) if name.startswith("run_date=") and os.path.exists(os.path.join(city_directory, name, "snapshot.parquet")))
+
+
+def load_history(cities: list = None, start_date: str = None, end_date: str = None, run_dates: list = None, post_codes: list = None, columns: list = None, history_directory: str = HISTORY_DIRECTORY) -> pd.DataFrame:
+    """Load snapshots, reading only the partitions, row groups and columns that are needed.
+
+    Filters on city and run date prune whole partitions, and the post code filter and column selection are pushed down to the Parquet reader.
+
+    Args:
+        cities (list, optional): Only these cities. Defaults to all.
+        start_date (str, optional): Only runs on or after this date (YYYY-MM-DD). Defaults to None.
+        end_date (str, optional): Only runs on or before this date (YYYY-MM-DD). Defaults to None.
+        run_dates (list, optional): Only these run dates. Defaults to all.
+        post_codes (list, optional): Only these post codes. Defaults to all.
+        columns (list, optional): Only these columns, "city" and "run_date" included. Defaults to all.
+        history_directory (str, optional): Directory of the store. Defaults to HISTORY_DIRECTORY.
+
+    Returns:
+        pd.DataFrame: One row per post code and run, with "city" and "run_date" columns.
+    """
+    schema = SNAPSHOT_SCHEMA.append(pa.field("city", pa.string())).append(pa.field("run_date", pa.string()))
+    if not os.path.isdir(history_directory):
+        return schema.empty_table().to_pandas() if columns is None else schema.empty_table().select(columns).to_pandas()
+    dataset = ds.dataset(history_directory, format="parquet", partitioning=PARTITIONING, schema=schema)
+
+    # Build filter expression
+    expressions = []
+    if cities is not None:
+        expressions.append(ds.field("city").isin(pa.array(cities, pa.string())))            # Typed, so an empty list is not a null array
+    if start_date is not None:
+        expressions.append(ds.field("run_date") >= start_date)
+    if end_date is not None:
+        expressions.append(ds.field("run_date") <= end_date)
+    if run_dates is not None:
+        expressions.append(ds.field("run_date").isin(pa.array(run_dates, pa.string())))
+    if post_codes is not None:
+        expressions.append(ds.field("postnummer").isin(pa.array(post_codes, pa.string())))
+    expression = None
+    for condition in expressions:
+        expression = condition if expression is None else expression & condition
+
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+
+def get_price_trend(cities: list, number_of_runs: int = 5, post_codes: list = None, history_directory: str = HISTORY_DIRECTORY) -> pd.DataFrame:
+    """Get the square meter price trend per post code over the last runs of each city.
+
+    Only the last number_of_runs snapshots and the needed columns are read, and the trend is computed with vectorized group sums.
+
+    Args:
+        cities (list): Cities.
+        number_of_runs (int, optional): Number of most recent runs per city. Defaults to 5.
+        post_codes (list, optional): Only these post codes. Defaults to all.
+        history_directory (str, optional): Directory of the store. Defaults to HISTORY_DIRECTORY.
+
+    Returns:
+        pd.DataFrame: One row per city and post code with number of runs, first and last price, change in percent,
+            and the least squares slope in price per day.
+    """
+
+    # Get the last run dates of each city from the partition names, without reading any data
+    last_run_dates = {city: get_run_dates(city, history_directory)[-number_of_runs:] for city in cities}
+    run_dates = sorted({run_date for city_run_dates in last_run_dates.values() for run_date in city_run_dates})
+    if not run_dates:               # No snapshots yet, like on the first run or for a new city
+        return pd.DataFrame(columns=["city", "postnummer", "numberOfRuns", "firstAverageSquareMeterPrice", "lastAverageSquareMeterPrice", "slopePerDay", "percentageChange"])
+    history = load_history(cities=cities, run_dates=run_dates, post_codes=post_codes, columns=["city", "postnummer", "run_date", "averageSquareMeterPrice"], history_directory=history_directory)
+    history = history.dropna(subset=["averageSquareMeterPrice"])
+
+    # Keep only the last runs of each city, since cities can have different run dates
+    is_last_run = np.zeros(len(history), dtype=bool)
+    for city, city_run_dates in last_run_dates.items():
+        is_last_run |= (history["city"].to_numpy() == city) & history["run_date"].isin(city_run_dates).to_numpy()
+    history = history[is_last_run].sort_values(["city", "postnummer", "run_date"])
+
+    # Least squares slope per post code from group sums: (n * Σxy - Σx * Σy) / (n * Σx² - (Σx)²)
+    days = (pd.to_datetime(history["run_date"]) - pd.Timestamp("1970-01-01")).dt.days.astype(float)
+    x = days - days.mean() if len(days) > 0 else days          # Center to keep the sums small
+    y = history["averageSquareMeterPrice"]
+    sums = pd.DataFrame({
+        "city": history["city"],
+        "postnummer": history["postnummer"],
+        "x": x,
+        "y": y,
+        "xy": x * y,
+        "xx": x * x,
+    }).groupby(["city", "postnummer"], sort=True)
+    totals = sums[["x", "y", "xy", "xx"]].sum()
+    n = sums.size()
+    denominator = n * totals["xx"] - totals["x"] ** 2
+    slope = (n * totals["xy"] - totals["x"] * totals["y"]) / denominator.where(denominator != 0)
+
+    grouped_prices = history.groupby(["city", "postnummer"], sort=True)["averageSquareMeterPrice"]
+    trend = pd.DataFrame({
+        "numberOfRuns": n,
+        "firstAverageSquareMeterPrice": grouped_prices.first(),
+        "lastAverageSquareMeterPrice": grouped_prices.last(),
+        "slopePerDay": slope,
+    })
+    trend["percentageChange"] = (trend["lastAverageSquareMeterPrice"] / trend["firstAverageSquareMeterPrice"] - 1) * 100
+    return trend.reset_index()
+
+
+def import_finalized_market_data(cities: list, run_date: str = None, history_directory: str = HISTORY_DIRECTORY) -> None:
+    """Append the current postcodes_market_data_{city}.json files as snapshots, to start the history from existing runs."""
+    for city in cities:
+        # postcodes_market_data_path = os.path.join(os.getcwd(), f"../data/postcodes_market_data_finalized/postcodes_market_data_{city}.json")
+        postcodes_market_data_path = os.path.join(os.getcwd(), f"data/postcodes_market_data_finalized/postcodes_market_data_{city}.json")        # Use when running script from prepare_postcodes.py
+        with open(postcodes_market_data_path, "r") as file:
+            postcodes_market_data = json.load(file)
+        city_run_date = run_date if run_date is not None else date.fromtimestamp(os.path.getmtime(postcodes_market_data_path)).isoformat()
+        snapshot_path = append_snapshot(city, postcodes_market_data, city_run_date, history_directory)
+        print(f"Imported {len(postcodes_market_data)} post codes for city {city} to {snapshot_path}")
+    return None
+
+
+def main():
+
+    cities = [
+        "oslo",
+        "drammen",
+        "kristiansand",
+        "stavanger",
+        "bergen",
+        "trondelag",
+        "bodo",
+        "tromso",
+    ]
+
+    import_finalized_market_data(cities)
+    print(get_price_trend(cities))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import os
+import json
+import glob
+import hashlib
+from datetime import datetime
+
+
+# Paths when running script from prepare_postcodes.py
+# DATA_DIRECTORY = "../data"
+# PUBLISH_DIRECTORY = "../../frontend/public/data"
+# REPORTS_DIRECTORY = "../data/publish_reports"
+DATA_DIRECTORY = "data"
+PUBLISH_DIRECTORY = "../frontend/public/data"
+REPORTS_DIRECTORY = "data/publish_reports"
+
+# Pipeline outputs to publish, as (glob relative to DATA_DIRECTORY, directory relative to PUBLISH_DIRECTORY)
+PUBLISHED_OUTPUTS = [
+    ("postcodes_finalized/*.json", "postcodes_finalized"),
+    ("postcodes_market_data_finalized/*.json", "postcodes_market_data_finalized"),
+    ("postcodes_simplified/*/*.json", "postcodes_simplified"),
+    ("postcodes_topojson/*.topojson", "postcodes_topojson"),
+    ("postcodes_binary/*.bin", "postcodes_binary"),
+]
+
+# Files written directly to PUBLISH_DIRECTORY by other scripts, only hashed into the manifest
+IN_PLACE_OUTPUTS = [
+    "distance_data.json",
+    "square_meter_prices.json",
+]
+
+
+def get_content_hash(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def get_file_hash(path: str) -> str:
+    """Get the content hash of a file, or None if it does not exist."""
+    if not os.path.exists(path):
+        return None
+    hash = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            hash.update(chunk)
+    return hash.hexdigest()
+
+
+def write_if_changed(path: str, content: bytes) -> bool:
+    """Write content to a file only if it differs from the current content, so unchanged files keep their modification time.
+
+    Args:
+        path (str): Output path.
+        content (bytes): New content.
+
+    Returns:
+        bool: True if the file was written, False if it was unchanged.
+    """
+    if get_file_hash(path) == get_content_hash(content):
+        return False
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "wb") as file:
+        file.write(content)
+    os.replace(temporary_path, path)                # Replace atomically, so the frontend never serves a partial file
+    return True
+
+
+def write_json_if_changed(path: str, data, indent: int = 2) -> bool:
+    """Write data as JSON like json.dump(data, file, indent=indent), only if the content changed."""
+    return write_if_changed(path, json.dumps(data, indent=indent).encode())
+
+
+def get_records_per_postcode(data) -> dict:
+    """Get comparable records with post codes as keys, from a FeatureCollection or a dictionary with post codes as keys."""
+    if isinstance(data, dict) and data.get("type") == "FeatureCollection":
+        records = {}
+        for feature in data["features"]:
+            record = dict(feature["properties"])
+            record["geometry"] = get_content_hash(json.dumps(feature["geometry"], separators=(",", ":")).encode())
+            records[feature["properties"]["postnummer"]] = record
+        return records
+    return {postcode: value if isinstance(value, dict) else {"value": value} for postcode, value in data.items()}
+
+
+def get_postcode_diff(old_data, new_data) -> dict:
+    """Get the post codes that were added, removed or changed between two versions of an output.
+
+    Args:
+        old_data: Earlier version, a FeatureCollection or a dictionary with post codes as keys. None if there was no earlier version.
+        new_data: New version, in the same shape.
+
+    Returns:
+        dict: "added" and "removed" post codes, and "changed" with the changed fields per post code as {field: [old, new]}.
+    """
+    old_records = get_records_per_postcode(old_data) if old_data is not None else {}
+    new_records = get_records_per_postcode(new_data)
+    changed = {}
+    for postcode in new_records.keys() & old_records.keys():
+        old_record, new_record = old_records[postcode], new_records[postcode]
+        fields = {field: [old_record.get(field), new_record.get(field)] for field in old_record.keys() | new_record.keys() if old_record.get(field) != new_record.get(field)}
+        if fields:
+            changed[postcode] = fields
+    return {
+        "added": sorted(new_records.keys() - old_records.keys()),
+        "removed": sorted(old_records.keys() - new_records.keys()),
+        "changed": dict(sorted(changed.items())),
+    }
+
+
+def load_manifest(publish_directory: str = PUBLISH_DIRECTORY) -> dict:
+    manifest_path = os.path.join(publish_directory, "manifest.json")
+    if not os.path.exists(manifest_path):
+        return {"files": {}}
+    with open(manifest_path, "r") as file:
+        return json.load(file)
+
+
+def publish_outputs(data_directory: str = DATA_DIRECTORY, publish_directory: str = PUBLISH_DIRECTORY, reports_directory: str = REPORTS_DIRECTORY) -> dict:
+    """Publish pipeline outputs to the frontend, copying only files whose content changed.
+
+    A manifest.json with the hash and size of every published file is written next to the outputs, and a report with the
+    per-postcode changes of every changed JSON output is written to reports_directory.
+
+    Args:
+        data_directory (str, optional): Directory with pipeline outputs. Defaults to DATA_DIRECTORY.
+        publish_directory (str, optional): Directory served by the frontend. Defaults to PUBLISH_DIRECTORY.
+        reports_directory (str, optional): Directory for diff reports. Defaults to REPORTS_DIRECTORY.
+
+    Returns:
+        dict: Report with "written" and "unchanged" file names, and "diffs" with the postcode diff of each changed JSON output.
+    """
+    manifest = load_manifest(publish_directory)
+    now = datetime.now().isoformat(timespec="seconds")
+    report = {
+        "written": [],
+        "unchanged": [],
+        "diffs": {},
+    }
+
+    # Get files to publish, as (published name, source path)
+    files = []
+    for source_pattern, published_directory in PUBLISHED_OUTPUTS:
+        source_root = os.path.join(data_directory, os.path.dirname(source_pattern.split("*")[0]))
+        for source_path in sorted(glob.glob(os.path.join(data_directory, source_pattern))):
+            files.append((os.path.join(published_directory, os.path.relpath(source_path, source_root)).replace(os.sep, "/"), source_path))
+    for name in IN_PLACE_OUTPUTS:
+        if os.path.exists(os.path.join(publish_directory, name)):
+            files.append((name, os.path.join(publish_directory, name)))
+
+    for name, source_path in files:
+        with open(source_path, "rb") as file:
+            content = file.read()
+        content_hash = get_content_hash(content)
+        published_path = os.path.join(publish_directory, name)
+        previous_entry = manifest["files"].get(name)
+
+        # Skip unchanged files
+        is_unchanged = previous_entry is not None and previous_entry["sha256"] == content_hash and get_file_hash(published_path) == content_hash
+        if is_unchanged:
+            report["unchanged"].append(name)
+            continue
+
+        # Get postcode diff against the published version, files written in place are compared with a copy from the last publish
+        is_in_place = os.path.abspath(published_path) == os.path.abspath(source_path)
+        last_published_path = os.path.join(reports_directory, "last_published", name) if is_in_place else published_path
+        if name.endswith(".json") and (previous_entry is None or previous_entry["sha256"] != content_hash):
+            old_data = None
+            if os.path.exists(last_published_path):
+                with open(last_published_path, "r") as file:
+                    old_data = json.load(file)
+            diff = get_postcode_diff(old_data, json.loads(content))
+            if diff["added"] or diff["removed"] or diff["changed"]:
+                report["diffs"][name] = diff
+
+        # Publish file, or keep a copy of a file written in place for the next diff
+        write_if_changed(last_published_path, content)
+        manifest["files"][name] = {
+            "sha256": content_hash,
+            "size": len(content),
+            "published_at": now if previous_entry is None or previous_entry["sha256"] != content_hash else previous_entry["published_at"],
+        }
+        report["written"].append(name)
+
+    # Save manifest, and diff report if anything moved
+    manifest["files"] = dict(sorted(manifest["files"].items()))
+    write_json_if_changed(os.path.join(publish_directory, "manifest.json"), manifest)
+    if report["diffs"]:
+        os.makedirs(reports_directory, exist_ok=True)
+        report_path = os.path.join(reports_directory, f"diff_{datetime.now():%Y%m%dT%H%M%S%f}.json")
+        with open(report_path, "w") as file:
+            json.dump(report["diffs"], file, indent=2)
+        print(f"Saved postcode diff report to {report_path}")
+
+    number_of_changed_postcodes = sum(len(diff["added"]) + len(diff["removed"]) + len(diff["changed"]) for diff in report["diffs"].values())
+    print(f"Published {len(report['written'])} changed files and skipped {len(report['unchanged'])} unchanged files ({number_of_changed_postcodes} postcode changes) to {publish_directory}")
+    return report
+
+
+def main():
+    publish_outputs()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+import json
+import os
+import math
+from processing.topology import extract_arcs, get_geometry_from_arcs
+
+
+# Tolerance in meters for each level of detail
+DEFAULT_TOLERANCES = {
+    "coarse": 50,
+    "medium": 15,
+    "fine": 5,
+}
+
+# Approximate number of meters per degree of latitude
+METERS_PER_DEGREE = 111320
+
+
+def get_point_segment_distance(point: tuple, start: tuple, end: tuple, x_scale: float) -> float:
+    """Get the distance in meters from a point to a segment, using an equirectangular projection around the segment.
+
+    Args:
+        point (tuple): (longitude, latitude) of point.
+        start (tuple): (longitude, latitude) of segment start.
+        end (tuple): (longitude, latitude) of segment end.
+        x_scale (float): Meters per degree of longitude.
+
+    Returns:
+        float: Distance in meters.
+    """
+    px, py = (point[0] - start[0]) * x_scale, (point[1] - start[1]) * METERS_PER_DEGREE
+    ex, ey = (end[0] - start[0]) * x_scale, (end[1] - start[1]) * METERS_PER_DEGREE
+    segment_length_squared = ex * ex + ey * ey
+    if segment_length_squared == 0:
+        return math.hypot(px, py)
+    t = max(0.0, min(1.0, (px * ex + py * ey) / segment_length_squared))
+    return math.hypot(px - t * ex, py - t * ey)
+
+
+def simplify_arc(arc: list, tolerance: float) -> list:
+    """Simplify an arc with the Douglas-Peucker algorithm, always keeping its end points.
+
+    Args:
+        arc (list): Arc as a list of (longitude, latitude) tuples.
+        tolerance (float): Tolerance in meters.
+
+    Returns:
+        list: Simplified arc.
+    """
+    if len(arc) < 3:
+        return list(arc)
+
+    x_scale = METERS_PER_DEGREE * math.cos(math.radians(arc[0][1]))
+    is_kept = [False] * len(arc)
+    is_kept[0] = is_kept[-1] = True
+
+    # Iterative Douglas-Peucker to avoid recursion limits on long arcs
+    stack = [(0, len(arc) - 1)]
+    while stack:
+        start, end = stack.pop()
+        max_distance = 0.0
+        max_index = None
+        for i in range(start + 1, end):
+            distance = get_point_segment_distance(arc[i], arc[start], arc[end], x_scale)
+            if distance > max_distance:
+                max_distance = distance
+                max_index = i
+        if max_index is not None and max_distance > tolerance:
+            is_kept[max_index] = True
+            stack.append((start, max_index))
+            stack.append((max_index, end))
+
+    return [point for point, keep in zip(arc, is_kept) if keep]
+
+
+def get_ring_arc_indices(topology_geometry: dict) -> list:
+    """Get the arc indices used by each ring of a geometry with arc references.
+
+    Args:
+        topology_geometry (dict): Geometry as {"type": ..., "arcs": ...}.
+
+    Returns:
+        list: List of lists of arc indices, one per ring.
+    """
+    polygons = [topology_geometry["arcs"]] if topology_geometry["type"] == "Polygon" else topology_geometry["arcs"]
+    return [[arc if arc >= 0 else ~arc for arc in ring_arcs] for polygon in polygons for ring_arcs in polygon]
+
+
+def simplify_features(features: list, tolerance: float) -> list:
+    """Simplify the geometries of features while keeping shared borders identical between neighbouring polygons.
+
+    Shared borders are simplified once as arcs, so neighbouring polygons never get gaps or overlaps.
+    Arcs of rings that would collapse to fewer than four points are kept at full resolution.
+
+    Args:
+        features (list): List of GeoJSON features with Polygon or MultiPolygon geometries.
+        tolerance (float): Tolerance in meters.
+
+    Returns:
+        list: List of features with simplified geometries. Properties are kept as they are.
+    """
+
+    # Simplify shared arcs
+    arcs, topology_geometries = extract_arcs([feature["geometry"] for feature in features])
+    simplified_arcs = [simplify_arc(arc, tolerance) for arc in arcs]
+
+    # Restore arcs of rings that collapse
+    for topology_geometry in topology_geometries:
+        for ring_arc_indices in get_ring_arc_indices(topology_geometry):
+            number_of_points = 1 + sum(len(simplified_arcs[i]) - 1 for i in ring_arc_indices)
+            if number_of_points < 4:
+                for i in ring_arc_indices:
+                    simplified_arcs[i] = arcs[i]
+
+    # Rebuild features
+    simplified_features = []
+    for feature, topology_geometry in zip(features, topology_geometries):
+        simplified_features.append({
+            "type": feature["type"],
+            "geometry": get_geometry_from_arcs(topology_geometry, simplified_arcs),
+            "properties": feature["properties"],
+        })
+    return simplified_features
+
+
+def get_number_of_vertices(features: list) -> int:
+    """Get the total number of vertices of Polygon and MultiPolygon features.
+
+    Args:
+        features (list): List of GeoJSON features.
+
+    Returns:
+        int: Number of vertices.
+    """
+    number_of_vertices = 0
+    for feature in features:
+        coordinates = feature["geometry"]["coordinates"]
+        polygons = [coordinates] if feature["geometry"]["type"] == "Polygon" else coordinates
+        number_of_vertices += sum(len(ring) for polygon in polygons for ring in polygon)
+    return number_of_vertices
+
+
+def simplify_geojson(city: str, tolerances: dict = None) -> dict:
+    """Write simplified levels of detail of a finalized postcodes layer, and report the vertices and bytes saved by each level.
+
+    Args:
+        city (str): City.
+        tolerances (dict, optional): Tolerance in meters for each level of detail. Defaults to DEFAULT_TOLERANCES.
+
+    Returns:
+        dict: Report with number of vertices and bytes before and after simplification for each level.
+    """
+    if tolerances is None:
+        tolerances = DEFAULT_TOLERANCES
+
+    # Get postcodes data
+    # postcodes_finalized_path = os.path.join(os.getcwd(), f"../data/postcodes_finalized/postcodes_{city}.json")
+    postcodes_finalized_path = os.path.join(os.getcwd(), f"data/postcodes_finalized/postcodes_{city}.json")      # Use when running script from prepare_postcodes.py
+    with open(postcodes_finalized_path, "r") as file:
+        postcodes_data = json.load(file)
+    number_of_vertices = get_number_of_vertices(postcodes_data["features"])
+    number_of_bytes = len(json.dumps(postcodes_data, separators=(",", ":")).encode())         # Compare against the same compact encoding, so only simplification is counted
+
+    # Simplify and save each level of detail
+    report = {}
+    for level, tolerance in tolerances.items():
+        simplified_features = simplify_features(postcodes_data["features"], tolerance)
+
+        # postcodes_simplified_path = os.path.join(os.getcwd(), f"../data/postcodes_simplified/{level}/postcodes_{city}.json")
+        postcodes_simplified_path = os.path.join(os.getcwd(), f"data/postcodes_simplified/{level}/postcodes_{city}.json")      # Use when running script from prepare_postcodes.py
+        os.makedirs(os.path.dirname(postcodes_simplified_path), exist_ok=True)
+        with open(postcodes_simplified_path, "w") as file:
+            json.dump({"type": postcodes_data["type"], "features": simplified_features}, file, separators=(",", ":"))
+
+        # Save report for level
+        simplified_number_of_vertices = get_number_of_vertices(simplified_features)
+        simplified_number_of_bytes = os.path.getsize(postcodes_simplified_path)
+        report[level] = {
+            "tolerance_in_meters": tolerance,
+            "number_of_vertices": simplified_number_of_vertices,
+            "number_of_vertices_saved": number_of_vertices - simplified_number_of_vertices,
+            "number_of_bytes": simplified_number_of_bytes,
+            "number_of_bytes_saved": number_of_bytes - simplified_number_of_bytes,
+        }
+        print(f"- Level: {level} ({tolerance} m), Vertices: {number_of_vertices} -> {simplified_number_of_vertices}, Bytes: {number_of_bytes} -> {simplified_number_of_bytes}, saved to {postcodes_simplified_path}")
+
+    return report
+
+
+def main():
+
+    cities = [
+        "oslo",
+        "drammen",
+        "kristiansand",
+        "stavanger",
+        "bergen",
+        "trondelag",
+        "bodo",
+        "tromso",
+    ]
+
+    for city in cities:
+        print(f"Simplifying geometries for: {city}")
+        simplify_geojson(city)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+import json
+import os
+from processing.topology import extract_arcs, get_geometry_from_arcs
+
+
+# Number of quantized positions along each axis
+DEFAULT_QUANTIZATION = 100000
+
+
+def get_quantized_arcs(arcs: list, quantization: int) -> tuple:
+    """Quantize arcs to integer grid positions and delta-encode them.
+
+    Args:
+        arcs (list): List of arcs as lists of (x, y) tuples.
+        quantization (int): Number of quantized positions along each axis.
+
+    Returns:
+        tuple: List of delta-encoded arcs, and transform as {"scale": [x, y], "translate": [x, y]}.
+    """
+
+    # Get bounding box
+    x_values = [point[0] for arc in arcs for point in arc]
+    y_values = [point[1] for arc in arcs for point in arc]
+    x_min, x_max = min(x_values), max(x_values)
+    y_min, y_max = min(y_values), max(y_values)
+    x_scale = (x_max - x_min) / (quantization - 1) if x_max > x_min else 1
+    y_scale = (y_max - y_min) / (quantization - 1) if y_max > y_min else 1
+
+    # Quantize and delta-encode each arc
+    quantized_arcs = []
+    for arc in arcs:
+        quantized_arc = []
+        previous_x, previous_y = 0, 0
+        for i, point in enumerate(arc):
+            x = round((point[0] - x_min) / x_scale)
+            y = round((point[1] - y_min) / y_scale)
+            if i > 0 and i < len(arc) - 1 and x == previous_x and y == previous_y:        # Skip points that collapse onto the previous one, but keep end points
+                continue
+            quantized_arc.append([x - previous_x, y - previous_y])
+            previous_x, previous_y = x, y
+        quantized_arcs.append(quantized_arc)
+
+    transform = {
+        "scale": [x_scale, y_scale],
+        "translate": [x_min, y_min],
+    }
+    return quantized_arcs, transform
+
+
+def get_dequantized_arcs(quantized_arcs: list, transform: dict) -> list:
+    """Decode delta-encoded, quantized arcs back to coordinates.
+
+    Args:
+        quantized_arcs (list): List of delta-encoded arcs.
+        transform (dict): Transform as {"scale": [x, y], "translate": [x, y]}.
+
+    Returns:
+        list: List of arcs as lists of (x, y) tuples.
+    """
+    x_scale, y_scale = transform["scale"]
+    x_translate, y_translate = transform["translate"]
+    arcs = []
+    for quantized_arc in quantized_arcs:
+        arc = []
+        x, y = 0, 0
+        for dx, dy in quantized_arc:
+            x += dx
+            y += dy
+            arc.append((x * x_scale + x_translate, y * y_scale + y_translate))
+        arcs.append(arc)
+    return arcs
+
+
+def get_topology(features: list, object_name: str = "postcodes", quantization: int = DEFAULT_QUANTIZATION) -> dict:
+    """Get a TopoJSON topology from GeoJSON features, storing borders shared by neighbouring polygons once.
+
+    Args:
+        features (list): List of GeoJSON features with Polygon or MultiPolygon geometries.
+        object_name (str, optional): Name of the object holding the features. Defaults to "postcodes".
+        quantization (int, optional): Number of quantized positions along each axis. Defaults to DEFAULT_QUANTIZATION.
+
+    Returns:
+        dict: TopoJSON topology. All "properties" of the features are kept.
+    """
+    arcs, topology_geometries = extract_arcs([feature["geometry"] for feature in features])
+    quantized_arcs, transform = get_quantized_arcs(arcs, quantization)
+
+    geometries = []
+    for feature, topology_geometry in zip(features, topology_geometries):
+        geometries.append({
+            "type": topology_geometry["type"],
+            "arcs": topology_geometry["arcs"],
+            "properties": feature["properties"],
+        })
+
+    return {
+        "type": "Topology",
+        "transform": transform,
+        "objects": {
+            object_name: {
+                "type": "GeometryCollection",
+                "geometries": geometries,
+            },
+        },
+        "arcs": quantized_arcs,
+    }
+
+
+def get_features_from_topology(topology: dict, object_name: str = "postcodes") -> list:
+    """Get GeoJSON features from a TopoJSON topology.
+
+    Args:
+        topology (dict): TopoJSON topology.
+        object_name (str, optional): Name of the object holding the features. Defaults to "postcodes".
+
+    Returns:
+        list: List of GeoJSON features.
+    """
+    arcs = get_dequantized_arcs(topology["arcs"], topology["transform"])
+    features = []
+    for geometry in topology["objects"][object_name]["geometries"]:
+        features.append({
+            "type": "Feature",
+            "geometry": get_geometry_from_arcs(geometry, arcs),
+            "properties": geometry["properties"],
+        })
+    return features
+
+
+def export_topojson(city: str, quantization: int = DEFAULT_QUANTIZATION) -> None:
+    """Export a finalized postcodes layer as TopoJSON.
+
+    Args:
+        city (str): City.
+        quantization (int, optional): Number of quantized positions along each axis. Defaults to DEFAULT_QUANTIZATION.
+
+    Returns:
+        None
+    """
+
+    # Get postcodes data
+    # postcodes_finalized_path = os.path.join(os.getcwd(), f"../data/postcodes_finalized/postcodes_{city}.json")
+    postcodes_finalized_path = os.path.join(os.getcwd(), f"data/postcodes_finalized/postcodes_{city}.json")      # Use when running script from prepare_postcodes.py
+    with open(postcodes_finalized_path, "r") as file:
+        postcodes_data = json.load(file)
+
+    # Save topology
+    topology = get_topology(postcodes_data["features"], quantization=quantization)
+    # postcodes_topojson_path = os.path.join(os.getcwd(), f"../data/postcodes_topojson/postcodes_{city}.topojson")
+    postcodes_topojson_path = os.path.join(os.getcwd(), f"data/postcodes_topojson/postcodes_{city}.topojson")      # Use when running script from prepare_postcodes.py
+    os.makedirs(os.path.dirname(postcodes_topojson_path), exist_ok=True)
+    with open(postcodes_topojson_path, "w") as file:
+        json.dump(topology, file, separators=(",", ":"))
+
+    print(f"Exported {len(postcodes_data['features'])} post codes for city {city} with {len(topology['arcs'])} arcs ({os.path.getsize(postcodes_finalized_path)} -> {os.path.getsize(postcodes_topojson_path)} bytes) to {postcodes_topojson_path}")
+    return None
+
+
+def main():
+
+    cities = [
+        "oslo",
+        "drammen",
+        "kristiansand",
+        "stavanger",
+        "bergen",
+        "trondelag",
+        "bodo",
+        "tromso",
+    ]
+
+    for city in cities:
+        export_topojson(city)
+
+
+if __name__ == "__main__":
+    main()
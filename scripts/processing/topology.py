@@ -0,0 +1,174 @@
+def get_polygons(geometry: dict) -> list:
+    """Get the polygons of a Polygon or MultiPolygon geometry as lists of rings.
+
+    Args:
+        geometry (dict): GeoJSON geometry.
+
+    Returns:
+        list: List of polygons, where each polygon is a list of rings, and each ring is a list of [x, y] coordinates.
+    """
+    if geometry["type"] == "Polygon":
+        return [geometry["coordinates"]]
+    if geometry["type"] == "MultiPolygon":
+        return geometry["coordinates"]
+    raise ValueError(f"Unsupported geometry type: {geometry['type']}")
+
+
+def get_ring_points(ring: list) -> list:
+    """Get the points of a closed ring as tuples, without the closing point and without consecutive duplicates.
+
+    Args:
+        ring (list): Closed ring as a list of [x, y] coordinates.
+
+    Returns:
+        list: List of (x, y) tuples.
+    """
+    points = []
+    for coordinate in ring:
+        point = (coordinate[0], coordinate[1])
+        if not points or points[-1] != point:
+            points.append(point)
+    if len(points) > 1 and points[0] == points[-1]:
+        points.pop()
+    return points
+
+
+def get_junctions(rings: list) -> set:
+    """Get junctions, the points where a border is no longer shared by the same rings.
+
+    A point is a junction if it has more than two distinct neighbours across all rings.
+
+    Args:
+        rings (list): List of rings as lists of (x, y) tuples, without closing points.
+
+    Returns:
+        set: Set of (x, y) junction points.
+    """
+    neighbours = {}
+    for points in rings:
+        number_of_points = len(points)
+        for i, point in enumerate(points):
+            point_neighbours = neighbours.setdefault(point, set())
+            point_neighbours.add(points[i - 1])
+            point_neighbours.add(points[(i + 1) % number_of_points])
+    return {point for point, point_neighbours in neighbours.items() if len(point_neighbours) > 2}
+
+
+def get_ring_chains(points: list, junctions: set) -> list:
+    """Split a ring into chains that start and end at junctions.
+
+    Rings without junctions are cut at their smallest point, so the same ring is cut at the same place regardless of orientation.
+
+    Args:
+        points (list): Ring as a list of (x, y) tuples, without closing point.
+        junctions (set): Set of (x, y) junction points.
+
+    Returns:
+        list: List of chains, where each chain is a list of (x, y) tuples.
+    """
+
+    # Rotate ring so it starts at a junction
+    ring_junctions = [i for i, point in enumerate(points) if point in junctions]
+    start = ring_junctions[0] if ring_junctions else points.index(min(points))
+    rotated_points = points[start:] + points[:start] + [points[start]]
+
+    # Split ring at every junction
+    chains = []
+    chain = [rotated_points[0]]
+    for point in rotated_points[1:]:
+        chain.append(point)
+        if point in junctions:
+            chains.append(chain)
+            chain = [point]
+    if len(chain) > 1:
+        chains.append(chain)
+    return chains
+
+
+def extract_arcs(geometries: list) -> tuple:
+    """Extract shared arcs from Polygon and MultiPolygon geometries, so that borders shared by neighbouring polygons are stored once.
+
+    Arc references follow the TopoJSON convention, where a reference ~i (-i - 1) means arc i reversed.
+
+    Args:
+        geometries (list): List of GeoJSON geometries.
+
+    Returns:
+        tuple: List of arcs (lists of (x, y) tuples) and list of geometries as {"type": ..., "arcs": ...}, where "arcs" has the same nesting as "coordinates".
+    """
+
+    # Get points of all rings
+    polygons_per_geometry = []
+    for geometry in geometries:
+        polygons_per_geometry.append([[get_ring_points(ring) for ring in polygon] for polygon in get_polygons(geometry)])
+    junctions = get_junctions([points for polygons in polygons_per_geometry for polygon in polygons for points in polygon])
+
+    # Split rings into chains and deduplicate chains into arcs
+    arcs = []
+    arc_indices = {}
+    topology_geometries = []
+    for geometry, polygons in zip(geometries, polygons_per_geometry):
+        topology_polygons = []
+        for polygon in polygons:
+            topology_rings = []
+            for points in polygon:
+                ring_arcs = []
+                for chain in get_ring_chains(points, junctions):
+                    chain = tuple(chain)
+                    reversed_chain = chain[::-1]
+                    if chain in arc_indices:
+                        ring_arcs.append(arc_indices[chain])
+                    elif reversed_chain in arc_indices:
+                        ring_arcs.append(~arc_indices[reversed_chain])
+                    else:
+                        arc_indices[chain] = len(arcs)
+                        ring_arcs.append(len(arcs))
+                        arcs.append(list(chain))
+                topology_rings.append(ring_arcs)
+            topology_polygons.append(topology_rings)
+
+        # Keep the nesting of the original geometry
+        topology_geometries.append({
+            "type": geometry["type"],
+            "arcs": topology_polygons[0] if geometry["type"] == "Polygon" else topology_polygons,
+        })
+
+    return arcs, topology_geometries
+
+
+def get_ring_from_arcs(ring_arcs: list, arcs: list) -> list:
+    """Get a closed ring of coordinates from arc references.
+
+    Args:
+        ring_arcs (list): List of arc references for the ring.
+        arcs (list): List of arcs.
+
+    Returns:
+        list: Closed ring as a list of [x, y] coordinates.
+    """
+    ring = []
+    for arc_reference in ring_arcs:
+        arc = arcs[arc_reference] if arc_reference >= 0 else arcs[~arc_reference][::-1]
+        points = arc if not ring else arc[1:]           # Consecutive arcs share their end points
+        ring.extend([point[0], point[1]] for point in points)
+    return ring
+
+
+def get_geometry_from_arcs(topology_geometry: dict, arcs: list) -> dict:
+    """Get a GeoJSON geometry from a geometry with arc references.
+
+    Args:
+        topology_geometry (dict): Geometry as {"type": ..., "arcs": ...}.
+        arcs (list): List of arcs.
+
+    Returns:
+        dict: GeoJSON geometry.
+    """
+    if topology_geometry["type"] == "Polygon":
+        coordinates = [get_ring_from_arcs(ring_arcs, arcs) for ring_arcs in topology_geometry["arcs"]]
+    else:
+        coordinates = [[get_ring_from_arcs(ring_arcs, arcs) for ring_arcs in polygon] for polygon in topology_geometry["arcs"]]
+    return {
+        "type": topology_geometry["type"],
+        "coordinates": coordinates,
+    }
@@ -0,0 +1,212 @@
+import asyncio
+import random
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from time import monotonic
+import httpx
+
+
+# Status codes that mean the server is overloaded or throttling, and the request can be retried
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Status codes that mean the server is throttling, other retryable status codes only count as throttling with a Retry-After
+THROTTLING_STATUS_CODES = {429}
+
+
+class HTTPStatusError(Exception):
+    """Raised when a response does not have status code 200."""
+
+    def __init__(self, response: httpx.Response) -> None:
+        super().__init__(f"HTTP status code: {response.status_code}")
+        self.status_code = response.status_code
+        self.retry_after = get_retry_after(response)
+
+    def is_retryable(self) -> bool:
+        return self.status_code in RETRYABLE_STATUS_CODES
+
+    def is_throttled(self) -> bool:
+        return self.status_code in THROTTLING_STATUS_CODES or (self.is_retryable() and self.retry_after is not None)
+
+
+def get_retry_after(response: httpx.Response) -> float:
+    """Get the number of seconds to wait from the Retry-After header, as seconds or as an HTTP date.
+
+    Args:
+        response (httpx.Response): Response.
+
+    Returns:
+        float: Seconds to wait, or None if the header is missing or invalid.
+    """
+    retry_after = response.headers.get("retry-after")
+    if retry_after is None:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class AdaptiveLimiter:
+    """Adaptive concurrency and rate limiter with additive increase and multiplicative decrease.
+
+    The rate and concurrency grow slowly while latency and error rate stay healthy, and are halved when the server throttles (429,
+    or 5xx with Retry-After), or when most recent requests failed. They are halved at most once per window of responses, and never for
+    requests sent before the last decrease, so one burst of throttled requests halves them once, not once per request. Isolated 5xx
+    errors only pause the increase. A Retry-After from the server pauses all requests until it has passed.
+
+    Usage:
+        limiter = AdaptiveLimiter(initial_rate=5, initial_concurrency=10)
+        async with limiter:
+            response = await session.send(request)
+    """
+
+    def __init__(
+        self,
+        initial_rate: float = 5,
+        min_rate: float = 0.5,
+        max_rate: float = 20,
+        rate_increase: float = 0.25,
+        initial_concurrency: int = 10,
+        min_concurrency: int = 1,
+        max_concurrency: int = 30,
+        target_latency_in_seconds: float = 2.0,
+        max_error_rate: float = 0.1,
+        overload_error_rate: float = 0.5,
+        window_size: int = 20,
+    ) -> None:
+        self.rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.rate_increase = rate_increase
+        self.concurrency = initial_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.target_latency_in_seconds = target_latency_in_seconds
+        self.max_error_rate = max_error_rate
+        self.overload_error_rate = overload_error_rate
+
+        # State
+        self.in_flight = 0
+        self.next_request_at = 0.0
+        self.paused_until = 0.0
+        self.successes_since_increase = 0
+        self.decreased_at = float("-inf")
+        self.responses_since_decrease = window_size         # A full window, so the first throttled response decreases
+        self.outcomes = deque(maxlen=window_size)            # (is_success, latency in seconds) of requests that were not throttled
+        self.condition = asyncio.Condition()
+
+        # Statistics
+        self.statistics = {
+            "successes": 0,
+            "throttled": 0,
+            "errors": 0,
+            "retries": 0,
+        }
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.release()
+        return False
+
+    async def acquire(self) -> None:
+        """Wait for a free concurrency slot and for the next request time allowed by the rate."""
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < self.concurrency)
+            self.in_flight += 1
+
+            # Reserve the next request time, so waiting requests are spaced by 1 / rate
+            request_at = max(monotonic(), self.next_request_at, self.paused_until)
+            self.next_request_at = request_at + 1 / self.rate
+        delay = request_at - monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return None
+
+    async def release(self) -> None:
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+        return None
+
+    def get_error_rate(self) -> float:
+        """Get the share of failed requests in the window, counted over the full window size so one early error is not a high rate."""
+        return sum(1 for is_success, _ in self.outcomes if not is_success) / self.outcomes.maxlen
+
+    def decrease(self, sent_at: float = None) -> None:
+        """Halve rate and concurrency, unless they were halved less than a window of responses ago or after the request was sent."""
+        if self.responses_since_decrease < self.outcomes.maxlen or (sent_at is not None and sent_at < self.decreased_at):
+            return None
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.concurrency = max(self.min_concurrency, self.concurrency // 2)
+        self.successes_since_increase = 0
+        self.decreased_at = monotonic()
+        self.responses_since_decrease = 0
+        return None
+
+    def record_success(self, latency_in_seconds: float) -> None:
+        """Increase rate and concurrency additively while latency and error rate are healthy."""
+        self.statistics["successes"] += 1
+        self.responses_since_decrease += 1
+        self.outcomes.append((True, latency_in_seconds))
+        if latency_in_seconds > self.target_latency_in_seconds:
+            self.rate = max(self.min_rate, self.rate * 0.9)             # Back off gently when the server gets slow
+            return None
+        if self.get_error_rate() > self.max_error_rate:
+            return None
+        self.rate = min(self.max_rate, self.rate + self.rate_increase / self.rate)         # Grows by about rate_increase per second of healthy requests
+        self.successes_since_increase += 1
+        if self.successes_since_increase >= self.concurrency:            # One more slot per window of successful requests
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+            self.successes_since_increase = 0
+        return None
+
+    def record_throttled(self, retry_after: float = None, sent_at: float = None) -> None:
+        """Halve rate and concurrency at most once per window, and pause all requests for Retry-After seconds if given.
+
+        Args:
+            retry_after (float, optional): Seconds to pause all requests. Defaults to None.
+            sent_at (float, optional): monotonic() when the throttled request was sent. Defaults to None, which always halves.
+
+        Returns:
+            None
+        """
+        self.statistics["throttled"] += 1
+        self.responses_since_decrease += 1
+        self.decrease(sent_at)
+        if retry_after is not None:
+            self.paused_until = max(self.paused_until, monotonic() + retry_after)
+        return None
+
+    def record_error(self, sent_at: float = None) -> None:
+        """Record a failed request that does not mean the server is throttling, and halve once most recent requests fail."""
+        self.statistics["errors"] += 1
+        self.responses_since_decrease += 1
+        self.outcomes.append((False, None))
+        if self.get_error_rate() > self.overload_error_rate:
+            self.decrease(sent_at)
+        return None
+
+
+def get_backoff_delay(attempt: int, base_delay_in_seconds: float = 0.5, max_delay_in_seconds: float = 30) -> float:
+    """Get a jittered exponential backoff delay ("full jitter").
+
+    Args:
+        attempt (int): Number of the failed attempt, starting at 0.
+        base_delay_in_seconds (float, optional): Delay of the first retry before jitter. Defaults to 0.5.
+        max_delay_in_seconds (float, optional): Maximum delay before jitter. Defaults to 30.
+
+    Returns:
+        float: Seconds to wait before the next attempt.
+    """
+    return random.uniform(0, min(max_delay_in_seconds, base_delay_in_seconds * 2 ** attempt))
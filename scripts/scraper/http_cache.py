@@ -0,0 +1,198 @@
+import json
+import os
+import hashlib
+from time import time
+import httpx
+
+
+# Response headers stored with each entry
+STORED_HEADERS = ["content-type", "etag", "last-modified"]
+
+
+class HTTPCache:
+    """Persistent on-disk cache for HTTP responses.
+
+    Response bodies are content-addressed, stored once under bodies/{sha256 of body}, so identical pages share storage.
+    Each URL has an entry under entries/{sha256 of url}.json with its body hash, headers, expiry time and last access time.
+    Stale entries are revalidated with conditional requests (ETag / Last-Modified) when the server supports them,
+    and the least recently used entries are evicted when the bodies exceed the maximum size.
+
+    Usage:
+        cache = HTTPCache("data/cache/http", ttl_in_seconds=24 * 60 * 60)
+        response = await fetch(session, request, cache=cache)
+    """
+
+    def __init__(self, cache_directory: str = "data/cache/http", ttl_in_seconds: float = 24 * 60 * 60, max_size_in_bytes: int = 200 * 1024 * 1024) -> None:
+        self.cache_directory = cache_directory
+        self.ttl_in_seconds = ttl_in_seconds
+        self.max_size_in_bytes = max_size_in_bytes
+        self.entries_directory = os.path.join(cache_directory, "entries")
+        self.bodies_directory = os.path.join(cache_directory, "bodies")
+        os.makedirs(self.entries_directory, exist_ok=True)
+        os.makedirs(self.bodies_directory, exist_ok=True)
+
+        # Load entries
+        self.entries = {}
+        for file_name in os.listdir(self.entries_directory):
+            if not file_name.endswith(".json"):
+                continue
+            with open(os.path.join(self.entries_directory, file_name), "r") as file:
+                entry = json.load(file)
+            self.entries[entry["key"]] = entry
+
+        # Statistics
+        self.statistics = {
+            "hits": 0,
+            "revalidated": 0,
+            "misses": 0,
+            "evicted": 0,
+        }
+
+    ## Entries ##
+    def get_key(self, url: str) -> str:
+        return hashlib.sha256(url.encode()).hexdigest()
+
+    def get_entry(self, url: str) -> dict:
+        """Get the cache entry for a URL, or None if the URL is not cached."""
+        entry = self.entries.get(self.get_key(url))
+        if entry is None or not os.path.exists(self.get_body_path(entry["body_hash"])):
+            return None
+        return entry
+
+    def is_fresh(self, entry: dict) -> bool:
+        return entry["expires_at"] > time()
+
+    def save_entry(self, entry: dict) -> None:
+        self.entries[entry["key"]] = entry
+        entry_path = os.path.join(self.entries_directory, f"{entry['key']}.json")
+        temporary_path = entry_path + ".tmp"
+        with open(temporary_path, "w") as file:
+            json.dump(entry, file)
+        os.replace(temporary_path, entry_path)                  # Replace atomically so an interrupted write never leaves a broken entry
+        return None
+
+    def remove_entry(self, entry: dict) -> None:
+        del self.entries[entry["key"]]
+        entry_path = os.path.join(self.entries_directory, f"{entry['key']}.json")
+        if os.path.exists(entry_path):
+            os.remove(entry_path)
+        return None
+
+    ## Bodies ##
+    def get_body_path(self, body_hash: str) -> str:
+        return os.path.join(self.bodies_directory, body_hash)
+
+    def read_body(self, entry: dict) -> bytes:
+        with open(self.get_body_path(entry["body_hash"]), "rb") as file:
+            return file.read()
+
+    def write_body(self, body: bytes) -> str:
+        body_hash = hashlib.sha256(body).hexdigest()
+        body_path = self.get_body_path(body_hash)
+        if not os.path.exists(body_path):
+            temporary_path = body_path + ".tmp"
+            with open(temporary_path, "wb") as file:
+                file.write(body)
+            os.replace(temporary_path, body_path)
+        return body_hash
+
+    ## Requests and responses ##
+    def get_conditional_headers(self, entry: dict) -> dict:
+        """Get headers for revalidating a stale entry."""
+        headers = {}
+        if "etag" in entry["headers"]:
+            headers["If-None-Match"] = entry["headers"]["etag"]
+        if "last-modified" in entry["headers"]:
+            headers["If-Modified-Since"] = entry["headers"]["last-modified"]
+        return headers
+
+    def get_response(self, entry: dict, request: httpx.Request) -> httpx.Response:
+        """Get a cached response, and mark the entry as used."""
+        entry["last_accessed_at"] = time()
+        self.save_entry(entry)
+        return httpx.Response(
+            status_code=200,
+            headers=entry["headers"],
+            content=self.read_body(entry),
+            request=request,
+        )
+
+    def get_fresh_response(self, request: httpx.Request) -> httpx.Response:
+        """Get the cached response for a request if it is fresh, otherwise None."""
+        entry = self.get_entry(str(request.url))
+        if entry is None or not self.is_fresh(entry):
+            return None
+        self.statistics["hits"] += 1
+        return self.get_response(entry, request)
+
+    def store(self, url: str, response: httpx.Response, ttl_in_seconds: float = None) -> None:
+        """Store a successful response.
+
+        Args:
+            url (str): Requested URL.
+            response (httpx.Response): Response with status code 200.
+            ttl_in_seconds (float, optional): Time to live for this entry. Defaults to the TTL of the cache.
+
+        Returns:
+            None
+        """
+        if ttl_in_seconds is None:
+            ttl_in_seconds = self.ttl_in_seconds
+        now = time()
+        entry = {
+            "key": self.get_key(url),
+            "url": url,
+            "body_hash": self.write_body(response.content),
+            "size": len(response.content),
+            "headers": {header: response.headers[header] for header in STORED_HEADERS if header in response.headers},
+            "stored_at": now,
+            "expires_at": now + ttl_in_seconds,
+            "last_accessed_at": now,
+        }
+        self.save_entry(entry)
+        self.evict()
+        return None
+
+    def refresh(self, entry: dict, response: httpx.Response, ttl_in_seconds: float = None) -> None:
+        """Extend the lifetime of an entry after the server answered 304 Not Modified."""
+        if ttl_in_seconds is None:
+            ttl_in_seconds = self.ttl_in_seconds
+        for header in ["etag", "last-modified"]:
+            if header in response.headers:
+                entry["headers"][header] = response.headers[header]
+        entry["expires_at"] = time() + ttl_in_seconds
+        self.save_entry(entry)
+        return None
+
+    ## Eviction ##
+    def get_size(self) -> int:
+        """Get the total size of all distinct cached bodies in bytes."""
+        body_sizes = {entry["body_hash"]: entry["size"] for entry in self.entries.values()}
+        return sum(body_sizes.values())
+
+    def evict(self) -> None:
+        """Remove least recently used entries until the cache is within its maximum size, and remove unreferenced bodies."""
+        if self.get_size() <= self.max_size_in_bytes:
+            return None
+
+        # Remove least recently used entries
+        size = self.get_size()
+        body_references = {}
+        for entry in self.entries.values():
+            body_references[entry["body_hash"]] = body_references.get(entry["body_hash"], 0) + 1
+        entries_by_last_access = sorted(self.entries.values(), key=lambda entry: entry["last_accessed_at"])
+        for entry in entries_by_last_access:
+            if size <= self.max_size_in_bytes:
+                break
+            self.remove_entry(entry)
+            self.statistics["evicted"] += 1
+            body_references[entry["body_hash"]] -= 1
+            if body_references[entry["body_hash"]] == 0:          # Body is only freed when no other entry shares it
+                size -= entry["size"]
+
+        # Remove bodies that are no longer referenced
+        referenced_body_hashes = {entry["body_hash"] for entry in self.entries.values()}
+        for body_hash in os.listdir(self.bodies_directory):
+            if body_hash not in referenced_body_hashes:
+                os.remove(self.get_body_path(body_hash))
+        return None
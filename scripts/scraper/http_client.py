@@ -0,0 +1,83 @@
+import asyncio
+import importlib.util
+import httpx
+
+
+# Configuration shared by all scrapers
+MAX_CONNECTIONS = 30
+MAX_KEEPALIVE_CONNECTIONS = 30
+KEEPALIVE_EXPIRY_IN_SECONDS = 30
+TIMEOUT_IN_SECONDS = 30
+IS_HTTP2 = True                     # Only used if the h2 package is installed (pip install httpx[http2])
+HEADERS = {
+    "User-Agent": "real-estate-price-map/1.0",
+    "Accept": "text/html",
+}
+
+
+def is_http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+class HTTPClient:
+    """Pooled HTTP client shared by the scrapers.
+
+    Connections are kept alive and reused across requests, so the TLS handshake is paid once per connection instead of once per request.
+    At most max_connections requests are sent at once, and the rest wait for a free slot instead of opening more sockets.
+    HTTP/2 is used when requested and the h2 package is installed.
+
+    Usage:
+        async with HTTPClient() as client:
+            response = await client.get(url)
+    """
+
+    def __init__(
+        self,
+        max_connections: int = MAX_CONNECTIONS,
+        max_keepalive_connections: int = MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry_in_seconds: float = KEEPALIVE_EXPIRY_IN_SECONDS,
+        timeout_in_seconds: float = TIMEOUT_IN_SECONDS,
+        is_http2: bool = IS_HTTP2,
+        headers: dict = None,
+        transport: httpx.AsyncBaseTransport = None,
+    ) -> None:
+        self.max_connections = max_connections
+        self.is_http2 = is_http2 and is_http2_available()
+        self.semaphore = asyncio.Semaphore(max_connections)
+        self.session = httpx.AsyncClient(
+            http2=self.is_http2,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=min(max_keepalive_connections, max_connections),
+                keepalive_expiry=keepalive_expiry_in_seconds,
+            ),
+            timeout=httpx.Timeout(timeout_in_seconds, pool=None),            # Requests wait for the semaphore, not for the pool
+            headers=HEADERS if headers is None else headers,
+            follow_redirects=True,
+            transport=transport,
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+        return False
+
+    async def close(self) -> None:
+        """Close all pooled connections."""
+        await self.session.aclose()
+        return None
+
+    def build_request(self, method: str, url: str, **kwargs) -> httpx.Request:
+        """Build a request with the shared headers and timeouts."""
+        return self.session.build_request(method, url, **kwargs)
+
+    async def send(self, request: httpx.Request) -> httpx.Response:
+        """Send a request, waiting for a free connection slot first."""
+        async with self.semaphore:
+            return await self.session.send(request)
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        """Send a GET request, waiting for a free connection slot first."""
+        return await self.send(self.build_request("GET", url, **kwargs))
@@ -0,0 +1,184 @@
+import os
+import re
+import html as html_module
+from bs4 import BeautifulSoup
+
+
+# Class of the five statistics blocks on a post code page, in page order:
+# price change last year, square meter price, price change last quarter/month, sales time, estates sold last quarter/month
+MARKET_DATA_CLASS = "css-j9s53t"
+NUMBER_OF_BLOCKS = 5
+
+# Precompiled patterns for the fast path
+BLOCK_START_PATTERN = re.compile(r'<div\b[^>]*\sclass\s*=\s*["\'][^"\']*(?<![\w-])' + re.escape(MARKET_DATA_CLASS) + r'(?![\w-])[^"\']*["\'][^>]*>', re.IGNORECASE)
+DIV_TAG_PATTERN = re.compile(r'<(/?)div\b[^>]*>', re.IGNORECASE)
+TAG_PATTERN = re.compile(r'<[^>]*>')
+UNSAFE_CONTENT_PATTERN = re.compile(r'<!|<script|<style', re.IGNORECASE)        # Content the fast path does not handle like html.parser
+
+
+def get_block_texts_fast(html: str) -> list:
+    """Get the text of the statistics blocks with precompiled patterns, without building a document tree.
+
+    Args:
+        html (str): HTML of the post code page.
+
+    Returns:
+        list: Text of each block, as BeautifulSoup's .text would give it, or None if the page can not be read safely this way.
+    """
+    texts = []
+    for match in BLOCK_START_PATTERN.finditer(html):
+
+        # Find the closing tag of the block, skipping nested divs
+        depth = 1
+        for tag in DIV_TAG_PATTERN.finditer(html, match.end()):
+            depth += -1 if tag.group(1) else 1
+            if depth == 0:
+                break
+        else:
+            return None
+        content = html[match.end():tag.start()]
+        if UNSAFE_CONTENT_PATTERN.search(content):
+            return None
+        texts.append(html_module.unescape(TAG_PATTERN.sub("", content)))
+    return texts
+
+
+def get_block_texts_from_soup(html: str) -> list:
+    """Get the text of the statistics blocks from a full BeautifulSoup tree."""
+    soup = BeautifulSoup(html, "html.parser")
+    return [block.text for block in soup.find_all("div", class_=MARKET_DATA_CLASS)]
+
+
+def get_percentage_change(text: str, label: str):
+    """Get a percentage change like "+5,4%" following a label, as a float."""
+    percentage_change = text.replace(label, "").split(" ")[0].replace(",", ".")
+    if percentage_change[0] == "+": percentage_change = float(percentage_change[1:-1])        # Remove "+" and "%" and convert to float
+    elif percentage_change[0] == "-": percentage_change = float(percentage_change[1:-1]) * -1
+    elif percentage_change[0] == "0": percentage_change = 0.0
+    return percentage_change
+
+
+def get_number_of_estates_sold(text: str, label: str) -> int:
+    """Get a number of estates sold like "1 212\xa0boliger" following a label."""
+    number_of_estates_sold_string = text.replace(label, "").split("\xa0")[0]
+    if " " in number_of_estates_sold_string:           # Check for thousands separator (" ")
+        return int(number_of_estates_sold_string.split(" ")[0] + number_of_estates_sold_string.split(" ")[1])
+    return int(number_of_estates_sold_string)
+
+
+def get_market_data_from_texts(texts: list) -> tuple:
+    """Convert the text of the statistics blocks to market data.
+
+    Args:
+        texts (list): Text of each statistics block, in page order.
+
+    Returns:
+        tuple: Price percentage change last year, square meter price, price percentage change last quarter, price percentage change last month,
+            average sales time, number of estates sold last quarter and number of estates sold last month.
+    """
+
+    # Get price percentage change last year
+    price_percentage_change_last_year = get_percentage_change(texts[0], "Endring siste år")
+
+    # Get square meter price
+    square_meter_price = int(texts[1].replace("Kvadratmeterpris", "").replace("kr", "").replace(" ", ""))
+
+    # Get price percentage change last quarter or last month
+    price_percentage_change_last_quarter = None
+    price_percentage_change_last_month = None
+    if "Endring siste kvartal" in texts[2]:                 # Check if price percentage change last quarter is available
+        price_percentage_change_last_quarter = get_percentage_change(texts[2], "Endring siste kvartal")
+    if "Endring siste måned" in texts[2]:                   # Check if price percentage change last month is available
+        price_percentage_change_last_month = get_percentage_change(texts[2], "Endring siste måned")
+
+    # Get average sales time
+    average_sales_time = int(texts[3].replace("Salgstid", "").split("\xa0")[0])
+
+    # Get number of estates sold last quarter or last month
+    number_of_estates_sold_last_quarter = None
+    number_of_estates_sold_last_month = None
+    if "Solgte boliger siste  kvartal" in texts[4]:         # Check if number of estates sold last quarter is available
+        number_of_estates_sold_last_quarter = get_number_of_estates_sold(texts[4], "Solgte boliger siste  kvartal")
+    if "Solgte boliger siste  måned" in texts[4]:           # Check if number of estates sold last month is available
+        number_of_estates_sold_last_month = get_number_of_estates_sold(texts[4], "Solgte boliger siste  måned")
+
+    return price_percentage_change_last_year, square_meter_price, price_percentage_change_last_quarter, price_percentage_change_last_month, average_sales_time, number_of_estates_sold_last_quarter, number_of_estates_sold_last_month
+
+
+def extract_market_data(html: str) -> tuple:
+    """Extract market data from the HTML of a post code page.
+
+    Uses the fast path when it finds all statistics blocks and can convert them, and falls back to a full BeautifulSoup tree otherwise.
+
+    Args:
+        html (str): HTML of the post code page.
+
+    Returns:
+        tuple: Market data as returned by get_market_data_from_texts.
+    """
+    texts = get_block_texts_fast(html)
+    if texts is not None and len(texts) >= NUMBER_OF_BLOCKS:
+        try:
+            return get_market_data_from_texts(texts)
+        except (ValueError, IndexError):
+            pass
+    return get_market_data_from_texts(get_block_texts_from_soup(html))
+
+
+def print_market_data(post_code: str, market_data: tuple) -> None:
+    price_percentage_change_last_year, square_meter_price, price_percentage_change_last_quarter, price_percentage_change_last_month, average_sales_time, number_of_estates_sold_last_quarter, number_of_estates_sold_last_month = market_data
+    if price_percentage_change_last_quarter is not None:
+        print(f"Post code: {post_code}, Square meter price: {square_meter_price} --> Last Year ==> Price percentage change: {price_percentage_change_last_year}, --> Last Quarter ==> Price percentage change: {price_percentage_change_last_quarter}, Average sales time: {average_sales_time} Number of estates sold: {number_of_estates_sold_last_quarter}")
+    if price_percentage_change_last_month is not None:
+        print(f"Post code: {post_code}, Square meter price: {square_meter_price} --> Last Year ==> Price percentage change: {price_percentage_change_last_year}, --> Last Month ==> Price percentage change: {price_percentage_change_last_month}, Average sales time: {average_sales_time} Number of estates sold: {number_of_estates_sold_last_month}")
+    return None
+
+
+def check_extractor(page_paths: list) -> dict:
+    """Check that the fast path gives the same market data as the full BeautifulSoup tree for recorded pages.
+
+    Args:
+        page_paths (list): Paths to recorded post code pages.
+
+    Returns:
+        dict: Number of pages checked, matching, falling back from the fast path, and paths of pages with different output.
+    """
+    report = {
+        "checked": 0,
+        "matching": 0,
+        "fallbacks": 0,
+        "mismatches": [],
+    }
+    for page_path in page_paths:
+        with open(page_path, "r", encoding="utf-8", errors="replace") as file:
+            html = file.read()
+
+        # Skip pages without statistics, like error pages
+        try:
+            expected = get_market_data_from_texts(get_block_texts_from_soup(html))
+        except (ValueError, IndexError):
+            continue
+        report["checked"] += 1
+
+        texts = get_block_texts_fast(html)
+        if texts is None or len(texts) < NUMBER_OF_BLOCKS:
+            report["fallbacks"] += 1
+        if extract_market_data(html) == expected:
+            report["matching"] += 1
+        else:
+            report["mismatches"].append(page_path)
+    return report
+
+
+def main(pages_directory: str = "data/cache/http/bodies"):
+
+    # Check all recorded pages, by default the bodies in the HTTP cache
+    page_paths = [os.path.join(pages_directory, file_name) for file_name in sorted(os.listdir(pages_directory)) if not file_name.endswith(".tmp")]
+    report = check_extractor(page_paths)
+    print(f"Checked {report['checked']} pages: {report['matching']} matching, {report['fallbacks']} fallbacks, {len(report['mismatches'])} mismatches")
+    for page_path in report["mismatches"]:
+        print(f"Mismatch: {page_path}")
+
+
+if __name__ == "__main__":
+    main()
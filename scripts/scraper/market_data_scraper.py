@@ -2,12 +2,32 @@ import json
 import os
 import math
 import asyncio
-import aiohttp
-from bs4 import BeautifulSoup
-from time import time
-import aiometer
+from time import time, monotonic
 import httpx
 import functools
+from concurrent.futures import ProcessPoolExecutor
+from scraper.http_client import HTTPClient
+from scraper.market_data_extractor import extract_market_data, print_market_data
+from scraper.http_cache import HTTPCache
+from scraper.scrape_journal import ScrapeJournal
+from processing.market_data_history import append_snapshot
+from processing.publish_outputs import write_if_changed, write_json_if_changed
+from scraper.adaptive_limiter import AdaptiveLimiter, HTTPStatusError, get_backoff_delay
+
+
+# Site with post code statistics, can be pointed at a local replay server (see scraper/replay_server.py)
+BASE_URL = os.environ.get("MARKET_DATA_BASE_URL", "https://www.krogsveen.no")
+
+
+# Write the legacy averagePrice20m2 ... averagePrice200m2 properties, for frontends that do not compute prices from averageSquareMeterPrice yet
+IS_LEGACY_SCHEMA = os.environ.get("MARKET_DATA_LEGACY_SCHEMA", "0") == "1"
+
+
+def get_post_code_url(post_code: str, base_url: str = None) -> str:
+    """Get the URL of the statistics page for a post code, on base_url or BASE_URL."""
+    if base_url is None:
+        base_url = BASE_URL
+    return f"{base_url.rstrip('/')}/prisstatistikk?zipCode={post_code}"
 
 
 def print_estimated_time_of_retrieval(cities: list, max_requests_per_second: int) -> None:
@@ -65,88 +85,143 @@ def print_estimated_time_of_retrieval(cities: list, max_requests_per_second: int
     print(f"Total number of postcodes: {total_number_of_postcodes}, Total estimated time of retrieval: {total_estimated_time_of_retrieval}")
     
 
-async def fetch(session: httpx.AsyncClient, url: str) -> httpx.Response:
+async def fetch(session: HTTPClient, url: httpx.Request, cache: HTTPCache = None) -> httpx.Response:
+    """Send request, using the cache if given.
+
+    Fresh cached responses are returned without a request. Stale ones are revalidated with a conditional request.
+
+    Args:
+        session (HTTPClient): Shared pooled HTTP client.
+        url (httpx.Request): Request to send.
+        cache (HTTPCache, optional): Response cache. Defaults to None.
+
+    Returns:
+        httpx.Response: Response with status code 200.
+    """
+    
+    # Send request without cache
+    if cache is None:
+        response = await session.send(url)
+        if response.status_code != 200:
+            raise HTTPStatusError(response)
+        return response
+    
+    # Return cached response if it is fresh
+    cached_response = cache.get_fresh_response(url)
+    if cached_response is not None:
+        return cached_response
+    
+    # Revalidate stale response with a conditional request
+    cache_url = str(url.url)
+    entry = cache.get_entry(cache_url)
+    if entry is not None:
+        url.headers.update(cache.get_conditional_headers(entry))
     response = await session.send(url)
+    if response.status_code == 304 and entry is not None:
+        cache.statistics["revalidated"] += 1
+        cache.refresh(entry, response)
+        return cache.get_response(entry, url)
     if response.status_code != 200:
-        raise Exception(f"HTTP status code: {response.status_code}")
+        raise HTTPStatusError(response)
+    
+    # Store new response
+    cache.statistics["misses"] += 1
+    cache.store(cache_url, response)
     return response
 
 
-async def get_market_data_from_response(response: str, post_code: str) -> tuple:
+async def fetch_with_retries(session: HTTPClient, request: httpx.Request, limiter: AdaptiveLimiter, cache: HTTPCache = None, max_retries: int = 5) -> httpx.Response:
+    """Send request through the adaptive limiter, retrying with jittered exponential backoff on throttling, server and network errors.
+
+    Retry-After from the server is honoured. Fresh cached responses skip the limiter.
+
+    Args:
+        session (HTTPClient): Shared pooled HTTP client.
+        request (httpx.Request): Request to send.
+        limiter (AdaptiveLimiter): Limiter shared by all requests.
+        cache (HTTPCache, optional): Response cache. Defaults to None.
+        max_retries (int, optional): Maximum number of retries. Defaults to 5.
+
+    Returns:
+        httpx.Response: Response with status code 200.
+    """
+    
+    # Return cached response without using the limiter
+    if cache is not None:
+        cached_response = cache.get_fresh_response(request)
+        if cached_response is not None:
+            return cached_response
+    
+    for attempt in range(max_retries + 1):
+        async with limiter:
+            start = monotonic()
+            try:
+                response = await fetch(session, request, cache)
+            except HTTPStatusError as error:
+                if not error.is_retryable():
+                    limiter.record_error(start)
+                    raise
+                if error.is_throttled():
+                    limiter.record_throttled(error.retry_after, start)
+                else:
+                    limiter.record_error(start)             # Isolated 5xx, only sustained errors slow down
+                if attempt == max_retries:
+                    raise
+                delay = error.retry_after if error.retry_after is not None else get_backoff_delay(attempt)
+            except httpx.TransportError:
+                limiter.record_error(start)
+                if attempt == max_retries:
+                    raise
+                delay = get_backoff_delay(attempt)
+            else:
+                limiter.record_success(monotonic() - start)
+                return response
+        
+        # Wait before retrying, outside the limiter so other requests can use the slot
+        limiter.statistics["retries"] += 1
+        await asyncio.sleep(delay)
+
+
+async def get_market_data_from_response(response: httpx.Response, post_code: str) -> tuple:
     """Get market data from response.
 
     Args:
-        response (str): Response from request.
+        response (httpx.Response): Response from request.
         post_code (str): Post code.
 
     Returns:
         tuple: Tuple with market data.
     """
+    return parse_market_data(response.text, post_code)
 
-    # Get soup
-    soup = BeautifulSoup(response.text, "html.parser")
-    
-    # Get data
-    data = soup.find_all("div", class_="css-j9s53t")
-    
-    # Get price percentage change last year
-    price_percentage_change_last_year = data[0].text.replace("Endring siste år", "").split(" ")[0].replace(",", ".")
-    if price_percentage_change_last_year[0] == "+": price_percentage_change_last_year = float(price_percentage_change_last_year[1:-1])        # Remove "+" and "%" and convert to float
-    elif price_percentage_change_last_year[0] == "-": price_percentage_change_last_year = float(price_percentage_change_last_year[1:-1]) * -1
-    elif price_percentage_change_last_year[0] == "0": price_percentage_change_last_year = 0.0
-    
-    # Get square meter price
-    square_meter_price = int(data[1].text.replace("Kvadratmeterpris", "").replace("kr", "").replace(" ", ""))
-    
-    # Get price percentage change last quarter
-    price_percentage_change_last_quarter = None
-    price_percentage_change_last_month = None
-    if "Endring siste kvartal" in data[2].text:                 # Check if price percentage change last quarter is available
-        price_percentage_change_last_quarter = data[2].text.replace("Endring siste kvartal", "").split(" ")[0].replace(",", ".")
-        if price_percentage_change_last_quarter[0] == "+": price_percentage_change_last_quarter = float(price_percentage_change_last_quarter[1:-1])         # Remove "+" and "%" and convert to float
-        elif price_percentage_change_last_quarter[0] == "-": price_percentage_change_last_quarter = float(price_percentage_change_last_quarter[1:-1]) * -1
-        elif price_percentage_change_last_quarter[0] == "0": price_percentage_change_last_quarter = 0.0
-    if "Endring siste måned" in data[2].text:                   # Check if price percentage change last month is available
-        price_percentage_change_last_month = data[2].text.replace("Endring siste måned", "").split(" ")[0].replace(",", ".")
-        if price_percentage_change_last_month[0] == "+": price_percentage_change_last_month = float(price_percentage_change_last_month[1:-1])               # Remove "+" and "%" and convert to float
-        elif price_percentage_change_last_month[0] == "-": price_percentage_change_last_month = float(price_percentage_change_last_month[1:-1]) * -1
-        elif price_percentage_change_last_month[0] == "0": price_percentage_change_last_month = 0.0
-    
-    # Get average sales time
-    average_sales_time = int(data[3].text.replace("Salgstid", "").split("\xa0")[0])
-    
-    # Get number of estates sold last quarter
-    number_of_estates_sold_last_quarter = None
-    number_of_estates_sold_last_month = None
-    if "Solgte boliger siste  kvartal" in data[4].text:         # Check if number of estates sold last quarter is available
-        number_of_estates_sold_last_quarter_string = data[4].text.replace("Solgte boliger siste  kvartal", "").split("\xa0")[0]
-        if " " in number_of_estates_sold_last_quarter_string:   # Check for thousands separator (" ")
-            number_of_estates_sold_last_quarter = int(number_of_estates_sold_last_quarter_string.split(" ")[0] + number_of_estates_sold_last_quarter_string.split(" ")[1])
-        else:
-            number_of_estates_sold_last_quarter = int(number_of_estates_sold_last_quarter_string)
-    if "Solgte boliger siste  måned" in data[4].text:           # Check if number of estates sold last month is available
-        number_of_estates_sold_last_month_string = data[4].text.replace("Solgte boliger siste  måned", "").split("\xa0")[0]
-        if " " in number_of_estates_sold_last_month_string:     # Check for thousands separator (" ")
-            number_of_estates_sold_last_month = int(number_of_estates_sold_last_month_string.split(" ")[0] + number_of_estates_sold_last_month_string.split(" ")[1])
-        else:
-            number_of_estates_sold_last_month = int(number_of_estates_sold_last_month_string)
-    
-    if price_percentage_change_last_quarter is not None:
-        print(f"Post code: {post_code}, Square meter price: {square_meter_price} --> Last Year ==> Price percentage change: {price_percentage_change_last_year}, --> Last Quarter ==> Price percentage change: {price_percentage_change_last_quarter}, Average sales time: {average_sales_time} Number of estates sold: {number_of_estates_sold_last_quarter}")
-    if price_percentage_change_last_month is not None:
-        print(f"Post code: {post_code}, Square meter price: {square_meter_price} --> Last Year ==> Price percentage change: {price_percentage_change_last_year}, --> Last Month ==> Price percentage change: {price_percentage_change_last_month}, Average sales time: {average_sales_time} Number of estates sold: {number_of_estates_sold_last_month}")
-    return price_percentage_change_last_year, square_meter_price, price_percentage_change_last_quarter, price_percentage_change_last_month, average_sales_time, number_of_estates_sold_last_quarter, number_of_estates_sold_last_month
 
+def parse_market_data(html: str, post_code: str) -> tuple:
+    """Parse market data from the HTML of a post code page. Synchronous, so it can run in a process pool.
+
+    Args:
+        html (str): HTML of the post code page.
+        post_code (str): Post code.
+
+    Returns:
+        tuple: Tuple with market data.
+    """
+
+    market_data = extract_market_data(html)
+    print_market_data(post_code, market_data)
+    return market_data
 
 
-async def add_market_data_to_dicts(i: int, postcodes_data: dict, postcodes_market_data: dict, results: list) -> tuple:
+async def add_market_data_to_dicts(i: int, postcodes_data: dict, postcodes_market_data: dict, results: list, is_legacy_schema: bool = None) -> tuple:
     """Add market data to dictionaries.
 
+    Prices for a given size are computed by the frontend as averageSquareMeterPrice * square meters, so only the square meter price is stored.
+
     Args:
         i (int): Index.
         postcodes_data (dict): Data with postcodes.
         postcodes_market_data (dict): Market data for postcodes.
         results (list(httpx.Response)): List of responses.
+        is_legacy_schema (bool, optional): Also add averagePrice20m2 ... averagePrice200m2, otherwise remove them. Defaults to IS_LEGACY_SCHEMA.
 
     Returns:
         tuple: 
@@ -166,12 +241,17 @@ async def add_market_data_to_dicts(i: int, postcodes_data: dict, postcodes_marke
     # Update average square meter price in geojson
     postcodes_data["features"][i]["properties"]["averageSquareMeterPrice"] = square_meter_price
     
-    # Update average price for 20m2, 30m2, ..., 200m2
+    # Update average price for 20m2, 30m2, ..., 200m2 in the legacy schema, and remove them from inputs that have them otherwise
+    if is_legacy_schema is None:
+        is_legacy_schema = IS_LEGACY_SCHEMA
     start_square_meter_size = 20
     end_square_meter_size = 200
     step_size = 10
     for j in range(start_square_meter_size, end_square_meter_size + 1, step_size):
-        postcodes_data["features"][i]["properties"][f"averagePrice{j}m2"] = square_meter_price * j
+        if is_legacy_schema:
+            postcodes_data["features"][i]["properties"][f"averagePrice{j}m2"] = square_meter_price * j
+        else:
+            postcodes_data["features"][i]["properties"].pop(f"averagePrice{j}m2", None)
     
     # Add market data to postcodes_market_data
     postcodes_market_data[postcodes_data["features"][i]["properties"]["postnummer"]] = {
@@ -187,39 +267,177 @@ async def add_market_data_to_dicts(i: int, postcodes_data: dict, postcodes_marke
     return postcodes_data, postcodes_market_data
 
 
-async def get_market_data_from_post_codes_from_geojson(city: str) -> None:
-    """Get market data from post codes from geojson.
+def get_journal(city: str) -> ScrapeJournal:
+    """Get the journal with scraped market data for a city.
 
     Args:
         city (str): City.
 
     Returns:
-        None 
+        ScrapeJournal: Journal for the city.
+    """
+    # journal_path = os.path.join(os.getcwd(), f"../data/journals/market_data_{city}.jsonl")
+    journal_path = os.path.join(os.getcwd(), f"data/journals/market_data_{city}.jsonl")      # Use when running script from prepare_postcodes.py
+    return ScrapeJournal(journal_path)
+
+
+async def fetch_and_enqueue(session: HTTPClient, request: httpx.Request, post_code: str, queue: asyncio.Queue, limiter: AdaptiveLimiter, cache: HTTPCache = None) -> bool:
+    """Fetch the page for a post code and put its HTML on the parse queue.
+
+    Only the HTML is queued, so the response is released as soon as it is read. Waits if the queue is full.
+
+    Args:
+        session (HTTPClient): Shared pooled HTTP client.
+        request (httpx.Request): Request for the post code page.
+        post_code (str): Post code.
+        queue (asyncio.Queue): Queue of (post code, HTML) to parse.
+        limiter (AdaptiveLimiter): Limiter shared by all requests.
+        cache (HTTPCache, optional): Response cache. Defaults to None.
+
+    Returns:
+        bool: True if the page was queued, False if the request failed.
+    """
+    try:
+        response = await fetch_with_retries(session, request, limiter, cache)
+    except Exception as error:
+        print(f"Failed getting market data for post code {post_code}: {repr(error)}")
+        return False
+    await queue.put((post_code, response.text))
+    return True
+
+
+async def parse_and_journal(queue: asyncio.Queue, executor: ProcessPoolExecutor, journals_per_post_code: dict) -> None:
+    """Parse queued pages in a process pool and append the market data to the journals, until a None item is received.
+
+    Args:
+        queue (asyncio.Queue): Queue of (post code, HTML) to parse.
+        executor (ProcessPoolExecutor): Process pool for parsing.
+        journals_per_post_code (dict): Journals to append the market data to, with post codes as keys.
+
+    Returns:
+        None
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await queue.get()
+        if item is None:
+            return None
+        post_code, html = item
+        try:
+            market_data = await loop.run_in_executor(executor, parse_market_data, html, post_code)
+        except Exception as error:
+            print(f"Failed parsing market data for post code {post_code}: {repr(error)}")
+            continue
+        for journal in journals_per_post_code[post_code]:
+            journal.append(post_code, market_data)
+
+
+async def wait_unless_parsers_fail(awaitable, parsers: list):
+    """Wait for an awaitable, and cancel it and raise the error of the first parser that fails meanwhile.
+
+    Without this a failed parser leaves the queue undrained, and fetchers wait forever to put pages on it.
+
+    Args:
+        awaitable (Awaitable): Fetchers, or putting the stop items on the queue.
+        parsers (list): Parser tasks.
+
+    Returns:
+        Any: Result of the awaitable.
+    """
+    task = asyncio.ensure_future(awaitable)
+    running = [task, *parsers]
+    while not task.done():
+        done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+        for parser in done:
+            if parser is not task and not parser.cancelled() and parser.exception() is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                raise parser.exception()
+        running = [running_task for running_task in running if not running_task.done()]
+    return task.result()
+
+
+async def scrape_post_codes(journals_per_post_code: dict, cache: HTTPCache = None, max_requests_at_once: int = 10, max_requests_per_second: int = 5, limiter: AdaptiveLimiter = None, client: HTTPClient = None, max_parse_workers: int = 2, max_queue_size: int = 20, base_url: str = None) -> None:
+    """Fetch and parse the pages for post codes in a streaming pipeline, and journal each result.
+
+    Fetchers put pages on a bounded queue, while a process pool parses earlier pages, so the parse cost is hidden behind network latency
+    and at most max_queue_size pages are held in memory at once. Requests go through an adaptive limiter that follows what the server allows.
+
+    Args:
+        journals_per_post_code (dict): Journals to append the market data to, with post codes as keys.
+        cache (HTTPCache, optional): Response cache. Defaults to None.
+        max_requests_at_once (int, optional): Initial number of concurrent requests. Defaults to 10.
+        max_requests_per_second (int, optional): Initial number of requests per second. Defaults to 5.
+        limiter (AdaptiveLimiter, optional): Limiter for requests. Defaults to an AdaptiveLimiter starting at max_requests_at_once and max_requests_per_second.
+        client (HTTPClient, optional): Shared pooled HTTP client. Defaults to a client that is closed when scraping is done.
+        max_parse_workers (int, optional): Number of parsing processes. Defaults to 2.
+        max_queue_size (int, optional): Maximum number of fetched pages waiting to be parsed. Defaults to 20.
+        base_url (str, optional): Site to fetch pages from. Defaults to BASE_URL.
+
+    Returns:
+        None
     """
+    if limiter is None:
+        limiter = AdaptiveLimiter(initial_rate=max_requests_per_second, initial_concurrency=max_requests_at_once)
+    is_own_client = client is None
+    if is_own_client:
+        client = HTTPClient(max_connections=limiter.max_concurrency)
+    queue = asyncio.Queue(maxsize=max_queue_size)
+    post_codes = iter(journals_per_post_code.keys())
     
-    # Async parameters
-    max_requests_at_once = 10
-    max_requests_per_second = 5
+    async def fetch_post_codes() -> None:
+        for post_code in post_codes:                # Shared iterator, so each post code is fetched by one fetcher
+            request = client.build_request("GET", get_post_code_url(post_code, base_url))
+            await fetch_and_enqueue(client, request, post_code, queue, limiter, cache)
     
-    # Get postcodes data
-    # postcodes_cleaned_path = os.path.join(os.getcwd(), f"../data/postcodes_cleaned/postcodes_{city}.json")
-    postcodes_cleaned_path = os.path.join(os.getcwd(), f"data/postcodes_cleaned/postcodes_{city}.json")      # Use when running script from prepare_postcodes.py
-    with open(postcodes_cleaned_path, "r") as file:
-        postcodes_data = json.load(file)
+    async def stop_parsers(parsers: list) -> None:
+        for _ in parsers:
+            await queue.put(None)
     
-    # Get pages with square meter prices asynchronously
-    session = httpx.AsyncClient()
-    requests = [httpx.Request("GET", f"https://www.krogsveen.no/prisstatistikk?zipCode={feature['properties']['postnummer']}") for feature in postcodes_data["features"]]
-    responses = [functools.partial(fetch, session, request) for request in requests]
-    results = await aiometer.run_all(
-                        responses,
-                        max_at_once=max_requests_at_once, # Limit maximum number of concurrently running tasks.
-                        max_per_second=max_requests_per_second,  # Limit request rate to not overload the server.
-                    )
+    try:
+        with ProcessPoolExecutor(max_workers=max_parse_workers) as executor:
+            
+            # Start parsers, and fetchers, the limiter decides how many fetchers send requests at once
+            parsers = [asyncio.create_task(parse_and_journal(queue, executor, journals_per_post_code)) for _ in range(max_parse_workers)]
+            fetchers = [asyncio.create_task(fetch_post_codes()) for _ in range(limiter.max_concurrency)]
+            try:
+                
+                # Fetch pages, then stop parsers when all queued pages are parsed
+                await wait_unless_parsers_fail(asyncio.gather(*fetchers), parsers)
+                await wait_unless_parsers_fail(stop_parsers(parsers), parsers)
+                await asyncio.gather(*parsers)
+            finally:
+                
+                # Cancel what is still running after a failure, so nothing is left waiting on the queue
+                for task in fetchers + parsers:
+                    task.cancel()
+                await asyncio.gather(*fetchers, *parsers, return_exceptions=True)
+    finally:
+        if is_own_client:
+            await client.close()
+    
+    print(f"Limiter statistics: {limiter.statistics}, final rate: {limiter.rate:.2f} requests per second, final concurrency: {limiter.concurrency}")
+    return None
+
+
+async def write_market_data_from_journal(city: str, postcodes_data: dict, journal: ScrapeJournal) -> None:
+    """Write finalized postcodes data and market data for a city from its journal.
+
+    Args:
+        city (str): City.
+        postcodes_data (dict): Cleaned postcodes data for the city.
+        journal (ScrapeJournal): Journal with market data for the city.
 
-    # Get market data from responses
-    for i, response in enumerate(results):
-        results[i] = await get_market_data_from_response(response, post_code=postcodes_data["features"][i]["properties"]["postnummer"])
+    Returns:
+        None
+    """
+    
+    # Get market data for each feature from journal
+    journaled_results = journal.load()
+    missing_post_codes = [feature["properties"]["postnummer"] for feature in postcodes_data["features"] if feature["properties"]["postnummer"] not in journaled_results]
+    if len(missing_post_codes) > 0:
+        raise Exception(f"Missing market data for {len(missing_post_codes)} post codes in {city}, rerun with is_resume=True to get only the missing post codes: {missing_post_codes}")
+    results = [journaled_results[feature["properties"]["postnummer"]] for feature in postcodes_data["features"]]
     
     # Update postcodes data and market data to file
     postcodes_market_data = {}
@@ -229,22 +447,138 @@ async def get_market_data_from_post_codes_from_geojson(city: str) -> None:
     # Save updated post codes data
     # postcodes_finalized_path = os.path.join(os.getcwd(), f"../data/postcodes_finalized/postcodes_{city}.json")
     postcodes_finalized_path = os.path.join(os.getcwd(), f"data/postcodes_finalized/postcodes_{city}.json")      # Use when running script from prepare_postcodes.py
-    with open(postcodes_finalized_path, "w") as file:
-        json.dump(postcodes_data, file, indent=2)
+    write_json_if_changed(postcodes_finalized_path, postcodes_data)
     
     # Save market data to file
     # postcodes_market_data_path = os.path.join(os.getcwd(), f"../data/postcodes_market_data_finalized/postcodes_market_data_{city}.json")
     postcodes_market_data_path = os.path.join(os.getcwd(), f"data/postcodes_market_data_finalized/postcodes_market_data_{city}.json")        # Use when running script from prepare_postcodes.py
-    with open(postcodes_market_data_path, "w") as file:
-        file.write(json.dumps(postcodes_market_data, indent=2))
-        file.write("\n")
+    write_if_changed(postcodes_market_data_path, (json.dumps(postcodes_market_data, indent=2) + "\n").encode())
+    
+    # Append market data to history, so earlier runs are kept
+    snapshot_path = append_snapshot(city, postcodes_market_data)
     
     print(f"Updated {len(postcodes_data['features'])} post codes data in for city {city} successfully to {postcodes_finalized_path}")
-    print(f"Saved {len(postcodes_market_data.keys())} square meter prices for city {city} to {postcodes_market_data_path}")
+    print(f"Saved {len(postcodes_market_data.keys())} square meter prices for city {city} to {postcodes_market_data_path} and {snapshot_path}")
+    return None
+
+
+async def get_market_data_from_post_codes_from_geojson(city: str, cache: HTTPCache = None, is_resume: bool = False, base_url: str = None) -> None:
+    """Get market data from post codes from geojson.
+
+    Every result is appended to a journal as soon as it arrives, and the finalized files are built from the journal.
+
+    Args:
+        city (str): City.
+        cache (HTTPCache, optional): Response cache, so reruns do not download unchanged pages again. Defaults to None.
+        is_resume (bool, optional): Skip post codes that are already in the journal from an earlier run. Defaults to False, which starts a new journal.
+        base_url (str, optional): Site to fetch pages from. Defaults to BASE_URL.
+
+    Returns:
+        None 
+    """
+    
+    # Async parameters
+    max_requests_at_once = 10
+    max_requests_per_second = 5
+    
+    # Get postcodes data
+    # postcodes_cleaned_path = os.path.join(os.getcwd(), f"../data/postcodes_cleaned/postcodes_{city}.json")
+    postcodes_cleaned_path = os.path.join(os.getcwd(), f"data/postcodes_cleaned/postcodes_{city}.json")      # Use when running script from prepare_postcodes.py
+    with open(postcodes_cleaned_path, "r") as file:
+        postcodes_data = json.load(file)
+    
+    # Get journal, and skip post codes that are already done when resuming
+    journal = get_journal(city)
+    if not is_resume:
+        journal.clear()
+    journaled_post_codes = journal.load().keys()
+    post_codes = [feature["properties"]["postnummer"] for feature in postcodes_data["features"] if feature["properties"]["postnummer"] not in journaled_post_codes]
+    if is_resume:
+        print(f"Resuming {city}: {len(journaled_post_codes)} post codes already done, {len(post_codes)} remaining")
+    
+    # Get pages with square meter prices asynchronously, and journal each result as it arrives
+    await scrape_post_codes(
+        {post_code: [journal] for post_code in post_codes},
+        cache=cache,
+        max_requests_at_once=max_requests_at_once,
+        max_requests_per_second=max_requests_per_second,
+        base_url=base_url,
+    )
+
+    # Save finalized data from journal
+    await write_market_data_from_journal(city, postcodes_data, journal)
     return None
 
 
 
+async def get_market_data_for_cities(cities: list, cache: HTTPCache = None, is_resume: bool = False, base_url: str = None) -> dict:
+    """Get market data for all cities with one global scheduler and one rate limit.
+
+    Post codes from all cities are deduplicated and fetched through a single limiter, so there are no gaps at the end of each city.
+    Each result is journaled to every city that contains the post code, and the finalized files for each city are built from its journal.
+
+    Args:
+        cities (list): List of cities.
+        cache (HTTPCache, optional): Response cache. Defaults to None.
+        is_resume (bool, optional): Skip post codes that are already in the journals from an earlier run. Defaults to False.
+        base_url (str, optional): Site to fetch pages from. Defaults to BASE_URL.
+
+    Returns:
+        dict: Reports with cities as keys, each with "status" ("succeeded" or "failed") and "error" if failed.
+    """
+    
+    # Async parameters
+    max_requests_at_once = 10
+    max_requests_per_second = 5
+    
+    # Get postcodes data and journals for all cities
+    postcodes_data_per_city = {}
+    journals = {}
+    for city in cities:
+        # postcodes_cleaned_path = os.path.join(os.getcwd(), f"../data/postcodes_cleaned/postcodes_{city}.json")
+        postcodes_cleaned_path = os.path.join(os.getcwd(), f"data/postcodes_cleaned/postcodes_{city}.json")      # Use when running script from prepare_postcodes.py
+        with open(postcodes_cleaned_path, "r") as file:
+            postcodes_data_per_city[city] = json.load(file)
+        journals[city] = get_journal(city)
+        if not is_resume:
+            journals[city].clear()
+    
+    # Get unique post codes, and the journals of all cities that still need each post code
+    journals_per_post_code = {}
+    number_of_post_codes = 0
+    for city in cities:
+        journaled_post_codes = journals[city].load().keys()
+        for feature in postcodes_data_per_city[city]["features"]:
+            post_code = feature["properties"]["postnummer"]
+            number_of_post_codes += 1
+            if post_code in journaled_post_codes:
+                continue
+            city_journals = journals_per_post_code.setdefault(post_code, [])
+            if journals[city] not in city_journals:
+                city_journals.append(journals[city])
+    print(f"Scheduling {len(journals_per_post_code)} unique post codes ({number_of_post_codes} post codes in {len(cities)} cities)")
+    
+    # Get pages for all cities through one limiter
+    await scrape_post_codes(
+        journals_per_post_code,
+        cache=cache,
+        max_requests_at_once=max_requests_at_once,
+        max_requests_per_second=max_requests_per_second,
+        base_url=base_url,
+    )
+    
+    # Save finalized data for each city from its journal
+    reports = {}
+    for city in cities:
+        try:
+            await write_market_data_from_journal(city, postcodes_data_per_city[city], journals[city])
+            reports[city] = {"status": "succeeded"}
+        except Exception as error:
+            print(f"Failed saving market data for city {city}: {repr(error)}")
+            reports[city] = {"status": "failed", "error": repr(error)}
+    return reports
+
+
 async def main():
     
     cities = [
@@ -260,10 +594,9 @@ async def main():
     
     print_estimated_time_of_retrieval(cities, max_requests_per_second=5)
     
-    for city in cities:
-        print(f"Started getting market data for: {city}")
-        await get_market_data_from_post_codes_from_geojson(city)
-        print(f"Finished getting market data for: {city}\n\n")
+    cache = HTTPCache()
+    await get_market_data_for_cities(cities, cache=cache)
+    print(f"Cache statistics: {cache.statistics}")
 
 
 if __name__ == "__main__":
@@ -1,69 +1,24 @@
 import json
 import os
+import sys
 import asyncio
-import aiohttp
-from bs4 import BeautifulSoup
 
+# Run from scripts/scraper, where the ../../frontend paths below resolve, with the packages in scripts/ importable
+SCRIPTS_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SCRIPTS_DIRECTORY not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIRECTORY)
 
-async def get_market_data_from_post_code(post_code):
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(f"https://www.krogsveen.no/prisstatistikk?zipCode={post_code}") as response:
-                response_text = await response.text()
-                soup = BeautifulSoup(response_text, "html.parser")
-                
-                # Get data
-                data = soup.find_all("div", class_="css-j9s53t")
-                
-                # Get price percentage change last year
-                price_percentage_change_last_year = data[0].text.replace("Endring siste år", "").split(" ")[0].replace(",", ".")
-                if price_percentage_change_last_year[0] == "+": price_percentage_change_last_year = float(price_percentage_change_last_year[1:-1])        # Remove "+" and "%" and convert to float
-                elif price_percentage_change_last_year[0] == "-": price_percentage_change_last_year = float(price_percentage_change_last_year[1:-1]) * -1
-                elif price_percentage_change_last_year[0] == "0": price_percentage_change_last_year = 0.0
-                
-                # Get square meter price
-                square_meter_price = int(data[1].text.replace("Kvadratmeterpris", "").replace("kr", "").replace(" ", ""))
-                
-                # Get price percentage change last quarter
-                price_percentage_change_last_quarter = None
-                price_percentage_change_last_month = None
-                if "Endring siste kvartal" in data[2].text:                 # Check if price percentage change last quarter is available
-                    price_percentage_change_last_quarter = data[2].text.replace("Endring siste kvartal", "").split(" ")[0].replace(",", ".")
-                    if price_percentage_change_last_quarter[0] == "+": price_percentage_change_last_quarter = float(price_percentage_change_last_quarter[1:-1])         # Remove "+" and "%" and convert to float
-                    elif price_percentage_change_last_quarter[0] == "-": price_percentage_change_last_quarter = float(price_percentage_change_last_quarter[1:-1]) * -1
-                    elif price_percentage_change_last_quarter[0] == "0": price_percentage_change_last_quarter = 0.0
-                if "Endring siste måned" in data[2].text:                   # Check if price percentage change last month is available
-                    price_percentage_change_last_month = data[2].text.replace("Endring siste måned", "").split(" ")[0].replace(",", ".")
-                    if price_percentage_change_last_month[0] == "+": price_percentage_change_last_month = float(price_percentage_change_last_month[1:-1])               # Remove "+" and "%" and convert to float
-                    elif price_percentage_change_last_month[0] == "-": price_percentage_change_last_month = float(price_percentage_change_last_month[1:-1]) * -1
-                    elif price_percentage_change_last_month[0] == "0": price_percentage_change_last_month = 0.0
-                
-                # Get average sales time
-                average_sales_time = int(data[3].text.replace("Salgstid", "").split("\xa0")[0])
-                
-                # Get number of estates sold last quarter
-                number_of_estates_sold_last_quarter = None
-                number_of_estates_sold_last_month = None
-                if "Solgte boliger siste  kvartal" in data[4].text:         # Check if number of estates sold last quarter is available
-                    number_of_estates_sold_last_quarter_string = data[4].text.replace("Solgte boliger siste  kvartal", "").split("\xa0")[0]
-                    if " " in number_of_estates_sold_last_quarter_string:   # Check for thousands separator (" ")
-                        number_of_estates_sold_last_quarter = int(number_of_estates_sold_last_quarter_string.split(" ")[0] + number_of_estates_sold_last_quarter_string.split(" ")[1])
-                    else:
-                        number_of_estates_sold_last_quarter = int(number_of_estates_sold_last_quarter_string)
-                if "Solgte boliger siste  måned" in data[4].text:           # Check if number of estates sold last month is available
-                    number_of_estates_sold_last_month_string = data[4].text.replace("Solgte boliger siste  måned", "").split("\xa0")[0]
-                    if " " in number_of_estates_sold_last_month_string:     # Check for thousands separator (" ")
-                        number_of_estates_sold_last_month = int(number_of_estates_sold_last_month_string.split(" ")[0] + number_of_estates_sold_last_month_string.split(" ")[1])
-                    else:
-                        number_of_estates_sold_last_month = int(number_of_estates_sold_last_month_string)
-                
-                if price_percentage_change_last_quarter is not None:
-                    print(f"Post code: {post_code}, Square meter price: {square_meter_price} --> Last Year ==> Price percentage change: {price_percentage_change_last_year}, --> Last Quarter ==> Price percentage change: {price_percentage_change_last_quarter}, Average sales time: {average_sales_time} Number of estates sold: {number_of_estates_sold_last_quarter}")
-                if price_percentage_change_last_month is not None:
-                    print(f"Post code: {post_code}, Square meter price: {square_meter_price} --> Last Year ==> Price percentage change: {price_percentage_change_last_year}, --> Last Month ==> Price percentage change: {price_percentage_change_last_month}, Average sales time: {average_sales_time} Number of estates sold: {number_of_estates_sold_last_month}")
-                return price_percentage_change_last_year, square_meter_price, price_percentage_change_last_quarter, price_percentage_change_last_month, average_sales_time, number_of_estates_sold_last_quarter, number_of_estates_sold_last_month
-        finally:
-            await session.close()
+from scraper.http_client import HTTPClient
+from scraper.market_data_scraper import get_post_code_url, IS_LEGACY_SCHEMA
+from processing.publish_outputs import write_if_changed, write_json_if_changed
+from scraper.market_data_extractor import extract_market_data, print_market_data
+
+
+async def get_market_data_from_post_code(client: HTTPClient, post_code):
+    response = await client.get(get_post_code_url(post_code))
+    market_data = extract_market_data(response.text)
+    print_market_data(post_code, market_data)
+    return market_data
 
 async def get_market_data_from_post_codes_from_geojson():
     
@@ -72,9 +27,10 @@ async def get_market_data_from_post_codes_from_geojson():
     with open(postcodes_path, "r") as file:
         postcodes_data = json.load(file)
     
-    # Get square meter prices asynchronously
-    tasks = [get_market_data_from_post_code(feature["properties"]["postnummer"]) for feature in postcodes_data["features"]]
-    results = await asyncio.gather(*tasks)
+    # Get square meter prices asynchronously over one pooled client, which bounds the number of open connections
+    async with HTTPClient() as client:
+        tasks = [get_market_data_from_post_code(client, feature["properties"]["postnummer"]) for feature in postcodes_data["features"]]
+        results = await asyncio.gather(*tasks)
     
     # Update postcodes data and save square meter prices to file
     square_meter_prices = {}
@@ -94,24 +50,24 @@ async def get_market_data_from_post_codes_from_geojson():
         # Update average square meter price in geojson
         postcodes_data["features"][i]["properties"]["averageSquareMeterPrice"] = square_meter_price
         
-        # Update average price for 20m2, 30m2, ..., 200m2
+        # Update average price for 20m2, 30m2, ..., 200m2 in the legacy schema, and remove them from postcodes.json otherwise
         start_square_meter_size = 20
         end_square_meter_size = 200
         step_size = 10
         for j in range(start_square_meter_size, end_square_meter_size + 1, step_size):
-            postcodes_data["features"][i]["properties"][f"averagePrice{j}m2"] = square_meter_price * j
+            if IS_LEGACY_SCHEMA:
+                postcodes_data["features"][i]["properties"][f"averagePrice{j}m2"] = square_meter_price * j
+            else:
+                postcodes_data["features"][i]["properties"].pop(f"averagePrice{j}m2", None)
         
         # Add square meter price to dictionary for square meter prices json
         square_meter_prices[feature["properties"]["postnummer"]] = square_meter_price
     
-    # Save updated post codes data
-    with open(postcodes_path, "w") as file:
-        json.dump(postcodes_data, file, indent=2)
+    # Save updated post codes data, unchanged files are not rewritten
+    write_json_if_changed(postcodes_path, postcodes_data)
     
     # Save square meter prices to file
-    with open("../../frontend/public/data/square_meter_prices.json", "w") as file:
-        file.write(json.dumps(square_meter_prices, indent=4))
-        file.write("\n")
+    write_if_changed("../../frontend/public/data/square_meter_prices.json", (json.dumps(square_meter_prices, indent=4) + "\n").encode())
     
     print(f"Updated {len(postcodes_data['features'])} post codes data successfully to ../../frontend/public/data/postcodes.json")
     print(f"Saved {len(square_meter_prices.keys())} square meter prices to ../../frontend/public/data/square_meter_prices.json")
@@ -0,0 +1,133 @@
+import json
+import os
+import asyncio
+from time import time
+from scraper.http_client import HTTPClient
+from scraper.http_cache import HTTPCache
+from scraper.adaptive_limiter import AdaptiveLimiter
+from scraper.market_data_scraper import fetch_with_retries, get_post_code_url
+
+
+# Recorded post code pages, one {post code}.html per page and an index.json with metadata
+# CORPUS_DIRECTORY = os.path.join(os.getcwd(), "../data/fixtures/market_data_pages")
+CORPUS_DIRECTORY = os.path.join(os.getcwd(), "data/fixtures/market_data_pages")      # Use when running script from scripts/
+
+
+def get_page_path(corpus_directory: str, post_code: str) -> str:
+    return os.path.join(corpus_directory, f"{post_code}.html")
+
+
+def load_index(corpus_directory: str = CORPUS_DIRECTORY) -> dict:
+    """Load the index of a corpus, with post codes as keys."""
+    index_path = os.path.join(corpus_directory, "index.json")
+    if not os.path.exists(index_path):
+        return {}
+    with open(index_path, "r") as file:
+        return json.load(file)
+
+
+def save_page(corpus_directory: str, index: dict, post_code: str, html: str, url: str, content_type: str) -> None:
+    """Save a recorded page to the corpus and add it to the index."""
+    with open(get_page_path(corpus_directory, post_code), "w", encoding="utf-8") as file:
+        file.write(html)
+    index[post_code] = {
+        "url": url,
+        "content_type": content_type,
+        "size": len(html.encode("utf-8")),
+        "recorded_at": time(),
+    }
+    return None
+
+
+def save_index(corpus_directory: str, index: dict) -> None:
+    with open(os.path.join(corpus_directory, "index.json"), "w") as file:
+        json.dump(index, file, indent=2, sort_keys=True)
+    return None
+
+
+async def record_pages(post_codes: list, corpus_directory: str = CORPUS_DIRECTORY, base_url: str = None, max_requests_per_second: float = 2) -> dict:
+    """Record the statistics pages for post codes into a fixture corpus.
+
+    Args:
+        post_codes (list): Post codes to record.
+        corpus_directory (str, optional): Directory of the corpus. Defaults to CORPUS_DIRECTORY.
+        base_url (str, optional): Site to record from. Defaults to BASE_URL of the scraper.
+        max_requests_per_second (float, optional): Maximum number of requests per second. Defaults to 2.
+
+    Returns:
+        dict: Index of the corpus, with post codes as keys.
+    """
+    os.makedirs(corpus_directory, exist_ok=True)
+    index = load_index(corpus_directory)
+    limiter = AdaptiveLimiter(initial_rate=max_requests_per_second, max_rate=max_requests_per_second, initial_concurrency=4, max_concurrency=4)
+
+    async def record_page(client: HTTPClient, post_code: str) -> None:
+        request = client.build_request("GET", get_post_code_url(post_code, base_url))
+        try:
+            response = await fetch_with_retries(client, request, limiter)
+        except Exception as error:
+            print(f"Failed recording page for post code {post_code}: {repr(error)}")
+            return None
+        save_page(corpus_directory, index, post_code, response.text, str(request.url), response.headers.get("content-type", "text/html"))
+        return None
+
+    async with HTTPClient(max_connections=limiter.max_concurrency) as client:
+        await asyncio.gather(*[record_page(client, post_code) for post_code in post_codes])
+    save_index(corpus_directory, index)
+
+    print(f"Recorded {len(index)} pages to {corpus_directory}")
+    return index
+
+
+def record_pages_from_cache(cache: HTTPCache, corpus_directory: str = CORPUS_DIRECTORY) -> dict:
+    """Record the post code pages already in the HTTP cache into a fixture corpus, without any requests.
+
+    Args:
+        cache (HTTPCache): Response cache of the scraper.
+        corpus_directory (str, optional): Directory of the corpus. Defaults to CORPUS_DIRECTORY.
+
+    Returns:
+        dict: Index of the corpus, with post codes as keys.
+    """
+    os.makedirs(corpus_directory, exist_ok=True)
+    index = load_index(corpus_directory)
+    for entry in list(cache.entries.values()):
+        if "zipCode=" not in entry["url"] or cache.get_entry(entry["url"]) is None:
+            continue
+        post_code = entry["url"].split("zipCode=")[1].split("&")[0]
+        html = cache.read_body(entry).decode("utf-8", errors="replace")
+        save_page(corpus_directory, index, post_code, html, entry["url"], entry["headers"].get("content-type", "text/html"))
+    save_index(corpus_directory, index)
+
+    print(f"Recorded {len(index)} pages from cache to {corpus_directory}")
+    return index
+
+
+def get_post_codes(cities: list) -> list:
+    """Get the unique post codes of the cleaned postcodes data for cities."""
+    post_codes = []
+    for city in cities:
+        # postcodes_cleaned_path = os.path.join(os.getcwd(), f"../data/postcodes_cleaned/postcodes_{city}.json")
+        postcodes_cleaned_path = os.path.join(os.getcwd(), f"data/postcodes_cleaned/postcodes_{city}.json")      # Use when running script from scripts/
+        with open(postcodes_cleaned_path, "r") as file:
+            postcodes_data = json.load(file)
+        for feature in postcodes_data["features"]:
+            if feature["properties"]["postnummer"] not in post_codes:
+                post_codes.append(feature["properties"]["postnummer"])
+    return post_codes
+
+
+async def main():
+
+    cities = [
+        "oslo",
+    ]
+
+    # Record pages already in the cache first, then the remaining pages from the site
+    index = record_pages_from_cache(HTTPCache())
+    post_codes = [post_code for post_code in get_post_codes(cities) if post_code not in index]
+    await record_pages(post_codes)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,172 @@
+import os
+import re
+import random
+import threading
+from time import sleep
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from scraper.page_recorder import CORPUS_DIRECTORY, get_page_path
+
+
+# Post codes served from the corpus, anything else is a 404 so zipCode cannot name files outside the corpus
+POST_CODE_PATTERN = re.compile(r"\d{4}", re.ASCII)
+
+
+class ReplayRequestHandler(BaseHTTPRequestHandler):
+    """Serves recorded pages for /prisstatistikk?zipCode={post code}, with the faults configured on the ReplayServer."""
+
+    protocol_version = "HTTP/1.1"           # Keep connections alive, like the real site
+
+    def do_GET(self) -> None:
+        replay = self.server.replay
+        replay.wait()
+
+        # Inject throttling and errors
+        fault = replay.get_fault()
+        if fault == "throttled":
+            self.send_body(429, b"Too Many Requests", {"Retry-After": str(replay.retry_after_in_seconds)})
+            return None
+        if fault == "error":
+            self.send_body(503, b"Service Unavailable")
+            return None
+
+        # Serve recorded page
+        url = urlparse(self.path)
+        post_code = parse_qs(url.query).get("zipCode", [None])[0]
+        page_path = get_page_path(replay.corpus_directory, post_code) if url.path == "/prisstatistikk" and post_code and POST_CODE_PATTERN.fullmatch(post_code) else None
+        if page_path is None or not os.path.exists(page_path):
+            replay.count("not_found")
+            self.send_body(404, b"Not Found")
+            return None
+        with open(page_path, "rb") as file:
+            body = file.read()
+        replay.count("served")
+        self.send_body(200, body, {"Content-Type": "text/html; charset=utf-8"})
+        return None
+
+    def send_body(self, status_code: int, body: bytes, headers: dict = None) -> None:
+        self.send_response(status_code)
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        return None
+
+    def log_message(self, format: str, *args) -> None:
+        return None
+
+
+class ReplayServer:
+    """Local stand-in for the statistics site that replays a recorded page corpus.
+
+    Each response is delayed by latency ± jitter. A share of requests gets 503 (error_rate), and bursts of 429 with Retry-After
+    can be injected: of every burst_every requests, the last burst_length are throttled.
+
+    Usage:
+        with ReplayServer(latency_in_seconds=0.1, error_rate=0.02, burst_every=200, burst_length=10) as server:
+            await get_market_data_for_cities(cities, base_url=server.base_url)
+    """
+
+    def __init__(
+        self,
+        corpus_directory: str = CORPUS_DIRECTORY,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency_in_seconds: float = 0.05,
+        jitter_in_seconds: float = 0.02,
+        error_rate: float = 0.0,
+        burst_every: int = 0,
+        burst_length: int = 0,
+        retry_after_in_seconds: int = 1,
+        seed: int = None,
+    ) -> None:
+        self.corpus_directory = corpus_directory
+        self.latency_in_seconds = latency_in_seconds
+        self.jitter_in_seconds = jitter_in_seconds
+        self.error_rate = error_rate
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.retry_after_in_seconds = retry_after_in_seconds
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.thread = None
+
+        self.server = ThreadingHTTPServer((host, port), ReplayRequestHandler)
+        self.server.daemon_threads = True
+        self.server.replay = self
+        self.base_url = f"http://{host}:{self.server.server_address[1]}"
+
+        # Statistics
+        self.statistics = {
+            "requests": 0,
+            "served": 0,
+            "not_found": 0,
+            "errors": 0,
+            "throttled": 0,
+        }
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+    def start(self) -> None:
+        """Serve in a background thread."""
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return None
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        if self.thread is not None:
+            self.thread.join()
+        return None
+
+    def count(self, key: str) -> None:
+        with self.lock:
+            self.statistics[key] += 1
+        return None
+
+    def wait(self) -> None:
+        """Wait for the configured latency with jitter."""
+        with self.lock:
+            delay = self.latency_in_seconds + self.random.uniform(-self.jitter_in_seconds, self.jitter_in_seconds)
+        if delay > 0:
+            sleep(delay)
+        return None
+
+    def get_fault(self) -> str:
+        """Get the fault to inject for the next request: "throttled", "error" or None."""
+        with self.lock:
+            position = self.statistics["requests"]
+            self.statistics["requests"] += 1
+            if self.burst_every > 0 and position % self.burst_every >= self.burst_every - self.burst_length:
+                self.statistics["throttled"] += 1
+                return "throttled"
+            if self.random.random() < self.error_rate:
+                self.statistics["errors"] += 1
+                return "error"
+        return None
+
+
+def main():
+
+    # Serve the corpus until interrupted, run the scraper with MARKET_DATA_BASE_URL set to the printed URL
+    server = ReplayServer(port=8765, latency_in_seconds=0.1, jitter_in_seconds=0.05, error_rate=0.01, burst_every=500, burst_length=20)
+    print(f"Replaying {server.corpus_directory} on {server.base_url} (MARKET_DATA_BASE_URL={server.base_url})")
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server.server_close()
+        print(f"Replay statistics: {server.statistics}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import json
+import os
+
+
+class ScrapeJournal:
+    """Append-only journal of scraped market data, one JSON line per postcode.
+
+    Each result is flushed and synced to disk as soon as it is appended, so an interrupted run loses at most the line being written.
+    A torn last line from an interrupted write is dropped when the journal is opened.
+
+    Usage:
+        journal = ScrapeJournal("data/journals/market_data_oslo.jsonl")
+        journal.append("0274", market_data)
+        completed = journal.load()
+    """
+
+    def __init__(self, journal_path: str) -> None:
+        self.journal_path = journal_path
+        os.makedirs(os.path.dirname(journal_path) or ".", exist_ok=True)
+        self.remove_torn_line()
+
+    def remove_torn_line(self) -> None:
+        """Truncate the journal to its last complete line."""
+        if not os.path.exists(self.journal_path):
+            return None
+        with open(self.journal_path, "rb+") as file:
+            content = file.read()
+            if content and not content.endswith(b"\n"):
+                file.truncate(content.rfind(b"\n") + 1)
+        return None
+
+    def append(self, postcode: str, market_data: tuple) -> None:
+        """Append the market data for a postcode and sync it to disk.
+
+        Args:
+            postcode (str): Postcode.
+            market_data (tuple): Market data as returned by get_market_data_from_response.
+
+        Returns:
+            None
+        """
+        line = json.dumps({"postcode": postcode, "market_data": list(market_data)})
+        with open(self.journal_path, "a") as file:
+            file.write(line + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        return None
+
+    def load(self) -> dict:
+        """Load all journaled results.
+
+        Returns:
+            dict: Market data tuples with postcodes as keys. Later lines win if a postcode is journaled more than once.
+        """
+        results = {}
+        if not os.path.exists(self.journal_path):
+            return results
+        with open(self.journal_path, "r") as file:
+            for line in file:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                results[record["postcode"]] = tuple(record["market_data"])
+        return results
+
+    def clear(self) -> None:
+        """Remove all journaled results."""
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        return None